@@ -0,0 +1,28 @@
+# Запуск: gunicorn -c gunicorn.conf.py polyclinic.wsgi
+import multiprocessing
+import os
+
+bind = os.environ.get('POLYCLINIC_BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('POLYCLINIC_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+# Перезапуск воркеров ограничивает рост памяти; новый воркер прогревается
+# в post_fork и отвечает на первый запрос так же быстро, как остальные
+max_requests = int(os.environ.get('POLYCLINIC_MAX_REQUESTS', 5000))
+max_requests_jitter = max_requests // 10
+
+# Приложение импортируется и прогревается (шаблоны, URL) один раз в
+# мастере, воркеры получают его готовым через fork. Подключения к БД в
+# мастере не открываются: их нельзя делить между процессами.
+preload_app = True
+
+
+def pre_fork(server, worker):
+    # На случай, если при загрузке приложения подключение всё же открылось
+    from django.db import connections
+
+    connections.close_all()
+
+
+def post_fork(server, worker):
+    from polyclinic_app import warmup
+
+    warmup.warm_worker()
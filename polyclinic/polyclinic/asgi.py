@@ -0,0 +1,21 @@
+"""
+ASGI config for polyclinic project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+"""
+
+import os
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault(
+    'DJANGO_SETTINGS_MODULE',
+    'polyclinic.settings')
+
+application = get_asgi_application()
+
+# Под ASGI синхронные представления выполняются в отдельном потоке, а
+# подключения Django привязаны к потоку: открытые здесь не пригодились бы.
+# Прогреваются только шаблоны и URL.
+from polyclinic_app import warmup
+
+warmup.run()
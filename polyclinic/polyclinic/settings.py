@@ -1,9 +1,15 @@
 ﻿import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 
-SECRET_KEY = 'django-insecure-your-secret-key-change-this-in-production'
+# Боевой ключ задаётся через окружение; ключ из репозитория известен всем
+SECRET_KEY = os.environ.get(
+    'POLYCLINIC_SECRET_KEY',
+    'django-insecure-your-secret-key-change-this-in-production',
+)
 
 DEBUG = True
 
@@ -27,6 +33,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'polyclinic_app.query_guard.QueryGuardMiddleware',
+    'polyclinic_app.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'polyclinic.urls'
@@ -42,6 +50,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'polyclinic_app.context_processors.operator_mode',
             ],
         },
     },
@@ -49,11 +58,11 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'polyclinic.wsgi.application'
 
-
-
-
-
-
+# Ограничения сеанса PostgreSQL (миллисекунды). Клиентское подключение
+# дополнительно работает только в транзакциях на чтение.
+DB_STATEMENT_TIMEOUT = int(os.environ.get('POLYCLINIC_STATEMENT_TIMEOUT', 60_000))
+DB_CLIENT_STATEMENT_TIMEOUT = int(os.environ.get('POLYCLINIC_CLIENT_STATEMENT_TIMEOUT', 5_000))
+DB_IDLE_IN_TRANSACTION_TIMEOUT = int(os.environ.get('POLYCLINIC_IDLE_IN_TRANSACTION_TIMEOUT', 60_000))
 
 DATABASES = {
     'default': {  # Django ORM, миграции
@@ -63,6 +72,12 @@ DATABASES = {
         'PASSWORD': 'oper123',
         'HOST': '127.0.0.1',
         'PORT': '5432',
+        'OPTIONS': {
+            'options': (
+                f'-c statement_timeout={DB_STATEMENT_TIMEOUT}'
+                f' -c idle_in_transaction_session_timeout={DB_IDLE_IN_TRANSACTION_TIMEOUT}'
+            ),
+        },
     },
     'client': {  # Только чтение
         'ENGINE': 'django.db.backends.postgresql',
@@ -71,10 +86,126 @@ DATABASES = {
         'PASSWORD': 'client123',
         'HOST': '127.0.0.1',
         'PORT': '5432',
+        'OPTIONS': {
+            'options': (
+                f'-c statement_timeout={DB_CLIENT_STATEMENT_TIMEOUT}'
+                f' -c idle_in_transaction_session_timeout={DB_IDLE_IN_TRANSACTION_TIMEOUT}'
+                ' -c default_transaction_read_only=on'
+            ),
+        },
     }
 }
 
+# Локальный режим без сервера БД: POLYCLINIC_DB_BACKEND=sqlite. Оба
+# подключения смотрят в один файл, клиентское открывает его только на
+# чтение; схему создаёт миграция 0009_sqlite_schema, данные — seed_demo.
+DB_BACKEND = os.environ.get('POLYCLINIC_DB_BACKEND', 'postgresql')
+SQLITE_PATH = os.environ.get('POLYCLINIC_SQLITE_PATH', str(BASE_DIR / 'db.sqlite3'))
+
+if DB_BACKEND == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': SQLITE_PATH,
+            'OPTIONS': {
+                # Запись берёт блокировку сразу в BEGIN: параллельные
+                # транзакции ждут друг друга, а не падают при повышении блокировки
+                'transaction_mode': 'IMMEDIATE',
+                # Ожидание блокировки файла, секунды; ограничения времени
+                # запроса в SQLite нет
+                'timeout': DB_STATEMENT_TIMEOUT / 1000,
+                'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL',
+            },
+        },
+        'client': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': f'file:{SQLITE_PATH}?mode=ro',
+            'OPTIONS': {
+                'timeout': DB_CLIENT_STATEMENT_TIMEOUT / 1000,
+            },
+            'TEST': {'MIRROR': 'default'},
+        },
+    }
+elif DB_BACKEND != 'postgresql':
+    raise ImproperlyConfigured(f'Неизвестный POLYCLINIC_DB_BACKEND: {DB_BACKEND}')
+
+# Постоянные подключения: без них каждый запрос заново подключается к БД.
+# Перед использованием подключение проверяется, разорванное открывается снова.
+DB_CONN_MAX_AGE = int(os.environ.get('POLYCLINIC_CONN_MAX_AGE', 300))
+for database in DATABASES.values():
+    database['CONN_MAX_AGE'] = DB_CONN_MAX_AGE
+    database['CONN_HEALTH_CHECKS'] = True
+
+# Прогрев воркера при запуске (polyclinic_app.warmup): шаблоны, URL,
+# подключения к БД и кэш отчёта о загрузке готовы до первого запроса.
+WARMUP_ENABLED = os.environ.get('POLYCLINIC_WARMUP', '1') == '1'
+
+# Защита от тяжёлых запросов на страницах (polyclinic_app.query_guard):
+# результат больше QUERY_ROW_CAP строк отклоняется, запросы дольше
+# SLOW_QUERY_MS попадают в журнал вместе с планом.
+QUERY_ROW_CAP = int(os.environ.get('POLYCLINIC_QUERY_ROW_CAP', 5_000))
+SLOW_QUERY_MS = int(os.environ.get('POLYCLINIC_SLOW_QUERY_MS', 500))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'polyclinic_app': {
+            'handlers': ['console'],
+            'level': os.environ.get('POLYCLINIC_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
+
+# Сессии хранятся в кэше с записью в БД (cached_db): флаг режима оператора
+# обычно читается из кэша, а выход из режима действует и для перехваченной
+# cookie. Подписанные cookie (signed_cookies) обходятся без БД совсем, но их
+# нельзя отозвать, а подделать может любой, кто знает SECRET_KEY, поэтому
+# они разрешены только с ключом из POLYCLINIC_SECRET_KEY.
+SIGNED_COOKIE_SESSIONS = 'django.contrib.sessions.backends.signed_cookies'
+SESSION_ENGINE = os.environ.get(
+    'POLYCLINIC_SESSION_ENGINE',
+    'django.contrib.sessions.backends.cached_db',
+)
+if SESSION_ENGINE == SIGNED_COOKIE_SESSIONS and 'POLYCLINIC_SECRET_KEY' not in os.environ:
+    raise ImproperlyConfigured(
+        'Сессии в подписанных cookie требуют собственного ключа в POLYCLINIC_SECRET_KEY'
+    )
+
+CACHES = {
+    'default': {
+        # locmem — кэш процесса; для общего кэша воркеров подойдёт
+        # django.core.cache.backends.filebased.FileBasedCache с каталогом в LOCATION
+        'BACKEND': os.environ.get(
+            'POLYCLINIC_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache',
+        ),
+        'LOCATION': os.environ.get('POLYCLINIC_CACHE_LOCATION', 'polyclinic'),
+    }
+}
 
+# Отправка уведомлений пациентам (manage.py dispatch_notifications).
+# Для разработки — консоль или файл; боевой бэкенд подключается путём
+# к классу с методом send_messages (см. polyclinic_app.notification_backends).
+NOTIFICATION_BACKEND = os.environ.get(
+    'POLYCLINIC_NOTIFICATION_BACKEND',
+    'polyclinic_app.notification_backends.ConsoleBackend',
+)
+NOTIFICATION_FILE_PATH = os.environ.get(
+    'POLYCLINIC_NOTIFICATION_FILE',
+    str(BASE_DIR / 'notifications.log'),
+)
+
+# Профилирование запросов по требованию (polyclinic_app.profiling): при
+# включённом PROFILING_ENABLED оператор добавляет к адресу ?_profile (или
+# заголовок X-Profile), профиль и хронология SQL сохраняются в PROFILING_DIR.
+PROFILING_ENABLED = os.environ.get('POLYCLINIC_PROFILING', '') == '1'
+PROFILING_DIR = os.environ.get('POLYCLINIC_PROFILING_DIR', str(BASE_DIR / 'profiles'))
 
 AUTH_PASSWORD_VALIDATORS = [
     {
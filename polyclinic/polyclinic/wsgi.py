@@ -27,3 +27,10 @@ os.environ.setdefault(
 # file. This includes Django's development server, if the WSGI_APPLICATION
 # setting points here.
 application = get_wsgi_application()
+
+# Прогрев кода до первого запроса (polyclinic_app.warmup). Подключения к
+# БД при импорте не открываются: их прогревает каждый воркер gunicorn в
+# post_fork (gunicorn.conf.py), остальные серверы открывают их по запросу.
+from polyclinic_app import warmup
+
+warmup.run()
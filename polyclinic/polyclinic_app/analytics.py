@@ -0,0 +1,287 @@
+from collections import defaultdict
+from datetime import date
+
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import F
+from django.utils.dateparse import parse_date
+
+from .models import CacheGeneration
+
+
+# Отчёт за период пересчитывается не чаще, чем раз в CACHE_TIMEOUT секунд
+CACHE_TIMEOUT = 15 * 60
+GENERATION = 'analytics'
+
+WEEKDAY_NAMES = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
+
+# Неделя — дата её понедельника. date_part вместо EXTRACT и date_trunc:
+# он не уходит в numeric и timestamptz, что заметно на миллионе строк.
+#
+# Свободные слоты считаются по расписанию на каждую дату периода, занятые и
+# отменённые — по сводке visit_daily_rollup; всё агрегируется в БД одним
+# запросом с GROUPING SETS сразу по врачу/неделе, врачу, специальности/неделе
+# и специальности. Строки врач/неделя возвращаются только для выбранного врача.
+LOAD_SQL = """
+    WITH week_days AS (
+        SELECT d::date - date_part('isodow', d)::int + 1 AS week,
+               date_part('isodow', d)::int AS dow
+        FROM generate_series(%(start)s::date, %(end)s::date, interval '1 day') AS d
+    ),
+    day_slots AS (
+        SELECT doctor_id,
+               day::text::int AS dow,
+               (date_part('epoch', end_time - start_time) / 1800)::int AS slots
+        FROM doc_schedule
+    ),
+    capacity AS (
+        SELECT s.doctor_id, w.week, SUM(s.slots) AS available
+        FROM day_slots s
+        JOIN week_days w ON w.dow = s.dow
+        GROUP BY 1, 2
+    ),
+    booked AS (
+        SELECT r.doctor_id,
+               r.visit_date - date_part('isodow', r.visit_date)::int + 1 AS week,
+               SUM(r.count) FILTER (WHERE r.status <> 'cancelled') AS booked,
+               SUM(r.count) FILTER (WHERE r.status = 'cancelled') AS cancelled
+        FROM visit_daily_rollup r
+        WHERE r.visit_date BETWEEN %(start)s AND %(end)s
+        GROUP BY 1, 2
+    ),
+    load AS (
+        SELECT COALESCE(c.doctor_id, b.doctor_id) AS doctor_id,
+               COALESCE(c.week, b.week) AS week,
+               COALESCE(c.available, 0) AS available,
+               COALESCE(b.booked, 0) AS booked,
+               COALESCE(b.cancelled, 0) AS cancelled
+        FROM capacity c
+        FULL JOIN booked b ON b.doctor_id = c.doctor_id AND b.week = c.week
+    )
+    SELECT GROUPING(l.doctor_id) AS by_spec,
+           GROUPING(l.week) AS whole_period,
+           l.doctor_id,
+           CASE WHEN GROUPING(l.doctor_id) = 0 THEN MAX(d.lname || ' ' || d.fname) END AS doctor_name,
+           d.spec_id,
+           MAX(s.name) AS spec_name,
+           l.week,
+           SUM(l.available)::int,
+           SUM(l.booked)::int,
+           SUM(l.cancelled)::int
+    FROM load l
+    JOIN doctors d ON d.id = l.doctor_id
+    JOIN spec s ON s.id = d.spec_id
+    GROUP BY GROUPING SETS (
+        (d.spec_id, l.doctor_id, l.week),
+        (d.spec_id, l.doctor_id),
+        (d.spec_id, l.week),
+        (d.spec_id)
+    )
+    HAVING GROUPING(l.doctor_id, l.week) <> 0 OR l.doctor_id = %(doctor)s
+    ORDER BY spec_name, doctor_name, l.week
+"""
+
+# (GROUPING(doctor_id), GROUPING(week)) -> раздел результата
+SECTIONS = {
+    (0, 0): 'doctor_weeks',
+    (0, 1): 'doctors',
+    (1, 0): 'spec_weeks',
+    (1, 1): 'specs',
+}
+
+HEATMAP_SQL = """
+    SELECT date_part('isodow', visit_date)::int, date_part('hour', visit_time)::int, COUNT(*)
+    FROM visits
+    WHERE visit_date BETWEEN %(start)s AND %(end)s
+      AND status <> 'cancelled'
+    GROUP BY 1, 2
+"""
+
+# SQLite: нет GROUPING SETS и generate_series. Запрос возвращает строки
+# врач/неделя, разделы отчёта собираются из них в _group_load.
+# День недели ISO — (%w + 6) %% 7 + 1, понедельник недели — дата минус
+# (день - 1) дней; %% — экранирование для подстановки параметров.
+SQLITE_ISO_DAY = "(CAST(strftime('%%w', {0}) AS integer) + 6) %% 7 + 1"
+SQLITE_WEEK = "date({0}, '-' || ((CAST(strftime('%%w', {0}) AS integer) + 6) %% 7) || ' days')"
+
+LOAD_SQLITE_SQL = f"""
+    WITH RECURSIVE days(d) AS (
+        SELECT date(%(start)s)
+        UNION ALL
+        SELECT date(d, '+1 day') FROM days WHERE d < date(%(end)s)
+    ),
+    week_days AS (
+        SELECT {SQLITE_WEEK.format('d')} AS week,
+               {SQLITE_ISO_DAY.format('d')} AS dow
+        FROM days
+    ),
+    day_slots AS (
+        SELECT doctor_id,
+               CAST(day AS integer) AS dow,
+               CAST(round((julianday(end_time) - julianday(start_time)) * 48) AS integer) AS slots
+        FROM doc_schedule
+    ),
+    capacity AS (
+        SELECT s.doctor_id, w.week, SUM(s.slots) AS available
+        FROM day_slots s
+        JOIN week_days w ON w.dow = s.dow
+        GROUP BY 1, 2
+    ),
+    booked AS (
+        SELECT r.doctor_id,
+               {SQLITE_WEEK.format('r.visit_date')} AS week,
+               SUM(r.count) FILTER (WHERE r.status <> 'cancelled') AS booked,
+               SUM(r.count) FILTER (WHERE r.status = 'cancelled') AS cancelled
+        FROM visit_daily_rollup r
+        WHERE r.visit_date BETWEEN %(start)s AND %(end)s
+        GROUP BY 1, 2
+    ),
+    load AS (
+        SELECT COALESCE(c.doctor_id, b.doctor_id) AS doctor_id,
+               COALESCE(c.week, b.week) AS week,
+               COALESCE(c.available, 0) AS available,
+               COALESCE(b.booked, 0) AS booked,
+               COALESCE(b.cancelled, 0) AS cancelled
+        FROM capacity c
+        FULL JOIN booked b ON b.doctor_id = c.doctor_id AND b.week = c.week
+    )
+    SELECT l.doctor_id, d.lname || ' ' || d.fname, d.spec_id, s.name,
+           l.week, l.available, l.booked, l.cancelled
+    FROM load l
+    JOIN doctors d ON d.id = l.doctor_id
+    JOIN spec s ON s.id = d.spec_id
+"""
+
+HEATMAP_SQLITE_SQL = f"""
+    SELECT {SQLITE_ISO_DAY.format('visit_date')}, CAST(strftime('%%H', visit_time) AS integer), COUNT(*)
+    FROM visits
+    WHERE visit_date BETWEEN %(start)s AND %(end)s
+      AND status <> 'cancelled'
+    GROUP BY 1, 2
+"""
+
+
+def clinic_load(start, end, doctor_id=None):
+    """Загрузка клиники за период [start, end]; результат кэшируется по периоду.
+
+    Возвращает словарь:
+      doctors, doctor_weeks, specs, spec_weeks — списки строк загрузки
+      (слоты по расписанию, занятые, отменённые, доля занятых и отмен),
+      doctor_weeks — только для врача doctor_id;
+      heatmap — число визитов по дням недели и часам.
+    """
+    key = f'analytics:{_generation()}:{start.isoformat()}:{end.isoformat()}:{doctor_id}'
+    return cache.get_or_set(key, lambda: _compute_clinic_load(start, end, doctor_id), CACHE_TIMEOUT)
+
+
+def invalidate():
+    """Сбрасывает все закэшированные отчёты (например, после правки расписания).
+
+    Поколение увеличивается в текущей транзакции: новые ключи отчётов
+    все воркеры начнут использовать вместе с её фиксацией.
+    """
+    updated = CacheGeneration.objects.filter(name=GENERATION).update(value=F('value') + 1)
+    if not updated:
+        CacheGeneration.objects.get_or_create(name=GENERATION, defaults={'value': 1})
+
+
+def _generation():
+    return CacheGeneration.objects.filter(name=GENERATION).values_list('value', flat=True).first() or 0
+
+
+def _ratio(part, whole):
+    return round(part / whole, 3) if whole else None
+
+
+def _load_row(doctor_id, doctor_name, spec_id, spec_name, week, available, booked, cancelled):
+    return {
+        'doctor_id': doctor_id,
+        'doctor_name': doctor_name,
+        'spec_id': spec_id,
+        'spec_name': spec_name,
+        'week': week,
+        'available': available,
+        'booked': booked,
+        'cancelled': cancelled,
+        'utilisation': _ratio(booked, available),
+        'cancel_rate': _ratio(cancelled, booked + cancelled),
+    }
+
+
+def _compute_clinic_load(start, end, doctor_id):
+    params = {'start': start, 'end': end, 'doctor': doctor_id}
+    result = {'doctors': [], 'doctor_weeks': [], 'specs': [], 'spec_weeks': []}
+
+    connection = connections['client']
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(LOAD_SQLITE_SQL, params)
+            for section, rows in _group_load(cursor.fetchall(), doctor_id).items():
+                result[section] = [_load_row(*row) for row in rows]
+            cursor.execute(HEATMAP_SQLITE_SQL, params)
+        else:
+            cursor.execute(LOAD_SQL, params)
+            for by_spec, whole_period, *row in cursor.fetchall():
+                result[SECTIONS[by_spec, whole_period]].append(_load_row(*row))
+            cursor.execute(HEATMAP_SQL, params)
+        cells = cursor.fetchall()
+
+    result['heatmap'] = _heatmap(cells)
+    return result
+
+
+def _group_load(rows, doctor_id):
+    """Разделы отчёта из строк врач/неделя — то, что в PostgreSQL делают GROUPING SETS"""
+    totals = {section: defaultdict(lambda: [0, 0, 0]) for section in SECTIONS.values()}
+    names = {}
+    for row_doctor, doctor_name, spec_id, spec_name, week, *counts in rows:
+        week = parse_date(week)
+        names[row_doctor] = doctor_name
+        names[None, spec_id] = spec_name
+        keys = {
+            'doctor_weeks': (spec_id, row_doctor, week),
+            'doctors': (spec_id, row_doctor, None),
+            'spec_weeks': (spec_id, None, week),
+            'specs': (spec_id, None, None),
+        }
+        for section, key in keys.items():
+            if section == 'doctor_weeks' and row_doctor != doctor_id:
+                continue
+            for i, count in enumerate(counts):
+                totals[section][key][i] += count
+
+    grouped = {}
+    for section, groups in totals.items():
+        rows = [
+            (row_doctor, names.get(row_doctor), spec_id, names[None, spec_id], week, *counts)
+            for (spec_id, row_doctor, week), counts in groups.items()
+        ]
+        # Порядок LOAD_SQL: специальность, врач, неделя
+        rows.sort(key=lambda row: (row[3], row[1] or '', row[4] or date.min))
+        grouped[section] = rows
+    return grouped
+
+
+def _heatmap(cells):
+    """Сетка «день недели × час»: строки по дням, столбцы по рабочим часам"""
+    if not cells:
+        return {'hours': [], 'rows': []}
+
+    hours = list(range(min(c[1] for c in cells), max(c[1] for c in cells) + 1))
+    counts = {(day, hour): count for day, hour, count in cells}
+    peak = max(counts.values())
+
+    rows = []
+    for day, name in enumerate(WEEKDAY_NAMES, start=1):
+        rows.append({
+            'day': name,
+            'cells': [
+                {
+                    'count': counts.get((day, hour), 0),
+                    # Строкой, чтобы локализация не подставила запятую в CSS
+                    'alpha': f'{counts.get((day, hour), 0) / peak:.2f}',
+                }
+                for hour in hours
+            ],
+        })
+    return {'hours': hours, 'rows': rows}
@@ -0,0 +1,119 @@
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+
+from . import notifications
+from .models import Visit
+
+
+SLOT_TAKEN_MESSAGE = 'Это время у врача уже занято. Выберите другой слот.'
+STALE_VISIT_MESSAGE = (
+    'Визит был изменён или удалён другим оператором. '
+    'Обновите страницу и повторите правку.'
+)
+
+# Уникальный ключ слота (doctor_id, visit_date, visit_time) в bd_project.sql
+# и SQLSTATE unique_violation; прочие нарушения целостности — не конфликт слота
+SLOT_CONSTRAINT = 'visits_doctor_id_visit_date_visit_time_key'
+UNIQUE_VIOLATION = '23505'
+SQLITE_SLOT_ERROR = 'UNIQUE constraint failed: visits.doctor_id, visits.visit_date, visits.visit_time'
+
+
+class SlotTaken(Exception):
+    """Слот врача (дата + время) уже занят другим визитом"""
+
+
+class StaleVisit(Exception):
+    """Визит изменили или удалили после того, как оператор открыл форму"""
+
+
+def _is_slot_conflict(exc):
+    """IntegrityError от уникального ключа слота, а не от внешнего ключа или CHECK"""
+    if connection.vendor == 'sqlite':
+        return str(exc).startswith(SQLITE_SLOT_ERROR)
+    # Код ошибки драйвера: sqlstate в psycopg 3, pgcode в psycopg2
+    cause = exc.__cause__
+    sqlstate = getattr(cause, 'sqlstate', None) or getattr(cause, 'pgcode', None)
+    constraint = getattr(getattr(cause, 'diag', None), 'constraint_name', None)
+    return sqlstate == UNIQUE_VIOLATION and constraint == SLOT_CONSTRAINT
+
+
+def book_visit(visit):
+    """Атомарно занимает слот врача под новый визит.
+
+    Вставка идёт одним INSERT ... ON CONFLICT DO NOTHING по уникальному
+    ключу (doctor_id, visit_date, visit_time): если параллельный запрос
+    занял слот раньше, строка не вставится и будет поднят SlotTaken.
+    Подтверждение и напоминание пациенту пишутся в той же транзакции.
+    """
+    visit.sync_visit_day()
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO visits (
+                patient_id, doctor_id, visit_day, visit_date,
+                visit_time, diagnos_id, status
+            )
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (doctor_id, visit_date, visit_time) DO NOTHING
+            RETURNING id, created, version
+        """, [
+            visit.patient_id,
+            visit.doctor_id,
+            visit.visit_day,
+            connection.ops.adapt_datefield_value(visit.visit_date),
+            # у sqlite3 нет адаптера для time
+            connection.ops.adapt_timefield_value(visit.visit_time),
+            visit.diagnos_id,
+            visit.status,
+        ])
+        row = cursor.fetchone()
+        if row is None:
+            raise SlotTaken(SLOT_TAKEN_MESSAGE)
+
+        visit.id, created, visit.version = row
+        # SQLite возвращает created строкой
+        visit.created = Visit._meta.get_field('created').to_python(created)
+        notifications.visit_booked(visit)
+    return visit
+
+
+def update_visit(visit, expected_version):
+    """Сохраняет правку визита, если его версия не изменилась с момента чтения.
+
+    UPDATE выполняется с условием version = expected_version и сам
+    увеличивает версию, поэтому из двух одновременных правок пройдёт
+    только одна, а вторая получит StaleVisit вместо молчаливой перезаписи.
+    Перенос на занятый слот поднимает SlotTaken, другие нарушения
+    целостности (например, удалённые врач или пациент) — как есть.
+    Уведомления о переносе или отмене пишутся в той же транзакции.
+    """
+    visit.sync_visit_day()
+    try:
+        with transaction.atomic():
+            old = Visit.objects.filter(pk=visit.pk, version=expected_version).first()
+            if old is None:
+                raise StaleVisit(STALE_VISIT_MESSAGE)
+
+            updated = Visit.objects.filter(
+                pk=visit.pk,
+                version=expected_version,
+            ).update(
+                patient=visit.patient_id,
+                doctor=visit.doctor_id,
+                visit_day=visit.visit_day,
+                visit_date=visit.visit_date,
+                visit_time=visit.visit_time,
+                diagnos=visit.diagnos_id,
+                status=visit.status,
+                version=F('version') + 1,
+            )
+            if not updated:
+                raise StaleVisit(STALE_VISIT_MESSAGE)
+
+            notifications.visit_changed(old, visit)
+    except IntegrityError as exc:
+        if not _is_slot_conflict(exc):
+            raise
+        raise SlotTaken(SLOT_TAKEN_MESSAGE) from exc
+
+    visit.version = expected_version + 1
+    return visit
@@ -0,0 +1,6 @@
+from .views import is_operator
+
+
+def operator_mode(request):
+    """Флаг режима оператора для шапки сайта на всех страницах"""
+    return {'is_operator': is_operator(request)}
@@ -1,11 +1,26 @@
 ﻿from django import forms
-from .models import Patient, Doctor, Diagnosis, Visit
+from django.core.exceptions import ValidationError
+
+from .models import Patient, Doctor, Diagnosis, Visit, WeekDay
+from .rows import PATIENT_CHOICES_LIMIT, patient_choices
+from .schedules import clean_template
+
+WEEKDAY_LABELS = {
+    '1': 'Понедельник',
+    '2': 'Вторник',
+    '3': 'Среда',
+    '4': 'Четверг',
+    '5': 'Пятница',
+    '6': 'Суббота',
+    '7': 'Воскресенье',
+}
 
 class VisitForm(forms.Form):
     """Форма для создания/редактирования визита через ORM"""
     patient = forms.ModelChoiceField(
         label="Пациент",
-        queryset=Patient.objects.all().order_by('lname', 'fname'),
+        queryset=Patient.objects.all(),
+        help_text=f"В списке не больше {PATIENT_CHOICES_LIMIT} пациентов; остальных найдите по фамилии или ID.",
         widget=forms.Select(attrs={'class': 'form-control'})
     )
     
@@ -25,12 +40,6 @@ class VisitForm(forms.Form):
         widget=forms.TimeInput(attrs={'type': 'time', 'class': 'form-control'})
     )
     
-    visit_day = forms.ChoiceField(
-        label="День недели", 
-        choices=Visit._meta.get_field('visit_day').choices,
-        widget=forms.Select(attrs={'class': 'form-control'})
-    )
-    
     diagnos = forms.ModelChoiceField(
         label="Диагноз",
         queryset=Diagnosis.objects.all().order_by('name'),
@@ -43,4 +52,94 @@ class VisitForm(forms.Form):
         label="Статус", 
         choices=Visit._meta.get_field('status').choices,
         widget=forms.Select(attrs={'class': 'form-control'})
-    )
\ No newline at end of file
+    )
+
+    def __init__(self, *args, patient_query='', **kwargs):
+        super().__init__(*args, **kwargs)
+        # Выбранный пациент проверяется запросом по ключу, а в список
+        # попадают только найденные по patient_query (см. patient_choices)
+        patient = self.fields['patient']
+        selected = str(patient.prepare_value(self['patient'].value()) or '')
+        patient.widget.choices = [
+            ('', patient.empty_label),
+            *patient_choices(patient_query, int(selected) if selected.isdigit() else None),
+        ]
+
+
+class VisitEditForm(VisitForm):
+    """Форма правки визита с версией, которую видел оператор"""
+    # Версия визита на момент открытия формы (оптимистическая блокировка);
+    # без неё правка молча перезаписала бы параллельные изменения
+    version = forms.IntegerField(widget=forms.HiddenInput())
+
+    def clean(self):
+        cleaned_data = super().clean()
+        # Ошибки скрытых полей шаблон не показывает — выносим в общие
+        if 'version' in self.errors:
+            raise ValidationError('Не передана версия визита: откройте форму правки заново.')
+        return cleaned_data
+
+class ScheduleTemplateForm(forms.Form):
+    """Недельный шаблон расписания для одного или нескольких врачей.
+
+    Для каждого дня — поля start_<день> и end_<день>; день без часов выходной.
+    """
+    doctors = forms.ModelMultipleChoiceField(
+        label="Врачи",
+        queryset=Doctor.objects.select_related('spec').order_by('lname', 'fname'),
+        widget=forms.SelectMultiple(attrs={'class': 'form-select', 'size': 10})
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for day in WeekDay.values:
+            for part in ('start', 'end'):
+                self.fields[f'{part}_{day}'] = forms.TimeField(
+                    required=False,
+                    widget=forms.TimeInput(
+                        format='%H:%M',
+                        attrs={'type': 'time', 'step': 1800, 'class': 'form-control'},
+                    ),
+                )
+
+    def days(self):
+        """Пары полей (название дня, начало, конец) для шаблона"""
+        return [
+            (WEEKDAY_LABELS[day], self[f'start_{day}'], self[f'end_{day}'])
+            for day in WeekDay.values
+        ]
+
+    def clean(self):
+        cleaned_data = super().clean()
+        days = {}
+        for day in WeekDay.values:
+            start, end = cleaned_data.get(f'start_{day}'), cleaned_data.get(f'end_{day}')
+            if start or end:
+                days[day] = {'start': start, 'end': end}
+
+        try:
+            cleaned_data['template'] = clean_template(days)
+        except ValidationError as exc:
+            for day, errors in exc.message_dict.items():
+                self.add_error(f'start_{day}', errors)
+        return cleaned_data
+
+
+class CancelDoctorVisitsForm(forms.Form):
+    """Врач и период для массовой отмены его визитов"""
+    doctor_id = forms.ModelChoiceField(queryset=Doctor.objects.all())
+    start_date = forms.DateField()
+    end_date = forms.DateField()
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start, end = cleaned_data.get('start_date'), cleaned_data.get('end_date')
+        if start and end and start > end:
+            raise ValidationError('Начало периода позже его конца.')
+        return cleaned_data
+
+
+class ClinicLoadForm(forms.Form):
+    """Период отчёта о загрузке; пустые даты заменяет представление"""
+    start = forms.DateField(required=False)
+    end = forms.DateField(required=False)
@@ -0,0 +1,170 @@
+import logging
+import threading
+import traceback
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from django.db import DatabaseError, connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job, JobStatus, Patient, Visit
+from .notifications import cancel_visits
+
+
+logger = logging.getLogger(__name__)
+
+# Пауза перед повтором удваивается с каждой неудачной попыткой
+RETRY_DELAY = timedelta(seconds=30)
+# Задача в статусе running принадлежит воркеру до locked_until. Пока
+# обработчик работает, воркер продлевает срок каждые HEARTBEAT_EVERY;
+# задачу, срок которой истёк, бросил упавший воркер, и её забирает другой.
+LEASE = timedelta(minutes=2)
+HEARTBEAT_EVERY = timedelta(seconds=30)
+
+HANDLERS = {}
+
+
+def job(name):
+    """Регистрирует функцию как обработчик задач с именем name"""
+    def decorator(func):
+        HANDLERS[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, **payload):
+    """Ставит задачу в очередь и сразу возвращает её (без выполнения)"""
+    if name not in HANDLERS:
+        raise ValueError(f"Неизвестная задача: {name}")
+    return Job.objects.create(name=name, payload=payload)
+
+
+def claim_next():
+    """Забирает из очереди одну готовую к запуску задачу или возвращает None.
+
+    SELECT ... FOR UPDATE SKIP LOCKED позволяет нескольким потокам и
+    процессам runworker разбирать очередь, не получая одну задачу дважды.
+    Брошенная задача забирается снова, только пока у неё остались попытки;
+    если воркер погиб на последней (OOM, SIGKILL), задача завершается ошибкой.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        abandoned = Job.objects.filter(status=JobStatus.RUNNING, locked_until__lt=now)
+        exhausted = list(
+            abandoned.select_for_update(skip_locked=True)
+            .filter(attempts__gte=F('max_attempts'))
+            .values_list('id', flat=True)
+        )
+        if exhausted:
+            Job.objects.filter(id__in=exhausted).update(
+                status=JobStatus.FAILED,
+                error='Воркер не завершил последнюю попытку: срок владения истёк',
+                finished=now,
+            )
+
+        job = Job.objects.select_for_update(skip_locked=True).filter(
+            Q(status=JobStatus.QUEUED, run_after__lte=now)
+            | Q(status=JobStatus.RUNNING, locked_until__lt=now, attempts__lt=F('max_attempts'))
+        ).order_by('run_after', 'id').first()
+
+        if job is None:
+            return None
+
+        job.status = JobStatus.RUNNING
+        job.attempts += 1
+        job.started = now
+        job.locked_until = now + LEASE
+        job.save(update_fields=['status', 'attempts', 'started', 'locked_until'])
+    return job
+
+
+@contextmanager
+def heartbeat(job):
+    """Продлевает срок владения задачей, пока выполняется блок with.
+
+    Продление идёт из отдельного потока со своим подключением к БД и
+    только для той попытки, которую забрал этот воркер.
+    """
+    stopped = threading.Event()
+
+    def beat():
+        try:
+            while not stopped.wait(HEARTBEAT_EVERY.total_seconds()):
+                try:
+                    Job.objects.filter(
+                        pk=job.pk, status=JobStatus.RUNNING, attempts=job.attempts,
+                    ).update(locked_until=timezone.now() + LEASE)
+                except DatabaseError:
+                    # Сбой одного продления не останавливает следующие:
+                    # подключение закрывается и откроется заново
+                    logger.exception("Не удалось продлить задачу #%s", job.id)
+                    connections.close_all()
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=beat, name=f'job-{job.id}-heartbeat', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def run_job(job):
+    """Выполняет задачу и сохраняет результат; при ошибке планирует повтор"""
+    handler = HANDLERS.get(job.name)
+    try:
+        if handler is None:
+            raise LookupError(f"Нет обработчика для задачи {job.name}")
+        with heartbeat(job):
+            result = handler(**job.payload)
+    except Exception:
+        logger.exception("Задача #%s (%s) завершилась ошибкой", job.id, job.name)
+        job.error = traceback.format_exc()
+        if handler is not None and job.attempts < job.max_attempts:
+            job.status = JobStatus.QUEUED
+            job.run_after = timezone.now() + RETRY_DELAY * 2 ** (job.attempts - 1)
+        else:
+            job.status = JobStatus.FAILED
+    else:
+        job.status = JobStatus.DONE
+        job.result = result
+        job.error = ''
+
+    # Сохраняется, только если задача всё ещё за этой попыткой: после
+    # истечения срока её мог забрать другой воркер
+    job.finished = timezone.now()
+    saved = Job.objects.filter(pk=job.pk, attempts=job.attempts, status=JobStatus.RUNNING).update(
+        status=job.status,
+        result=job.result,
+        error=job.error,
+        run_after=job.run_after,
+        finished=job.finished,
+    )
+    if not saved:
+        logger.warning("Задача #%s: попытка %s потеряла владение, результат не сохранён",
+                       job.id, job.attempts)
+    return job
+
+
+# =========================
+# ОБРАБОТЧИКИ
+# =========================
+
+@job('cancel_patient_appointments')
+def cancel_patient_appointments(patient_id):
+    patient = Patient.objects.get(pk=patient_id)
+    count = cancel_visits(Visit.objects.filter(patient=patient))
+    return {'cancelled': count, 'patient': str(patient)}
+
+
+@job('cancel_doctor_appointments')
+def cancel_doctor_appointments(doctor_id, start_date, end_date):
+    count = cancel_visits(Visit.objects.filter(
+        doctor_id=doctor_id,
+        visit_date__range=(date.fromisoformat(start_date), date.fromisoformat(end_date)),
+    ))
+    return {'cancelled': count, 'doctor_id': doctor_id}
+
@@ -0,0 +1,306 @@
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from polyclinic_app import analytics, reports
+from polyclinic_app.models import Doctor, Patient, Visit
+from polyclinic_app.rows import doctor_rows, patient_rows, visit_rows
+
+
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+
+# Страницы только для чтения, на которых проверяется режим оператора
+READ_ONLY_PAGES = ['home', 'doctor_list', 'patient_list', 'visit_list', 'schedule_list']
+
+# Прежняя сборка строк списков: экземпляры моделей через select_related
+# и копирование полей в списки; сравнивается с polyclinic_app.rows
+
+
+def legacy_visit_rows(limit):
+    visits = Visit.objects.select_related('patient', 'doctor', 'diagnos').order_by(
+        '-visit_date', '-visit_time')[:limit]
+    return [
+        [
+            visit.id,
+            f"{visit.patient.lname} {visit.patient.fname}",
+            f"{visit.doctor.lname} {visit.doctor.fname}",
+            visit.visit_date,
+            visit.visit_time.strftime("%H:%M"),
+            visit.diagnos.name if visit.diagnos else "Не указан",
+            visit.status,
+        ]
+        for visit in visits
+    ]
+
+
+def legacy_doctor_rows(limit):
+    return [
+        [
+            doctor.id, doctor.fname, doctor.lname,
+            doctor.spec.name if doctor.spec else "—",
+            doctor.phone or "—",
+            doctor.is_available,
+        ]
+        for doctor in Doctor.objects.select_related('spec').order_by('id')[:limit]
+    ]
+
+
+def legacy_patient_rows(limit):
+    return [
+        [
+            patient.id, patient.fname, patient.lname, patient.birth_date,
+            patient.gender, patient.phone or "—", patient.registered,
+        ]
+        for patient in Patient.objects.order_by('id')[:limit]
+    ]
+
+
+# Меньше строк — замер rows не пересчитывает на 100 тыс.
+MIN_SCALED_ROWS = 1_000
+
+ROW_BUILDERS = [
+    ('visits', legacy_visit_rows, lambda limit: list(visit_rows()[:limit])),
+    ('doctors', legacy_doctor_rows, lambda limit: list(doctor_rows()[:limit])),
+    ('patients', legacy_patient_rows, lambda limit: list(patient_rows()[:limit])),
+]
+
+
+# Запросы отчётов без кэша и представлений: одинаковая работа для обеих СУБД
+REPORT_QUERIES = [
+    ('doctor_stats', reports.doctor_stats_rows),
+    ('visits_on', lambda: reports.visits_on(timezone.localdate())),
+    ('clinic_load', lambda: analytics._compute_clinic_load(
+        timezone.localdate() - timedelta(weeks=12), timezone.localdate(), None)),
+]
+
+BACKENDS = ('postgresql', 'sqlite')
+
+# Холодный старт в отдельном процессе: загрузка WSGI-приложения (вместе с
+# прогревом, если он включён), первый запрос к каждой странице и медиана
+# следующих. Печатает JSON: {"load": мс, "pages": {адрес: [первый, медиана]}}.
+COLD_START_SCRIPT = """
+import json, os, statistics, sys, time
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'polyclinic.settings')
+started = time.perf_counter()
+from polyclinic.wsgi import application
+# Как воркер gunicorn: подключения прогреваются в post_fork
+from polyclinic_app import warmup
+warmup.warm_worker()
+load = time.perf_counter() - started
+from django.test import Client
+client = Client(HTTP_HOST='localhost')
+repeat, urls = int(sys.argv[1]), sys.argv[2:]
+pages = {}
+for url in urls:
+    started = time.perf_counter()
+    client.get(url)
+    first = time.perf_counter() - started
+    steady = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        client.get(url)
+        steady.append(time.perf_counter() - started)
+    pages[url] = [first * 1000, statistics.median(steady) * 1000]
+print(json.dumps({'load': load * 1000, 'pages': pages}))
+"""
+
+# Импорт приложения целиком, без подключения к БД
+IMPORT_SCRIPT = """
+import os
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'polyclinic.settings')
+import polyclinic.wsgi
+"""
+
+STARTUP_PAGES = ['home', 'doctor_list', 'visit_list', 'report_clinic_load']
+
+
+class Command(BaseCommand):
+    help = 'Замеры производительности приложения на текущей базе.'
+
+    suites = ('sessions', 'rows', 'pages', 'backends', 'startup')
+    # backends и startup запускают отдельные процессы, по умолчанию они не выполняются
+    default_suites = ('sessions', 'rows', 'pages')
+
+    def add_arguments(self, parser):
+        parser.add_argument('suite', nargs='*',
+                            help=f"Какие замеры выполнить: {', '.join(self.suites)} "
+                                 f"(по умолчанию {', '.join(self.default_suites)})")
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Сколько раз повторять каждый замер')
+        parser.add_argument('--rows', type=int, default=100_000,
+                            help='Строк списка в замере rows (по умолчанию 100000)')
+        parser.add_argument('--compare', nargs='+', default=['pages', 'rows'],
+                            choices=self.default_suites,
+                            help='Замеры, которые backends выполняет на каждой СУБД (по умолчанию pages rows)')
+        parser.add_argument('--top', type=int, default=15,
+                            help='Сколько самых долгих импортов показать в замере startup')
+
+    def handle(self, *args, **options):
+        unknown = set(options['suite']) - set(self.suites)
+        if unknown:
+            raise CommandError(f"Неизвестные замеры: {', '.join(sorted(unknown))}")
+
+        self.stdout.write(f'СУБД: {connection.vendor}')
+        for suite in options['suite'] or self.default_suites:
+            self.stdout.write(self.style.MIGRATE_HEADING(f'== {suite}'))
+            getattr(self, f'bench_{suite}')(options)
+
+    def bench_sessions(self, options):
+        """Запросов к БД на страницу в режиме оператора для разных хранилищ сессий"""
+        repeat = options['repeat']
+        self.stdout.write(f"{'хранилище':<16}{'страница':<16}{'запросов':>10}{'django_session':>16}{'мс':>10}")
+
+        for label, engine in SESSION_ENGINES.items():
+            with override_settings(SESSION_ENGINE=engine):
+                client = Client(HTTP_HOST='localhost')
+                client.post(reverse('enter_operator'), {'password': '123'})
+                client.get(reverse('home'))  # прогрев кэша сессии
+
+                for page in READ_ONLY_PAGES:
+                    url = reverse(page)
+                    with CaptureQueriesContext(connection) as ctx:
+                        started = time.perf_counter()
+                        for _ in range(repeat):
+                            client.get(url)
+                        elapsed = time.perf_counter() - started
+
+                    session_queries = sum('django_session' in q['sql'] for q in ctx.captured_queries)
+                    self.stdout.write(
+                        f'{label:<16}{page:<16}{len(ctx) / repeat:>10.1f}'
+                        f'{session_queries / repeat:>16.1f}{elapsed / repeat * 1000:>10.1f}'
+                    )
+
+    def bench_rows(self, options):
+        """Память и время процессора на 100 тыс. строк списков: модели против values_list"""
+        limit = options['rows']
+        self.stdout.write(
+            f"{'список':<12}{'способ':<14}{'строк':>10}{'CPU, мс':>10}{'пик, МБ':>10}"
+            f"{'CPU/100k':>12}{'МБ/100k':>10}"
+        )
+        for name, legacy, fast in ROW_BUILDERS:
+            for label, build in (('модели', legacy), ('values_list', fast)):
+                count, cpu, peak = self._measure_rows(build, limit)
+                line = f'{name:<12}{label:<14}{count:>10}{cpu * 1000:>10.0f}{peak / 2**20:>10.1f}'
+                # На коротких списках пересчёт на 100 тыс. строк показал бы
+                # постоянные издержки запроса, а не стоимость строки
+                if count >= MIN_SCALED_ROWS:
+                    scale = 100_000 / count
+                    line += f'{cpu * scale * 1000:>12.0f}{peak * scale / 2**20:>10.1f}'
+                self.stdout.write(line)
+
+    def bench_pages(self, options):
+        """Время страниц только для чтения и запросов отчётов на текущей СУБД"""
+        repeat = options['repeat']
+        client = Client(HTTP_HOST='localhost')
+        client.post(reverse('enter_operator'), {'password': '123'})
+
+        self.stdout.write(f"{'страница':<22}{'запросов':>10}{'мс':>10}")
+        for page in READ_ONLY_PAGES + ['report_next_visits']:
+            url = reverse(page)
+            client.get(url)  # прогрев
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                for _ in range(repeat):
+                    client.get(url)
+                elapsed = time.perf_counter() - started
+            self.stdout.write(f'{page:<22}{len(ctx) / repeat:>10.1f}{elapsed / repeat * 1000:>10.1f}')
+
+        self.stdout.write(f"{'отчёт':<22}{'строк':>10}{'мс':>10}")
+        for name, query in REPORT_QUERIES:
+            query()
+            started = time.perf_counter()
+            for _ in range(repeat):
+                result = query()
+            elapsed = time.perf_counter() - started
+            # Число визитов для visits_on, иначе число строк (врачей для clinic_load)
+            if isinstance(result, dict):
+                result = result['doctors']
+            count = result if isinstance(result, int) else len(result)
+            self.stdout.write(f'{name:<22}{count:>10}{elapsed / repeat * 1000:>10.1f}')
+
+    def bench_backends(self, options):
+        """Те же замеры на PostgreSQL и на SQLite, каждый в отдельном процессе.
+
+        Файл SQLite берётся из POLYCLINIC_SQLITE_PATH; его нужно заранее
+        подготовить: migrate и seed_demo с тем же окружением.
+        """
+        command = [
+            sys.executable, str(settings.BASE_DIR / 'manage.py'), 'benchmark', *options['compare'],
+            '--repeat', str(options['repeat']), '--rows', str(options['rows']),
+        ]
+        for backend in BACKENDS:
+            self.stdout.write(self.style.MIGRATE_LABEL(f'-- {backend}'))
+            env = {**os.environ, 'POLYCLINIC_DB_BACKEND': backend}
+            result = subprocess.run(command, env=env, capture_output=True, text=True)
+            self.stdout.write(result.stdout.rstrip())
+            if result.returncode:
+                self.stderr.write(result.stderr.rstrip())
+                raise CommandError(f'Замер на {backend} завершился с ошибкой')
+
+    def bench_startup(self, options):
+        """Время импорта и первого запроса нового процесса с прогревом и без"""
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'polyclinic.settings',
+               'POLYCLINIC_WARMUP': '1'}
+        result = self._run_python(['-X', 'importtime', '-c', IMPORT_SCRIPT], env)
+        imports = {}
+        for line in result.stderr.splitlines():
+            # import time: self [us] | cumulative | imported package
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, name = line[len('import time:'):].split('|')
+            imports[name.strip()] = int(cumulative) / 1000
+        total = imports.pop('polyclinic.wsgi')
+        self.stdout.write(f'Импорт polyclinic.wsgi: {total:.0f} мс, дольше всего (вместе с вложенными):')
+        for name, ms in sorted(imports.items(), key=lambda item: -item[1])[:options['top']]:
+            self.stdout.write(f'{ms:>10.1f}  {name}')
+
+        urls = [reverse(page) for page in STARTUP_PAGES]
+        self.stdout.write(f"{'прогрев':<10}{'страница':<24}{'загрузка, мс':>14}{'первый, мс':>12}{'далее, мс':>12}")
+        for warmup in ('0', '1'):
+            env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'polyclinic.settings', 'POLYCLINIC_WARMUP': warmup}
+            result = self._run_python(['-c', COLD_START_SCRIPT, str(options['repeat']), *urls], env)
+            report = json.loads(result.stdout.splitlines()[-1])
+            label = 'да' if warmup == '1' else 'нет'
+            for url, (first, steady) in report['pages'].items():
+                self.stdout.write(f"{label:<10}{url:<24}{report['load']:>14.0f}{first:>12.1f}{steady:>12.1f}")
+
+    @staticmethod
+    def _run_python(args, env):
+        result = subprocess.run([sys.executable, *args], env=env, cwd=settings.BASE_DIR,
+                                capture_output=True, text=True)
+        if result.returncode:
+            raise CommandError(f'Процесс замера завершился с ошибкой:\n{result.stderr}')
+        return result
+
+    @staticmethod
+    def _measure_rows(build, limit):
+        # Время процессора меряется без tracemalloc: трассировка замедляет
+        # выделение памяти в разы. Время сервера БД в process_time не входит.
+        build(limit)  # прогрев кэшей плана и соединения
+        started = time.process_time()
+        count = len(build(limit))
+        cpu = time.process_time() - started
+
+        tracemalloc.start()
+        try:
+            build(limit)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return count, cpu, peak
@@ -0,0 +1,87 @@
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connections
+from django.utils.module_loading import import_string
+
+from polyclinic_app.notifications import claim_and_send, get_backend
+
+
+logger = logging.getLogger(__name__)
+
+
+def dispatch_loop(backend_path, batch_size, poll_interval, once):
+    """Цикл одного процесса-отправителя; возвращает (отправлено, ошибок)"""
+    backend = import_string(backend_path)() if backend_path else get_backend()
+    sent = failed = 0
+    try:
+        while True:
+            try:
+                batch_sent, batch_failed = claim_and_send(backend, batch_size)
+            except DatabaseError:
+                logger.exception("Не удалось отправить пачку уведомлений")
+                connections.close_all()
+                time.sleep(poll_interval)
+                continue
+
+            sent += batch_sent
+            failed += batch_failed
+            if not batch_sent and not batch_failed:
+                if once:
+                    return sent, failed
+                time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        return sent, failed
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Отправляет наступившие уведомления пациентам пачками в нескольких процессах.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2,
+                            help='Число процессов-отправителей (по умолчанию 2)')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Уведомлений в одной пачке (по умолчанию 500)')
+        parser.add_argument('--poll-interval', type=float, default=5.0,
+                            help='Пауза между опросами пустой очереди, секунды')
+        parser.add_argument('--backend',
+                            help='Путь к классу бэкенда вместо settings.NOTIFICATION_BACKEND')
+        parser.add_argument('--once', action='store_true',
+                            help='Отправить всё, что уже наступило, и завершиться')
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        # Дочерние процессы открывают свои подключения: унаследованный
+        # сокет родителя использовать нельзя. Способ запуска процессов —
+        # по умолчанию для платформы (в Windows fork нет), поэтому каждый
+        # процесс сам настраивает Django
+        connections.close_all()
+
+        started = time.perf_counter()
+        self.stdout.write(f'Отправка уведомлений, процессов: {processes}')
+        with ProcessPoolExecutor(processes, initializer=django.setup) as pool:
+            futures = [
+                pool.submit(
+                    dispatch_loop, options['backend'], options['batch_size'],
+                    options['poll_interval'], options['once'],
+                )
+                for _ in range(processes)
+            ]
+            try:
+                results = [future.result() for future in futures]
+            except KeyboardInterrupt:
+                self.stdout.write('Остановка: дожидаемся текущих пачек...')
+                results = [future.result() for future in futures]
+
+        elapsed = time.perf_counter() - started
+        sent = sum(r[0] for r in results)
+        failed = sum(r[1] for r in results)
+        self.stdout.write(
+            f'Отправлено {sent}, ошибок {failed} за {elapsed:.1f} с '
+            f'({sent / elapsed if elapsed else 0:.0f} в секунду)'
+        )
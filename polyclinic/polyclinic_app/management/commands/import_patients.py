@@ -0,0 +1,69 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from polyclinic_app.patient_import import (
+    ImportStats, InvalidRow, PatientIndex, import_chunk, parse_row,
+)
+
+
+class Command(BaseCommand):
+    help = ('Импортирует пациентов из CSV (fname, lname, birth_date, gender, phone) '
+            'пачками, пропуская и объединяя дубликаты.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV-файл с заголовком')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Строк в одной пачке (по умолчанию 1000)')
+        parser.add_argument('--delimiter', default=',', help='Разделитель полей')
+        parser.add_argument('--encoding', default='utf-8-sig', help='Кодировка файла')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Посчитать статистику и откатить изменения')
+
+    def handle(self, *args, **options):
+        stats = ImportStats()
+        seen = PatientIndex()  # принятые строки всего файла, для повторов между пачками
+        dry_run = options['dry_run']
+        started = time.perf_counter()
+
+        try:
+            # Каждая пачка фиксируется (или в пробном запуске откатывается)
+            # своей транзакцией: без одной долгой транзакции на весь файл
+            with open(options['path'], newline='', encoding=options['encoding']) as f:
+                reader = csv.DictReader(f, delimiter=options['delimiter'])
+                chunk = []
+                for row in reader:
+                    stats.read += 1
+                    try:
+                        chunk.append(parse_row(row))
+                    except InvalidRow as exc:
+                        stats.invalid.append((reader.line_num, str(exc)))
+
+                    if len(chunk) >= options['chunk_size']:
+                        import_chunk(chunk, stats, seen, dry_run)
+                        chunk = []
+                        self.progress(stats, started, options['verbosity'])
+                if chunk:
+                    import_chunk(chunk, stats, seen, dry_run)
+        except (OSError, UnicodeDecodeError, csv.Error) as exc:
+            raise CommandError(f'Не удалось прочитать файл: {exc}')
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'Прочитано {stats.read} строк за {elapsed:.1f} с '
+            f'({stats.read / elapsed if elapsed else 0:.0f} строк/с)\n'
+            f'  добавлено:              {stats.inserted}\n'
+            f'  дубликаты, дополнены:   {stats.merged}\n'
+            f'  дубликаты, без измен.:  {stats.duplicates}\n'
+            f'  повторы внутри файла:   {stats.in_file}\n'
+            f'  с ошибками:             {len(stats.invalid)}'
+        )
+        for line_num, reason in stats.invalid[:20]:
+            self.stdout.write(f'    строка {line_num}: {reason}')
+        if dry_run:
+            self.stdout.write(self.style.WARNING('Пробный запуск: изменения отменены'))
+
+    def progress(self, stats, started, verbosity):
+        if verbosity > 1:
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'  {stats.read} строк, {stats.read / elapsed:.0f} строк/с')
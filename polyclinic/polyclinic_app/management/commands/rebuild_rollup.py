@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+
+# Расхождения сводки с visits: ключи, где число визитов и count не совпадают
+# (обнулённые строки сводки равны отсутствующим)
+DIFF_SQL = """
+    SELECT COALESCE(v.doctor_id, r.doctor_id),
+           COALESCE(v.visit_date, r.visit_date),
+           COALESCE(v.status, r.status),
+           COALESCE(v.count, 0),
+           COALESCE(r.count, 0)
+    FROM (
+        SELECT doctor_id, visit_date, status, COUNT(*) AS count
+        FROM visits
+        WHERE status IS NOT NULL
+        GROUP BY 1, 2, 3
+    ) v
+    FULL JOIN (
+        SELECT doctor_id, visit_date, status, count
+        FROM visit_daily_rollup
+        WHERE count <> 0
+    ) r ON r.doctor_id = v.doctor_id AND r.visit_date = v.visit_date AND r.status = v.status
+    WHERE COALESCE(v.count, 0) <> COALESCE(r.count, 0)
+    ORDER BY 1, 2, 3
+"""
+
+# Чтение не блокируется, изменения visits ждут окончания пересборки.
+# В SQLite тайм-аута запросов нет, а транзакция записи и так блокирует
+# остальных писателей, поэтому там выполняется только REBUILD_SQL.
+LOCK_SQL = [
+    "SET LOCAL statement_timeout = 0",
+    "LOCK TABLE visits IN SHARE MODE",
+]
+
+REBUILD_SQL = [
+    "DELETE FROM visit_daily_rollup",
+    """
+    INSERT INTO visit_daily_rollup (doctor_id, visit_date, status, count)
+    SELECT doctor_id, visit_date, status, COUNT(*)
+    FROM visits
+    WHERE status IS NOT NULL
+    GROUP BY 1, 2, 3
+    """,
+]
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает сводку visit_daily_rollup по таблице visits и сверяет их.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify-only', action='store_true',
+                            help='Только сверить сводку, не пересобирая её')
+        parser.add_argument('--show', type=int, default=20,
+                            help='Сколько расхождений вывести (по умолчанию 20)')
+
+    def handle(self, *args, **options):
+        if not options['verify_only']:
+            with transaction.atomic(), connection.cursor() as cursor:
+                lock = LOCK_SQL if connection.vendor == 'postgresql' else []
+                for sql in lock + REBUILD_SQL:
+                    cursor.execute(sql)
+                self.stdout.write(f'Сводка пересобрана, строк: {cursor.rowcount}')
+
+        with connection.cursor() as cursor:
+            cursor.execute(DIFF_SQL)
+            diff = cursor.fetchall()
+
+        if not diff:
+            self.stdout.write(self.style.SUCCESS('Сводка совпадает с visits'))
+            return
+
+        for doctor_id, visit_date, status, actual, stored in diff[:options['show']]:
+            self.stdout.write(f'врач {doctor_id}, {visit_date}, {status}: визитов {actual}, в сводке {stored}')
+        raise CommandError(f'Расхождений со сводкой: {len(diff)}')
@@ -0,0 +1,58 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connections
+
+from polyclinic_app.jobs import claim_next, run_job
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Обрабатывает фоновые задачи из таблицы jobs пулом потоков.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=2,
+                            help='Число потоков-обработчиков (по умолчанию 2)')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Пауза между опросами пустой очереди, секунды')
+        parser.add_argument('--once', action='store_true',
+                            help='Разобрать очередь до конца и завершиться')
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        poll_interval = options['poll_interval']
+
+        def loop():
+            try:
+                while not stop.is_set():
+                    try:
+                        job = claim_next()
+                    except DatabaseError:
+                        logger.exception("Не удалось получить задачу из очереди")
+                        connections.close_all()
+                        stop.wait(poll_interval)
+                        continue
+
+                    if job is None:
+                        if options['once']:
+                            return
+                        stop.wait(poll_interval)
+                        continue
+
+                    job = run_job(job)
+                    self.stdout.write(f'{job}, попытка {job.attempts}')
+            finally:
+                connections.close_all()
+
+        self.stdout.write(f"Воркер запущен, потоков: {options['threads']}")
+        with ThreadPoolExecutor(options['threads']) as pool:
+            futures = [pool.submit(loop) for _ in range(options['threads'])]
+            try:
+                wait(futures)
+            except KeyboardInterrupt:
+                stop.set()
+                self.stdout.write('Остановка: дожидаемся текущих задач...')
@@ -0,0 +1,169 @@
+import random
+import time
+from datetime import datetime, time as dtime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from polyclinic_app.models import (
+    Diagnosis, DocSchedule, Doctor, Patient, Sex, Spec, Stat, Visit,
+)
+
+
+SPECS = [
+    'Терапевт', 'Хирург', 'Невролог', 'Кардиолог', 'ЛОР', 'Офтальмолог',
+    'Гинеколог', 'Уролог', 'Дерматолог', 'Педиатр', 'Стоматолог', 'Травматолог',
+]
+DIAGNOSES = [
+    'ОРВИ', 'Гипертония', 'Гастрит', 'Остеохондроз', 'Бронхит', 'Мигрень',
+    'Аллергический ринит', 'Конъюнктивит', 'Дерматит', 'Ангина',
+]
+MALE_NAMES = ['Иван', 'Пётр', 'Сергей', 'Андрей', 'Алексей', 'Дмитрий', 'Павел', 'Михаил']
+FEMALE_NAMES = ['Анна', 'Мария', 'Елена', 'Ольга', 'Татьяна', 'Юлия', 'Наталья', 'Ирина']
+SURNAMES = ['Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов', 'Попов', 'Морозов',
+            'Новиков', 'Фёдоров', 'Соколов', 'Лебедев', 'Козлов', 'Орлов', 'Белов']
+
+# Смены врачей начинаются в эти часы и длятся от 6 до 9 часов
+SHIFT_STARTS = [dtime(8), dtime(8, 30), dtime(9), dtime(10), dtime(11)]
+SLOT = timedelta(minutes=30)
+
+
+def _person(rng):
+    gender = rng.choice(Sex.values)
+    names = MALE_NAMES if gender == Sex.MALE else FEMALE_NAMES
+    lname = rng.choice(SURNAMES) + ('а' if gender == Sex.FEMALE else '')
+    return rng.choice(names), lname, gender
+
+
+def _phone(rng):
+    return f'+7{rng.randrange(900_000_0000, 999_999_9999)}'
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическими врачами, расписанием, пациентами и визитами '
+            'для замеров; работает на PostgreSQL и SQLite.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=50)
+        parser.add_argument('--patients', type=int, default=2000)
+        parser.add_argument('--visits', type=int, default=100_000)
+        parser.add_argument('--days-back', type=int, default=365,
+                            help='Визиты начинаются столько дней назад (по умолчанию 365)')
+        parser.add_argument('--days-ahead', type=int, default=90,
+                            help='и заканчиваются столько дней вперёд (по умолчанию 90)')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=1, help='Зерно генератора')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        started = time.perf_counter()
+
+        with transaction.atomic():
+            specs = self.seed_reference()
+            doctors = self.seed_doctors(rng, specs, options['doctors'])
+            patient_ids = self.seed_patients(rng, options['patients'], options['batch_size'])
+            visits = self.seed_visits(rng, doctors, patient_ids, options)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{connection.vendor}: врачей {len(doctors)}, пациентов {len(patient_ids)}, '
+            f'визитов {visits} за {time.perf_counter() - started:.1f} с'
+        ))
+
+    def seed_reference(self):
+        for name in SPECS:
+            Spec.objects.get_or_create(name=name)
+        if not Diagnosis.objects.exists():
+            Diagnosis.objects.bulk_create(Diagnosis(name=name) for name in DIAGNOSES)
+        return list(Spec.objects.values_list('id', flat=True))
+
+    def seed_doctors(self, rng, specs, count):
+        """Новые врачи с недельным расписанием: {id врача: {день: (начало, конец)}}"""
+        doctors = Doctor.objects.bulk_create(
+            Doctor(fname=fname, lname=lname, spec_id=rng.choice(specs), phone=_phone(rng))
+            for fname, lname, _ in (_person(rng) for _ in range(count))
+        )
+        if not connection.features.can_return_rows_from_bulk_insert:
+            doctors = Doctor.objects.order_by('-id')[:count]
+
+        shifts = {}
+        schedule = []
+        for doctor in doctors:
+            days = sorted(rng.sample(range(1, 8), rng.randint(3, 6)))
+            start = rng.choice(SHIFT_STARTS)
+            end = (datetime.combine(datetime.min, start) + SLOT * rng.randint(12, 18)).time()
+            shifts[doctor.id] = {str(day): (start, end) for day in days}
+            schedule += [
+                DocSchedule(doctor=doctor, day=str(day), start_time=start, end_time=end)
+                for day in days
+            ]
+        DocSchedule.objects.bulk_create(schedule)
+        return shifts
+
+    def seed_patients(self, rng, count, batch_size):
+        start_id = Patient.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        today = timezone.localdate()
+        patients = []
+        for _ in range(count):
+            fname, lname, gender = _person(rng)
+            patients.append(Patient(
+                fname=fname, lname=lname, gender=gender, phone=_phone(rng),
+                birth_date=today - timedelta(days=rng.randint(18 * 365, 85 * 365)),
+            ))
+        Patient.objects.bulk_create(patients, batch_size=batch_size)
+        return list(Patient.objects.filter(id__gt=start_id).values_list('id', flat=True))
+
+    def seed_visits(self, rng, shifts, patient_ids, options):
+        """Визиты в слоты расписания; занятые слоты пропускаются"""
+        today = timezone.localdate()
+        first = today - timedelta(days=options['days_back'])
+        dates = [first + timedelta(days=n) for n in range(options['days_back'] + options['days_ahead'] + 1)]
+        diagnoses = list(Diagnosis.objects.values_list('id', flat=True))
+
+        doctor_dates = {
+            doctor_id: [d for d in dates if str(d.isoweekday()) in days]
+            for doctor_id, days in shifts.items()
+        }
+        doctor_ids = [doctor_id for doctor_id, days in doctor_dates.items() if days]
+        taken = set()
+        batch = []
+        created = 0
+        attempts = options['visits'] * 3
+
+        while created + len(batch) < options['visits'] and attempts:
+            attempts -= 1
+            doctor_id = rng.choice(doctor_ids)
+            visit_date = rng.choice(doctor_dates[doctor_id])
+            start, end = shifts[doctor_id][str(visit_date.isoweekday())]
+            slots = (datetime.combine(visit_date, end) - datetime.combine(visit_date, start)) // SLOT
+            visit_time = (datetime.combine(visit_date, start) + SLOT * rng.randrange(slots)).time()
+            if (doctor_id, visit_date, visit_time) in taken:
+                continue
+            taken.add((doctor_id, visit_date, visit_time))
+
+            if visit_date < today:
+                status = rng.choices(Stat.values, weights=[1, 8, 1])[0]
+            else:
+                status = rng.choices(Stat.values, weights=[9, 0, 1])[0]
+            visit = Visit(
+                patient_id=rng.choice(patient_ids),
+                doctor_id=doctor_id,
+                visit_date=visit_date,
+                visit_time=visit_time,
+                status=status,
+                diagnos_id=rng.choice(diagnoses) if status == Stat.COMPLETED else None,
+            )
+            visit.sync_visit_day()
+            batch.append(visit)
+
+            if len(batch) >= options['batch_size']:
+                created += self.flush_visits(batch, options['verbosity'])
+                batch = []
+
+        return created + self.flush_visits(batch, options['verbosity'])
+
+    def flush_visits(self, batch, verbosity):
+        Visit.objects.bulk_create(batch)
+        if verbosity > 1:
+            self.stdout.write(f'  записано визитов: {len(batch)}')
+        return len(batch)
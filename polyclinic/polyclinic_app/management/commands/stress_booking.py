@@ -0,0 +1,141 @@
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.utils import timezone
+
+from polyclinic_app.booking import SlotTaken, StaleVisit, book_visit, update_visit
+from polyclinic_app.models import Diagnosis, DocSchedule, Doctor, Notification, Patient, Spec, Visit
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочная проверка записи: N параллельных операторов бронируют '
+        'один слот, затем одновременно правят один визит. Врач и пациент '
+        'создаются командой и удаляются после проверки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=50,
+                            help='Число параллельных операторов (по умолчанию 50)')
+        parser.add_argument('--keep', action='store_true',
+                            help='Не удалять тестовых врача, пациента и визит после проверки')
+
+    def handle(self, *args, **options):
+        doctor_id, patient_id, visit_date, visit_time = self.create_fixture()
+        try:
+            self.run_checks(options['workers'], doctor_id, patient_id, visit_date, visit_time)
+        finally:
+            if options['keep']:
+                self.stdout.write(f'Тестовые данные оставлены: врач {doctor_id}, пациент {patient_id}')
+            else:
+                self.drop_fixture(doctor_id, patient_id)
+
+    def run_checks(self, workers, doctor_id, patient_id, visit_date, visit_time):
+        diagnoses = list(Diagnosis.objects.values_list('id', flat=True)) or [None]
+
+        self.stdout.write(
+            f'Слот: врач {doctor_id}, {visit_date} {visit_time:%H:%M}, операторов: {workers}'
+        )
+
+        # Фаза 1: все операторы одновременно бронируют один и тот же слот
+        barrier = threading.Barrier(workers)
+
+        def book(_):
+            barrier.wait()
+            visit = Visit(
+                patient_id=patient_id,
+                doctor_id=doctor_id,
+                visit_date=visit_date,
+                visit_time=visit_time,
+            )
+            try:
+                return book_visit(visit).id
+            except SlotTaken:
+                return None
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(workers) as pool:
+            booked = [pk for pk in pool.map(book, range(workers)) if pk]
+
+        in_db = Visit.objects.filter(
+            doctor_id=doctor_id, visit_date=visit_date, visit_time=visit_time,
+        ).count()
+        self.stdout.write(f'Бронирование: успешно {len(booked)}, конфликтов {workers - len(booked)}, в БД {in_db}')
+        if len(booked) != 1 or in_db != 1:
+            raise CommandError('Слот занят не ровно одним визитом')
+
+        visit_id = booked[0]
+        start_version = Visit.objects.values_list('version', flat=True).get(pk=visit_id)
+
+        # Фаза 2: все операторы правят один визит, повторяя попытку при конфликте
+        barrier = threading.Barrier(workers)
+
+        def edit(n):
+            barrier.wait()
+            attempts = 0
+            try:
+                while True:
+                    attempts += 1
+                    visit = Visit.objects.get(pk=visit_id)
+                    visit.diagnos_id = diagnoses[n % len(diagnoses)]
+                    try:
+                        update_visit(visit, visit.version)
+                        return attempts
+                    except StaleVisit:
+                        continue
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(workers) as pool:
+            attempts = list(pool.map(edit, range(workers)))
+
+        end_version = Visit.objects.values_list('version', flat=True).get(pk=visit_id)
+        self.stdout.write(
+            f'Правки: применено {end_version - start_version} из {workers}, '
+            f'повторов из-за конфликтов {sum(attempts) - workers}'
+        )
+
+        if end_version - start_version != workers:
+            raise CommandError('Потеряны обновления: версия выросла не на число правок')
+
+        self.stdout.write(self.style.SUCCESS('Потерянных броней и обновлений нет'))
+
+    def create_fixture(self):
+        """Врач с одной сменой завтра и пациент только для этой проверки.
+
+        Реальные пациенты не получают уведомлений о тестовых визитах, а
+        слот заведомо свободен.
+        """
+        visit_date = timezone.localdate() + timedelta(days=1)
+        visit_time = time(9)
+        tag = uuid.uuid4().hex[:8]
+        with transaction.atomic():
+            spec = Spec.objects.create(name=f'Нагрузочная проверка {tag}')
+            doctor = Doctor.objects.create(fname=tag, lname='Нагрузочный', spec=spec)
+            DocSchedule.objects.create(
+                doctor=doctor, day=str(visit_date.isoweekday()),
+                start_time=visit_time, end_time=time(10),
+            )
+            patient = Patient.objects.create(
+                fname=tag, lname='Нагрузочный', birth_date=date(1970, 1, 1), gender='m',
+            )
+        return doctor.id, patient.id, visit_date, visit_time
+
+    def drop_fixture(self, doctor_id, patient_id):
+        """Удаляет тестовые визиты с уведомлениями, врача, пациента и специальность"""
+        with transaction.atomic():
+            Notification.objects.filter(patient_id=patient_id).delete()
+            Visit.objects.filter(doctor_id=doctor_id).delete()
+            # Обнулённые ключи сводки удалённого врача
+            with connection.cursor() as cursor:
+                cursor.execute('DELETE FROM visit_daily_rollup WHERE doctor_id = %s', [doctor_id])
+            DocSchedule.objects.filter(doctor_id=doctor_id).delete()
+            spec_id = Doctor.objects.values_list('spec_id', flat=True).get(pk=doctor_id)
+            Doctor.objects.filter(pk=doctor_id).delete()
+            Spec.objects.filter(pk=spec_id).delete()
+            Patient.objects.filter(pk=patient_id).delete()
@@ -0,0 +1,28 @@
+from django.db import migrations
+
+
+class VendorSQL(migrations.RunSQL):
+    """RunSQL, который выполняется только на СУБД vendor.
+
+    Схема PostgreSQL описана в bd_project.sql и дополняется миграциями на
+    plpgsql; для SQLite та же схема создаётся отдельной миграцией
+    (0009_sqlite_schema). На остальных СУБД операция ничего не делает.
+    """
+
+    vendor = None
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == self.vendor:
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == self.vendor:
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class PostgresOnlySQL(VendorSQL):
+    vendor = 'postgresql'
+
+
+class SQLiteOnlySQL(VendorSQL):
+    vendor = 'sqlite'
@@ -0,0 +1,18 @@
+from django.db import migrations
+
+from polyclinic_app.migration_ops import PostgresOnlySQL
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polyclinic_app', '0001_initial'),
+    ]
+
+    operations = [
+        # Счётчик версий для оптимистической блокировки правок визита
+        PostgresOnlySQL(
+            "ALTER TABLE visits ADD COLUMN version integer NOT NULL DEFAULT 1;",
+            reverse_sql="ALTER TABLE visits DROP COLUMN version;",
+        ),
+    ]
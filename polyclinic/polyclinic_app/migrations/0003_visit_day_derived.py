@@ -0,0 +1,137 @@
+from django.db import migrations
+
+from polyclinic_app.migration_ops import PostgresOnlySQL
+
+
+VALIDATE_VISIT_CHECKS = """
+    IF EXTRACT(MINUTE FROM NEW.visit_time) % 30 != 0 THEN
+        RAISE EXCEPTION 'Время визита должно быть кратно 30 минутам.';
+    END IF;
+
+    IF NOT EXISTS (
+        SELECT 1 FROM doctors
+        WHERE id = NEW.doctor_id
+        AND is_available = TRUE
+    ) THEN
+        RAISE EXCEPTION 'Доктор временно недоступен для записи';
+    END IF;
+
+    IF NOT EXISTS (
+        SELECT 1 FROM doc_schedule
+        WHERE doctor_id = NEW.doctor_id
+        AND day = NEW.visit_day
+        AND start_time <= NEW.visit_time
+        AND NEW.visit_time < end_time
+    ) THEN
+        RAISE EXCEPTION 'Доктор не работает в этот день или время';
+    END IF;
+
+    RETURN NEW;
+END
+$$;
+"""
+
+# День недели больше не вводится вручную: триггер выводит его из даты
+# до проверки расписания, поэтому visit_day всегда согласован с visit_date.
+VALIDATE_VISIT_DERIVED = """
+CREATE OR REPLACE FUNCTION validate_visit()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.visit_day := EXTRACT(ISODOW FROM NEW.visit_date)::int::text::week_day;
+""" + VALIDATE_VISIT_CHECKS
+
+VALIDATE_VISIT_MANUAL = """
+CREATE OR REPLACE FUNCTION validate_visit()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+""" + VALIDATE_VISIT_CHECKS
+
+BACKFILL_VISIT_DAY = """
+ALTER TABLE visits DISABLE TRIGGER check_visit_constraints;
+
+UPDATE visits
+SET visit_day = EXTRACT(ISODOW FROM visit_date)::int::text::week_day
+WHERE visit_day IS DISTINCT FROM EXTRACT(ISODOW FROM visit_date)::int::text::week_day;
+
+ALTER TABLE visits ENABLE TRIGGER check_visit_constraints;
+
+ALTER TABLE visits ALTER COLUMN visit_day SET NOT NULL;
+"""
+
+NEXT_DOC_VISITS = """
+CREATE OR REPLACE FUNCTION next_doc_visits(
+    p_doctor_id INT
+)
+RETURNS TABLE (
+    appointment_date DATE,
+    appointment_day TEXT,
+    appointment_time TIME,
+    patient_name TEXT,
+    patient_phone TEXT,
+    status TEXT
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF NOT EXISTS(SELECT 1 FROM doctors WHERE id = p_doctor_id) THEN
+        RAISE EXCEPTION 'Врач с ID % не найден', p_doctor_id;
+    END IF;
+
+    RETURN QUERY
+    SELECT
+        v.visit_date AS appointment_date,
+        CASE DAY_EXPR
+            WHEN 1 THEN 'Понедельник'
+            WHEN 2 THEN 'Вторник'
+            WHEN 3 THEN 'Среда'
+            WHEN 4 THEN 'Четверг'
+            WHEN 5 THEN 'Пятница'
+            WHEN 6 THEN 'Суббота'
+            WHEN 7 THEN 'Воскресенье'
+        END AS appointment_day,
+        v.visit_time AS appointment_time,
+        p.fname || ' ' || p.lname AS patient_name,
+        p.phone AS patient_phone,
+        v.status::TEXT AS status
+    FROM visits v
+    JOIN patients p ON v.patient_id = p.id
+    WHERE v.doctor_id = p_doctor_id
+    AND v.visit_date BETWEEN CURRENT_DATE AND CURRENT_DATE + 6
+    AND v.status = 'scheduled'
+    ORDER BY v.visit_date, v.visit_time;
+
+    IF NOT FOUND THEN
+        RAISE NOTICE 'У врача с ID % нет запланированных визитов на ближайшие 7 дней', p_doctor_id;
+    END IF;
+END;
+$$;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polyclinic_app', '0002_visit_version'),
+    ]
+
+    operations = [
+        PostgresOnlySQL(VALIDATE_VISIT_DERIVED, reverse_sql=VALIDATE_VISIT_MANUAL),
+        PostgresOnlySQL(
+            BACKFILL_VISIT_DAY,
+            reverse_sql="ALTER TABLE visits ALTER COLUMN visit_day DROP NOT NULL;",
+        ),
+        PostgresOnlySQL(
+            "CREATE INDEX visits_doctor_day_idx ON visits (doctor_id, visit_day);",
+            reverse_sql="DROP INDEX visits_doctor_day_idx;",
+        ),
+        # Отчёт по ближайшим визитам берёт день недели из колонки,
+        # а не вычисляет EXTRACT(ISODOW ...) для каждой строки
+        PostgresOnlySQL(
+            NEXT_DOC_VISITS.replace('DAY_EXPR', 'v.visit_day::text::int'),
+            reverse_sql=NEXT_DOC_VISITS.replace('DAY_EXPR', 'EXTRACT(ISODOW FROM v.visit_date)'),
+        ),
+    ]
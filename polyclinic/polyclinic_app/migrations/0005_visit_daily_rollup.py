@@ -0,0 +1,121 @@
+from django.db import migrations
+
+from polyclinic_app.migration_ops import PostgresOnlySQL
+
+
+CREATE_ROLLUP = """
+CREATE TABLE visit_daily_rollup (
+    doctor_id int NOT NULL,
+    visit_date date NOT NULL,
+    status stat NOT NULL,
+    count int NOT NULL DEFAULT 0,
+    PRIMARY KEY (doctor_id, visit_date, status)
+);
+
+CREATE INDEX visit_daily_rollup_date_idx ON visit_daily_rollup (visit_date);
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'polyclinic_client') THEN
+        GRANT SELECT ON visit_daily_rollup TO polyclinic_client;
+    END IF;
+END
+$$;
+"""
+
+# Триггеры уровня оператора: изменения всего оператора (в том числе
+# массовая отмена визитов) сворачиваются в одну вставку с дельтами по
+# ключу (врач, дата, статус). Строки упорядочены по ключу, чтобы
+# параллельные транзакции брали блокировки в одном порядке.
+ROLLUP_TRIGGERS = """
+CREATE OR REPLACE FUNCTION visit_rollup_apply()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO visit_daily_rollup AS r (doctor_id, visit_date, status, count)
+        SELECT doctor_id, visit_date, status, COUNT(*)
+        FROM new_rows
+        WHERE status IS NOT NULL
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+        ON CONFLICT (doctor_id, visit_date, status)
+        DO UPDATE SET count = r.count + EXCLUDED.count;
+
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO visit_daily_rollup AS r (doctor_id, visit_date, status, count)
+        SELECT doctor_id, visit_date, status, -COUNT(*)
+        FROM old_rows
+        WHERE status IS NOT NULL
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+        ON CONFLICT (doctor_id, visit_date, status)
+        DO UPDATE SET count = r.count + EXCLUDED.count;
+
+    ELSE
+        INSERT INTO visit_daily_rollup AS r (doctor_id, visit_date, status, count)
+        SELECT doctor_id, visit_date, status, SUM(delta)
+        FROM (
+            SELECT doctor_id, visit_date, status, -1 AS delta FROM old_rows
+            UNION ALL
+            SELECT doctor_id, visit_date, status, 1 AS delta FROM new_rows
+        ) AS changes
+        WHERE status IS NOT NULL
+        GROUP BY 1, 2, 3
+        HAVING SUM(delta) <> 0
+        ORDER BY 1, 2, 3
+        ON CONFLICT (doctor_id, visit_date, status)
+        DO UPDATE SET count = r.count + EXCLUDED.count;
+    END IF;
+
+    RETURN NULL;
+END
+$$;
+
+CREATE TRIGGER visits_rollup_insert
+AFTER INSERT ON visits
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION visit_rollup_apply();
+
+CREATE TRIGGER visits_rollup_update
+AFTER UPDATE ON visits
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION visit_rollup_apply();
+
+CREATE TRIGGER visits_rollup_delete
+AFTER DELETE ON visits
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION visit_rollup_apply();
+"""
+
+DROP_ROLLUP_TRIGGERS = """
+DROP TRIGGER visits_rollup_insert ON visits;
+DROP TRIGGER visits_rollup_update ON visits;
+DROP TRIGGER visits_rollup_delete ON visits;
+DROP FUNCTION visit_rollup_apply();
+"""
+
+FILL_ROLLUP = """
+INSERT INTO visit_daily_rollup (doctor_id, visit_date, status, count)
+SELECT doctor_id, visit_date, status, COUNT(*)
+FROM visits
+WHERE status IS NOT NULL
+GROUP BY 1, 2, 3;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polyclinic_app', '0004_job'),
+    ]
+
+    operations = [
+        PostgresOnlySQL(CREATE_ROLLUP, reverse_sql="DROP TABLE visit_daily_rollup;"),
+        PostgresOnlySQL(ROLLUP_TRIGGERS, reverse_sql=DROP_ROLLUP_TRIGGERS),
+        PostgresOnlySQL(FILL_ROLLUP, reverse_sql=migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations
+
+from polyclinic_app.migration_ops import PostgresOnlySQL
+
+
+class Migration(migrations.Migration):
+    # Список визитов отдаёт первые строки по убыванию даты и времени;
+    # без индекса это сортировка всей таблицы на каждый запрос.
+
+    dependencies = [
+        ('polyclinic_app', '0005_visit_daily_rollup'),
+    ]
+
+    operations = [
+        PostgresOnlySQL(
+            "CREATE INDEX visits_date_time_idx ON visits (visit_date DESC, visit_time DESC);",
+            reverse_sql="DROP INDEX visits_date_time_idx;",
+        ),
+    ]
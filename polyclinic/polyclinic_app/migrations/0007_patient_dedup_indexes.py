@@ -0,0 +1,24 @@
+from django.db import migrations
+
+from polyclinic_app.migration_ops import PostgresOnlySQL
+
+
+class Migration(migrations.Migration):
+    # Блокирующие индексы для поиска дубликатов при импорте пациентов
+    # (polyclinic_app.patient_import): по последним 10 цифрам телефона и
+    # по фамилии без учёта регистра с датой рождения.
+
+    dependencies = [
+        ('polyclinic_app', '0006_visit_date_time_idx'),
+    ]
+
+    operations = [
+        PostgresOnlySQL(
+            r"CREATE INDEX patients_phone_key_idx ON patients (right(regexp_replace(phone, '\D', '', 'g'), 10));",
+            reverse_sql="DROP INDEX patients_phone_key_idx;",
+        ),
+        PostgresOnlySQL(
+            "CREATE INDEX patients_lname_birth_idx ON patients (lower(lname), birth_date);",
+            reverse_sql="DROP INDEX patients_lname_birth_idx;",
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:32
+
+import django.core.serializers.json
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polyclinic_app', '0007_patient_dedup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Notification',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('booked', 'booked'), ('changed', 'changed'), ('cancelled', 'cancelled'), ('reminder', 'reminder')], max_length=10)),
+                ('payload', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('status', models.CharField(choices=[('pending', 'pending'), ('sent', 'sent'), ('failed', 'failed'), ('cancelled', 'cancelled')], default='pending', max_length=10)),
+                ('send_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('sent', models.DateTimeField(blank=True, null=True)),
+                ('patient', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='polyclinic_app.patient')),
+                ('visit', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='polyclinic_app.visit')),
+            ],
+            options={
+                'db_table': 'notifications',
+                'indexes': [models.Index(condition=models.Q(('status', 'pending')), fields=['send_after'], name='notifications_due_idx'), models.Index(fields=['visit', 'status'], name='notifications_visit_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,315 @@
+from django.db import migrations
+
+from polyclinic_app.migration_ops import SQLiteOnlySQL
+
+
+# Схема bd_project.sql и миграций 0002–0007 для локального режима SQLite
+# (POLYCLINIC_DB_BACKEND=sqlite). Перечисления заменены проверками CHECK,
+# функции plpgsql — триггерами SQLite с теми же сообщениями об ошибках.
+# Процедуры отмены и next_doc_visits приложением не используются и не
+# переносятся.
+
+# День недели ISO (1 = понедельник) строкой, как в перечислении week_day
+def iso_day(column):
+    return f"CAST((CAST(strftime('%w', {column}) AS integer) + 6) % 7 + 1 AS text)"
+
+
+TABLES = [
+    """
+    CREATE TABLE spec (
+        id integer PRIMARY KEY AUTOINCREMENT,
+        name text NOT NULL UNIQUE
+    )
+    """,
+    """
+    CREATE TABLE doctors (
+        id integer PRIMARY KEY AUTOINCREMENT,
+        fname text NOT NULL,
+        lname text NOT NULL,
+        spec_id integer NOT NULL REFERENCES spec (id),
+        phone text,
+        is_available bool DEFAULT 1
+    )
+    """,
+    """
+    CREATE TABLE patients (
+        id integer PRIMARY KEY AUTOINCREMENT,
+        fname text NOT NULL,
+        lname text NOT NULL,
+        birth_date date NOT NULL,
+        gender varchar(1) CHECK (gender IN ('m', 'f')),
+        phone text,
+        registered date DEFAULT (date('now', 'localtime'))
+    )
+    """,
+    """
+    CREATE TABLE doc_schedule (
+        doctor_id integer NOT NULL REFERENCES doctors (id),
+        day varchar(1) CHECK (day IN ('1', '2', '3', '4', '5', '6', '7')),
+        start_time time NOT NULL,
+        end_time time NOT NULL,
+        PRIMARY KEY (doctor_id, day)
+    )
+    """,
+    """
+    CREATE TABLE diagnoses (
+        id integer PRIMARY KEY AUTOINCREMENT,
+        name text NOT NULL
+    )
+    """,
+    # visit_day допускает NULL только до конца вставки: его выставляет
+    # триггер visits_derive_day (в PostgreSQL — validate_visit до вставки)
+    """
+    CREATE TABLE visits (
+        id integer PRIMARY KEY AUTOINCREMENT,
+        patient_id integer NOT NULL REFERENCES patients (id),
+        doctor_id integer NOT NULL REFERENCES doctors (id),
+        visit_day varchar(1) CHECK (visit_day IN ('1', '2', '3', '4', '5', '6', '7')),
+        visit_date date NOT NULL,
+        visit_time time NOT NULL,
+        diagnos_id integer REFERENCES diagnoses (id),
+        status varchar(10) DEFAULT 'scheduled'
+            CHECK (status IN ('scheduled', 'completed', 'cancelled')),
+        created date DEFAULT (date('now', 'localtime')),
+        version integer NOT NULL DEFAULT 1,
+        UNIQUE (doctor_id, visit_date, visit_time)
+    )
+    """,
+    """
+    CREATE TABLE recipes (
+        id integer PRIMARY KEY AUTOINCREMENT,
+        visit_id integer NOT NULL REFERENCES visits (id),
+        drug text NOT NULL,
+        instructions text
+    )
+    """,
+    """
+    CREATE TABLE visit_daily_rollup (
+        doctor_id integer NOT NULL,
+        visit_date date NOT NULL,
+        status varchar(10) NOT NULL,
+        count integer NOT NULL DEFAULT 0,
+        PRIMARY KEY (doctor_id, visit_date, status)
+    )
+    """,
+    """
+    CREATE TABLE doctors_history (
+        history_id integer PRIMARY KEY AUTOINCREMENT,
+        operation_type char(1) NOT NULL CHECK (operation_type IN ('I', 'U', 'D')),
+        operation_time timestamp DEFAULT CURRENT_TIMESTAMP,
+        operation_user text,
+        id integer NOT NULL,
+        fname text NOT NULL,
+        lname text NOT NULL,
+        spec_id integer NOT NULL,
+        phone text,
+        is_available bool DEFAULT 1,
+        current_record_id integer REFERENCES doctors (id) ON DELETE SET NULL
+    )
+    """,
+    """
+    CREATE TABLE patients_history (
+        history_id integer PRIMARY KEY AUTOINCREMENT,
+        operation_type char(1) NOT NULL CHECK (operation_type IN ('I', 'U', 'D')),
+        operation_time timestamp DEFAULT CURRENT_TIMESTAMP,
+        operation_user text,
+        id integer NOT NULL,
+        fname text NOT NULL,
+        lname text NOT NULL,
+        birth_date date NOT NULL,
+        gender varchar(1),
+        phone text,
+        registered date DEFAULT (date('now', 'localtime')),
+        current_record_id integer REFERENCES patients (id) ON DELETE SET NULL
+    )
+    """,
+    """
+    CREATE TABLE visits_history (
+        history_id integer PRIMARY KEY AUTOINCREMENT,
+        operation_type char(1) NOT NULL CHECK (operation_type IN ('I', 'U', 'D')),
+        operation_time timestamp DEFAULT CURRENT_TIMESTAMP,
+        operation_user text,
+        id integer NOT NULL,
+        patient_id integer NOT NULL,
+        doctor_id integer NOT NULL,
+        visit_day varchar(1),
+        visit_date date NOT NULL,
+        visit_time time NOT NULL,
+        diagnos_id integer,
+        status varchar(10) DEFAULT 'scheduled',
+        created date DEFAULT (date('now', 'localtime')),
+        current_record_id integer REFERENCES visits (id) ON DELETE SET NULL
+    )
+    """,
+    """
+    CREATE VIEW doctor_stats AS
+    SELECT d.id AS doctor_id,
+           d.fname || ' ' || d.lname AS doctor_name,
+           s.name AS specialization,
+           COUNT(v.id) AS total_visits,
+           COUNT(CASE WHEN v.status = 'completed' THEN 1 END) AS completed_visits,
+           COUNT(CASE WHEN v.status = 'cancelled' THEN 1 END) AS cancelled_visits,
+           COUNT(CASE WHEN v.status = 'scheduled' THEN 1 END) AS scheduled_visits,
+           MIN(v.visit_date) AS first_visit_date,
+           MAX(v.visit_date) AS last_visit_date
+    FROM doctors d
+    JOIN spec s ON d.spec_id = s.id
+    LEFT JOIN visits v ON d.id = v.doctor_id
+    GROUP BY d.id, d.fname, d.lname, s.name
+    ORDER BY total_visits DESC
+    """,
+]
+
+INDEXES = [
+    "CREATE INDEX visits_doctor_day_idx ON visits (doctor_id, visit_day)",
+    "CREATE INDEX visits_date_time_idx ON visits (visit_date DESC, visit_time DESC)",
+    "CREATE INDEX visit_daily_rollup_date_idx ON visit_daily_rollup (visit_date)",
+    # regexp_replace в SQLite нет: ключ телефона — последние 10 символов
+    # после удаления обычных разделителей (patient_import.PHONE_KEY_SQLITE)
+    """
+    CREATE INDEX patients_phone_key_idx ON patients (
+        substr(replace(replace(replace(replace(replace(replace(
+            phone, '+', ''), '-', ''), ' ', ''), '(', ''), ')', ''), '.', ''), -10)
+    )
+    """,
+    # lower() в SQLite не знает кириллицу, поэтому кандидаты по имени
+    # ищутся по дате рождения, а фамилия сравнивается в Python
+    "CREATE INDEX patients_birth_lname_idx ON patients (birth_date, lname)",
+]
+
+# validate_visit: те же проверки и сообщения, день недели выводится из даты
+VALIDATE_VISIT = """
+    CREATE TRIGGER check_visit_constraints_{op}
+    BEFORE {OP} ON visits
+    BEGIN
+        SELECT RAISE(ABORT, 'Время визита должно быть кратно 30 минутам.')
+        WHERE CAST(strftime('%M', NEW.visit_time) AS integer) % 30 != 0;
+
+        SELECT RAISE(ABORT, 'Доктор временно недоступен для записи')
+        WHERE NOT EXISTS (
+            SELECT 1 FROM doctors
+            WHERE id = NEW.doctor_id
+              AND is_available
+        );
+
+        SELECT RAISE(ABORT, 'Доктор не работает в этот день или время')
+        WHERE NOT EXISTS (
+            SELECT 1 FROM doc_schedule
+            WHERE doctor_id = NEW.doctor_id
+              AND day = {day}
+              AND start_time <= NEW.visit_time
+              AND NEW.visit_time < end_time
+        );
+    END
+"""
+
+# Триггер SQLite не может изменить NEW, поэтому день недели, расходящийся
+# с датой, исправляется сразу после записи строки
+DERIVE_DAY = """
+    CREATE TRIGGER visits_derive_day_{op}
+    AFTER {OP} ON visits
+    WHEN NEW.visit_day IS NOT {day}
+    BEGIN
+        UPDATE visits SET visit_day = {day} WHERE id = NEW.id;
+    END
+"""
+
+# visit_rollup_apply: в SQLite нет триггеров уровня оператора, сводка
+# обновляется построчно
+ROLLUP_ADD = """
+        INSERT INTO visit_daily_rollup (doctor_id, visit_date, status, count)
+        SELECT {row}.doctor_id, {row}.visit_date, {row}.status, {delta}
+        WHERE {row}.status IS NOT NULL
+        ON CONFLICT (doctor_id, visit_date, status)
+        DO UPDATE SET count = count + excluded.count;
+"""
+
+ROLLUP_TRIGGERS = [
+    f"""
+    CREATE TRIGGER visits_rollup_insert
+    AFTER INSERT ON visits
+    BEGIN
+        {ROLLUP_ADD.format(row='NEW', delta=1)}
+    END
+    """,
+    f"""
+    CREATE TRIGGER visits_rollup_update
+    AFTER UPDATE OF doctor_id, visit_date, status ON visits
+    WHEN OLD.doctor_id IS NOT NEW.doctor_id
+      OR OLD.visit_date IS NOT NEW.visit_date
+      OR OLD.status IS NOT NEW.status
+    BEGIN
+        {ROLLUP_ADD.format(row='OLD', delta=-1)}
+        {ROLLUP_ADD.format(row='NEW', delta=1)}
+    END
+    """,
+    f"""
+    CREATE TRIGGER visits_rollup_delete
+    AFTER DELETE ON visits
+    BEGIN
+        {ROLLUP_ADD.format(row='OLD', delta=-1)}
+    END
+    """,
+]
+
+# save_full_history: вставка пишет новую строку, изменение и удаление —
+# прежнюю; у удалённой записи ссылка на текущую строку пустая
+HISTORY_COLUMNS = {
+    'doctors': 'id, fname, lname, spec_id, phone, is_available',
+    'patients': 'id, fname, lname, birth_date, gender, phone, registered',
+    'visits': 'id, patient_id, doctor_id, visit_day, visit_date, visit_time, diagnos_id, status, created',
+}
+
+HISTORY_TRIGGER = """
+    CREATE TRIGGER {table}_history_{op}
+    AFTER {OP} ON {table}
+    BEGIN
+        INSERT INTO {table}_history (operation_type, {columns}, current_record_id)
+        VALUES ('{code}', {values}, {current});
+    END
+"""
+
+
+def history_triggers():
+    statements = []
+    for table, columns in HISTORY_COLUMNS.items():
+        for op, code, row, current in (
+            ('insert', 'I', 'NEW', 'NEW.id'),
+            ('update', 'U', 'OLD', 'OLD.id'),
+            ('delete', 'D', 'OLD', 'NULL'),
+        ):
+            values = ', '.join(f'{row}.{column}' for column in columns.split(', '))
+            statements.append(HISTORY_TRIGGER.format(
+                table=table, op=op, OP=op.upper(), code=code,
+                columns=columns, values=values, current=current,
+            ))
+    return statements
+
+
+TRIGGERS = [
+    *(VALIDATE_VISIT.format(op=op, OP=op.upper(), day=iso_day('NEW.visit_date'))
+      for op in ('insert', 'update')),
+    DERIVE_DAY.format(op='insert', OP='INSERT', day=iso_day('NEW.visit_date')),
+    DERIVE_DAY.format(op='update', OP='UPDATE OF visit_date, visit_day', day=iso_day('NEW.visit_date')),
+    *ROLLUP_TRIGGERS,
+    *history_triggers(),
+]
+
+DROP_ALL = [
+    "DROP VIEW doctor_stats",
+    *(f"DROP TABLE {table}" for table in (
+        'visits_history', 'patients_history', 'doctors_history', 'visit_daily_rollup',
+        'recipes', 'visits', 'diagnoses', 'doc_schedule', 'patients', 'doctors', 'spec',
+    )),
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polyclinic_app', '0008_notification'),
+    ]
+
+    operations = [
+        SQLiteOnlySQL(TABLES + INDEXES + TRIGGERS, reverse_sql=DROP_ALL),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polyclinic_app', '0009_sqlite_schema'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='locked_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        # Задачи, которые уже выполнялись без срока владения, можно забрать сразу
+        migrations.RunSQL(
+            "UPDATE jobs SET locked_until = started WHERE status = 'running'",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,61 @@
+from importlib import import_module
+
+from django.db import migrations
+
+from polyclinic_app.migration_ops import PostgresOnlySQL
+
+
+# validate_visit читает строку врача FOR SHARE до проверки расписания.
+# set_weekly_schedule держит строки врачей FOR UPDATE, поэтому новый визит
+# ждёт конца правки и сверяется уже с новым расписанием: в READ COMMITTED
+# каждый запрос функции видит данные, закоммиченные к его началу.
+VALIDATE_VISIT_LOCKED = """
+CREATE OR REPLACE FUNCTION validate_visit()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    doctor_available BOOLEAN;
+BEGIN
+    NEW.visit_day := EXTRACT(ISODOW FROM NEW.visit_date)::int::text::week_day;
+
+    IF EXTRACT(MINUTE FROM NEW.visit_time) % 30 != 0 THEN
+        RAISE EXCEPTION 'Время визита должно быть кратно 30 минутам.';
+    END IF;
+
+    SELECT is_available INTO doctor_available
+    FROM doctors
+    WHERE id = NEW.doctor_id
+    FOR SHARE;
+
+    IF doctor_available IS DISTINCT FROM TRUE THEN
+        RAISE EXCEPTION 'Доктор временно недоступен для записи';
+    END IF;
+
+    IF NOT EXISTS (
+        SELECT 1 FROM doc_schedule
+        WHERE doctor_id = NEW.doctor_id
+        AND day = NEW.visit_day
+        AND start_time <= NEW.visit_time
+        AND NEW.visit_time < end_time
+    ) THEN
+        RAISE EXCEPTION 'Доктор не работает в этот день или время';
+    END IF;
+
+    RETURN NEW;
+END
+$$;
+"""
+
+VALIDATE_VISIT_DERIVED = import_module('polyclinic_app.migrations.0003_visit_day_derived').VALIDATE_VISIT_DERIVED
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polyclinic_app', '0010_job_locked_until'),
+    ]
+
+    operations = [
+        PostgresOnlySQL(VALIDATE_VISIT_LOCKED, reverse_sql=VALIDATE_VISIT_DERIVED),
+    ]
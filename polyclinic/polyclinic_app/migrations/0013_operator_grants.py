@@ -0,0 +1,34 @@
+from django.db import migrations
+
+from polyclinic_app.migration_ops import PostgresOnlySQL
+
+
+# Таблицы, созданные миграциями после bd_project.sql: его GRANT ... ON ALL
+# TABLES их не покрывает. Если миграции выполняет не polyclinic_operator
+# (например, администратор БД), без этих прав оператор не сможет вести
+# сводку визитов, очередь задач и уведомления.
+OPERATOR_GRANTS = """
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'polyclinic_operator') THEN
+        GRANT SELECT, INSERT, UPDATE, DELETE
+            ON visit_daily_rollup, jobs, notifications, cache_generations
+            TO polyclinic_operator;
+        GRANT USAGE, SELECT ON SEQUENCE jobs_id_seq, notifications_id_seq TO polyclinic_operator;
+    END IF;
+END
+$$;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polyclinic_app', '0012_cache_generation'),
+    ]
+
+    operations = [
+        # Обратной операции нет: права могли быть выданы и до миграции,
+        # а владельцу таблиц (если это оператор) REVOKE отрезал бы доступ
+        PostgresOnlySQL(OPERATOR_GRANTS, reverse_sql=migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,48 @@
+from importlib import import_module
+
+from django.db import migrations
+
+from polyclinic_app.migration_ops import SQLiteOnlySQL
+
+
+sqlite_schema = import_module('polyclinic_app.migrations.0009_sqlite_schema')
+
+# День недели, расходящийся с датой, больше не исправляется вторым
+# UPDATE после записи: этот UPDATE срабатывал на visits_history_update и
+# оставлял в истории лишнюю строку 'U'. Приложение всегда выставляет
+# visit_day само (Visit.sync_visit_day), поэтому триггер только проверяет.
+CHECK_DAY = """
+    CREATE TRIGGER visits_check_day_{op}
+    BEFORE {OP} ON visits
+    WHEN NEW.visit_day IS NOT {day}
+    BEGIN
+        SELECT RAISE(ABORT, 'День недели визита не совпадает с датой.');
+    END
+"""
+
+DAY = sqlite_schema.iso_day('NEW.visit_date')
+
+FORWARD = [
+    "DROP TRIGGER visits_derive_day_insert",
+    "DROP TRIGGER visits_derive_day_update",
+    CHECK_DAY.format(op='insert', OP='INSERT', day=DAY),
+    CHECK_DAY.format(op='update', OP='UPDATE OF visit_date, visit_day', day=DAY),
+]
+
+BACKWARD = [
+    "DROP TRIGGER visits_check_day_insert",
+    "DROP TRIGGER visits_check_day_update",
+    sqlite_schema.DERIVE_DAY.format(op='insert', OP='INSERT', day=DAY),
+    sqlite_schema.DERIVE_DAY.format(op='update', OP='UPDATE OF visit_date, visit_day', day=DAY),
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polyclinic_app', '0013_operator_grants'),
+    ]
+
+    operations = [
+        SQLiteOnlySQL(FORWARD, reverse_sql=BACKWARD),
+    ]
@@ -0,0 +1,77 @@
+from importlib import import_module
+
+from django.db import migrations
+
+from polyclinic_app.migration_ops import SQLiteOnlySQL
+
+
+sqlite_schema = import_module('polyclinic_app.migrations.0009_sqlite_schema')
+check_day = import_module('polyclinic_app.migrations.0014_sqlite_check_visit_day')
+
+# День недели снова выводится из даты, как в validate_visit PostgreSQL:
+# Visit.objects.update(visit_date=...) и прямой SQL без visit_day
+# работают на обеих СУБД. Триггер SQLite не может изменить NEW, поэтому
+# день исправляется вторым UPDATE после записи (visits_derive_day из 0009;
+# recursive_triggers выключен, а WHEN останавливает повтор). Чтобы этот
+# UPDATE не оставлял в истории лишнюю строку 'U', история визитов не
+# пишет прежнюю строку с днём, расходящимся с датой: такая бывает только
+# промежуточной. Вставка пишет в историю уже выведенный день.
+VISITS_HISTORY = """
+    CREATE TRIGGER visits_history_{op}
+    AFTER {OP} ON visits
+    {when}
+    BEGIN
+        INSERT INTO visits_history (operation_type, {columns}, current_record_id)
+        VALUES ('{code}', {values}, {current});
+    END
+"""
+
+COLUMNS = sqlite_schema.HISTORY_COLUMNS['visits']
+
+
+def visits_history(op, code, row, current, day=None, when=''):
+    values = ', '.join(
+        day if day and column == 'visit_day' else f'{row}.{column}'
+        for column in COLUMNS.split(', ')
+    )
+    return VISITS_HISTORY.format(
+        op=op, OP=op.upper(), when=when, columns=COLUMNS,
+        code=code, values=values, current=current,
+    )
+
+
+DAY = sqlite_schema.iso_day('NEW.visit_date')
+OLD_DAY = sqlite_schema.iso_day('OLD.visit_date')
+
+FORWARD = [
+    "DROP TRIGGER visits_check_day_insert",
+    "DROP TRIGGER visits_check_day_update",
+    sqlite_schema.DERIVE_DAY.format(op='insert', OP='INSERT', day=DAY),
+    sqlite_schema.DERIVE_DAY.format(op='update', OP='UPDATE OF visit_date, visit_day', day=DAY),
+    "DROP TRIGGER visits_history_insert",
+    "DROP TRIGGER visits_history_update",
+    visits_history('insert', 'I', 'NEW', 'NEW.id', day=DAY),
+    visits_history('update', 'U', 'OLD', 'OLD.id', when=f'WHEN OLD.visit_day IS {OLD_DAY}'),
+]
+
+BACKWARD = [
+    "DROP TRIGGER visits_derive_day_insert",
+    "DROP TRIGGER visits_derive_day_update",
+    check_day.CHECK_DAY.format(op='insert', OP='INSERT', day=DAY),
+    check_day.CHECK_DAY.format(op='update', OP='UPDATE OF visit_date, visit_day', day=DAY),
+    "DROP TRIGGER visits_history_insert",
+    "DROP TRIGGER visits_history_update",
+    visits_history('insert', 'I', 'NEW', 'NEW.id'),
+    visits_history('update', 'U', 'OLD', 'OLD.id'),
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polyclinic_app', '0014_sqlite_check_visit_day'),
+    ]
+
+    operations = [
+        SQLiteOnlySQL(FORWARD, reverse_sql=BACKWARD),
+    ]
@@ -1,5 +1,6 @@
 ﻿from django.db import models
 from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils import timezone
 
 
@@ -21,6 +22,45 @@ class Stat(models.TextChoices):
     COMPLETED = 'completed', 'completed'
     CANCELLED = 'cancelled', 'cancelled'
 
+class JobStatus(models.TextChoices):
+    QUEUED = 'queued', 'queued'
+    RUNNING = 'running', 'running'
+    DONE = 'done', 'done'
+    FAILED = 'failed', 'failed'
+
+class NotificationKind(models.TextChoices):
+    BOOKED = 'booked', 'booked'
+    CHANGED = 'changed', 'changed'
+    CANCELLED = 'cancelled', 'cancelled'
+    REMINDER = 'reminder', 'reminder'
+
+class NotificationStatus(models.TextChoices):
+    PENDING = 'pending', 'pending'
+    SENT = 'sent', 'sent'
+    FAILED = 'failed', 'failed'
+    CANCELLED = 'cancelled', 'cancelled'
+
+class EnumField(models.CharField):
+    """Строковое поле над перечислением PostgreSQL (week_day, sex, stat).
+
+    Тип столбца нужен bulk_create и bulk_update: иначе значения приводятся
+    к varchar, и PostgreSQL отказывается записывать их в столбец-перечисление.
+    """
+
+    def __init__(self, *args, enum_type, **kwargs):
+        self.enum_type = enum_type
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['enum_type'] = self.enum_type
+        return name, path, args, kwargs
+
+    def db_type(self, connection):
+        if connection.vendor == 'postgresql':
+            return self.enum_type
+        return super().db_type(connection)
+
 class Spec(models.Model):
     id = models.AutoField(primary_key=True)
     name = models.TextField(unique=True)
@@ -52,7 +92,7 @@ class Patient(models.Model):
     fname = models.TextField()
     lname = models.TextField()
     birth_date = models.DateField()
-    gender = models.CharField(max_length=1, choices=Sex.choices)
+    gender = EnumField(max_length=1, choices=Sex.choices, enum_type='sex')
     phone = models.TextField(blank=True, null=True)
     registered = models.DateField(default=timezone.now)
     
@@ -64,16 +104,16 @@ class Patient(models.Model):
         return f"{self.lname} {self.fname}"
 
 class DocSchedule(models.Model):
-    id = models.AutoField(primary_key=True)
+    # Ключ таблицы в bd_project.sql — (doctor_id, day), отдельного id нет
+    pk = models.CompositePrimaryKey('doctor', 'day')
     doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, db_column='doctor_id')
-    day = models.CharField(max_length=1, choices=WeekDay.choices)
+    day = EnumField(max_length=1, choices=WeekDay.choices, enum_type='week_day')
     start_time = models.TimeField()
     end_time = models.TimeField()
     
     class Meta:
         db_table = 'doc_schedule'
         managed = False
-        unique_together = ('doctor_id', 'day')
     
     def __str__(self):
         return f"{self.doctor_id} - {self.day}: {self.start_time}-{self.end_time}"
@@ -93,12 +133,16 @@ class Visit(models.Model):
     id = models.AutoField(primary_key=True)
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, db_column='patient_id')
     doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, db_column='doctor_id')
-    visit_day = models.CharField(max_length=1, choices=WeekDay.choices)
+    # Выводится из visit_date (см. sync_visit_day): в PostgreSQL — триггером
+    # validate_visit, в SQLite — visits_derive_day (миграция 0015)
+    visit_day = EnumField(max_length=1, choices=WeekDay.choices, enum_type='week_day',
+                          editable=False, blank=True)
     visit_date = models.DateField()
     visit_time = models.TimeField()
     diagnos = models.ForeignKey(Diagnosis, on_delete=models.SET_NULL, null=True, blank=True, db_column='diagnos_id')
-    status = models.CharField(max_length=10, choices=Stat.choices, default=Stat.SCHEDULED)
+    status = EnumField(max_length=10, choices=Stat.choices, default=Stat.SCHEDULED, enum_type='stat')
     created = models.DateField(default=timezone.now)
+    version = models.IntegerField(default=1)  # растёт при каждой правке
     
     class Meta:
         db_table = 'visits'
@@ -107,8 +151,18 @@ class Visit(models.Model):
     
     def __str__(self):
         return f"Visit #{self.id}"
+
+    def sync_visit_day(self):
+        """Выставляет день недели (ISO, 1 = понедельник) по дате визита"""
+        if self.visit_date:
+            self.visit_day = str(self.visit_date.isoweekday())
+
+    def save(self, *args, **kwargs):
+        self.sync_visit_day()
+        super().save(*args, **kwargs)
     
     def clean(self):
+        self.sync_visit_day()
 
         errors = {}
         
@@ -145,4 +199,83 @@ class Recipe(models.Model):
         managed = False
     
     def __str__(self):
-        return self.drug
\ No newline at end of file
+        return self.drug
+
+
+class Job(models.Model):
+    """Фоновая задача; очередь живёт в таблице jobs, её разбирает manage.py runworker"""
+    id = models.AutoField(primary_key=True)
+    name = models.CharField(max_length=64)
+    payload = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=10, choices=JobStatus.choices, default=JobStatus.QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    result = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    error = models.TextField(blank=True)
+    run_after = models.DateTimeField(default=timezone.now)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    # До этого момента задача занята воркером (см. jobs.heartbeat)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'jobs'
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='jobs_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f"Job #{self.id} {self.name} ({self.status})"
+
+
+class CacheGeneration(models.Model):
+    """Поколение закэшированных данных (см. analytics.invalidate).
+
+    Хранится в БД, а не в кэше: кэш по умолчанию (locmem) у каждого
+    процесса свой, и сброс в одном воркере другие не увидели бы.
+    """
+    name = models.CharField(max_length=64, primary_key=True)
+    value = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'cache_generations'
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+class Notification(models.Model):
+    """Уведомление пациенту о визите (outbox).
+
+    Пишется в той же транзакции, что и изменение визита, а отправляет его
+    manage.py dispatch_notifications, когда наступит send_after. Данные
+    визита для текста сохраняются в payload: к отправке визит может
+    измениться или быть удалён.
+    """
+    id = models.BigAutoField(primary_key=True)
+    visit = models.ForeignKey(Visit, on_delete=models.DO_NOTHING, db_constraint=False, null=True)
+    patient = models.ForeignKey(Patient, on_delete=models.DO_NOTHING, db_constraint=False)
+    kind = models.CharField(max_length=10, choices=NotificationKind.choices)
+    payload = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=10, choices=NotificationStatus.choices,
+                              default=NotificationStatus.PENDING)
+    send_after = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # Пачка, в которой отправитель взял уведомление (см. notifications.claim_and_send)
+    claim = models.UUIDField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    sent = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'notifications'
+        indexes = [
+            # Очередь к отправке: только ожидающие, по времени
+            models.Index(fields=['send_after'], name='notifications_due_idx',
+                         condition=models.Q(status='pending')),
+            models.Index(fields=['visit', 'status'], name='notifications_visit_idx'),
+        ]
+
+    def __str__(self):
+        return f"Notification #{self.id} {self.kind} -> {self.patient_id} ({self.status})"
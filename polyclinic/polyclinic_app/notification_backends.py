@@ -0,0 +1,73 @@
+import json
+import sys
+import threading
+
+from django.conf import settings
+from django.utils import timezone
+
+from .notifications import message_text
+
+
+class BaseBackend:
+    """Бэкенд отправки уведомлений.
+
+    send_messages получает пачку и возвращает {id уведомления: текст ошибки}
+    для неотправленных; по умолчанию вызывает send для каждого.
+    """
+
+    def send(self, notification, text):
+        raise NotImplementedError
+
+    def send_messages(self, notifications):
+        errors = {}
+        for notification in notifications:
+            try:
+                self.send(notification, message_text(notification))
+            except Exception as exc:
+                errors[notification.id] = f'{type(exc).__name__}: {exc}'
+        return errors
+
+
+class ConsoleBackend(BaseBackend):
+    """Печатает уведомления в stdout — для разработки"""
+
+    stream = sys.stdout
+
+    def send_messages(self, notifications):
+        lines = [
+            f'[{n.kind}] {n.patient.phone or "—"} {n.patient}: {message_text(n)}\n'
+            for n in notifications
+        ]
+        self.stream.write(''.join(lines))
+        self.stream.flush()
+        return {}
+
+
+class FileBackend(BaseBackend):
+    """Дописывает уведомления строками JSON в settings.NOTIFICATION_FILE_PATH.
+
+    Пачка пишется одним вызовом write в файл, открытый на дозапись, поэтому
+    строки разных процессов не перемешиваются.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, path=None):
+        self.path = path or settings.NOTIFICATION_FILE_PATH
+
+    def send_messages(self, notifications):
+        sent_at = timezone.now().isoformat()
+        data = ''.join(
+            json.dumps({
+                'id': n.id,
+                'kind': n.kind,
+                'patient_id': n.patient_id,
+                'phone': n.patient.phone,
+                'text': message_text(n),
+                'sent': sent_at,
+            }, ensure_ascii=False) + '\n'
+            for n in notifications
+        )
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(data)
+        return {}
@@ -0,0 +1,307 @@
+import logging
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Notification, NotificationKind, NotificationStatus, Patient, Stat, Visit
+
+
+logger = logging.getLogger(__name__)
+
+# За сколько до визита отправляется напоминание
+REMINDER_BEFORE = timedelta(hours=24)
+# Неудачная отправка повторяется через RETRY_DELAY * 2**(попытка-1)
+RETRY_DELAY = timedelta(minutes=1)
+MAX_ATTEMPTS = 5
+# На это время взятая пачка уходит из очереди (send_after сдвигается
+# вперёд). Пока бэкенд отправляет, срок продлевается каждые CLAIM_RENEW_EVERY;
+# если отправитель упадёт, пачка вернётся по его истечении
+CLAIM_LEASE = timedelta(minutes=5)
+CLAIM_RENEW_EVERY = timedelta(minutes=1)
+
+TEXTS = {
+    NotificationKind.BOOKED: 'Вы записаны на приём {date} в {time}, врач {doctor}.',
+    NotificationKind.CHANGED: 'Запись изменена: приём {date} в {time}, врач {doctor}.',
+    NotificationKind.CANCELLED: 'Приём {date} в {time} у врача {doctor} отменён.',
+    NotificationKind.REMINDER: 'Напоминаем о приёме {date} в {time}, врач {doctor}.',
+}
+
+
+def message_text(notification):
+    """Текст уведомления по снимку визита в payload"""
+    return TEXTS[notification.kind].format(**notification.payload)
+
+
+def get_backend():
+    """Экземпляр бэкенда отправки из settings.NOTIFICATION_BACKEND"""
+    return import_string(settings.NOTIFICATION_BACKEND)()
+
+
+def _visit_at(visit_date, visit_time):
+    return timezone.make_aware(datetime.combine(visit_date, visit_time))
+
+
+def _payload(visit_date, visit_time, doctor_name):
+    return {
+        'date': visit_date.strftime('%d.%m.%Y'),
+        'time': visit_time.strftime('%H:%M'),
+        'doctor': doctor_name,
+    }
+
+
+def _for_visit(visit_id, patient_id, visit_date, visit_time, doctor_name, kind):
+    """Сообщение kind о визите и, для действующей записи, напоминание"""
+    payload = _payload(visit_date, visit_time, doctor_name)
+    now = timezone.now()
+    notifications = [
+        Notification(visit_id=visit_id, patient_id=patient_id, kind=kind, payload=payload),
+    ]
+
+    visit_at = _visit_at(visit_date, visit_time)
+    if kind != NotificationKind.CANCELLED and visit_at > now:
+        notifications.append(Notification(
+            visit_id=visit_id,
+            patient_id=patient_id,
+            kind=NotificationKind.REMINDER,
+            payload=payload,
+            send_after=max(now, visit_at - REMINDER_BEFORE),
+        ))
+    return notifications
+
+
+def _drop_reminders(visit_ids):
+    Notification.objects.filter(
+        visit_id__in=visit_ids,
+        kind=NotificationKind.REMINDER,
+        status=NotificationStatus.PENDING,
+    ).update(status=NotificationStatus.CANCELLED)
+
+
+def visit_booked(visit):
+    """Подтверждение записи и напоминание; вызывается в транзакции создания визита.
+
+    Как и в visit_changed, пациенту сообщается только о запланированном
+    визите: завершённый или отменённый оператор лишь вносит в базу.
+    """
+    if visit.status != Stat.SCHEDULED:
+        return
+    Notification.objects.bulk_create(_for_visit(
+        visit.id, visit.patient_id, visit.visit_date, visit.visit_time,
+        str(visit.doctor), NotificationKind.BOOKED,
+    ))
+
+
+def visit_changed(old, visit):
+    """Уведомления после правки визита old -> visit (в той же транзакции).
+
+    Пациент узнаёт об отмене или о переносе (другие врач, дата или время);
+    правка диагноза и завершение визита только снимают напоминание.
+    """
+    moved = (old.doctor_id, old.visit_date, old.visit_time) != (
+        visit.doctor_id, visit.visit_date, visit.visit_time)
+    same_patient = old.patient_id == visit.patient_id
+    cancelled = visit.status == Stat.CANCELLED and old.status != Stat.CANCELLED
+
+    if old.status == visit.status == Stat.SCHEDULED and not moved and same_patient:
+        return
+    _drop_reminders([visit.id])
+
+    if cancelled or (not same_patient and old.status == Stat.SCHEDULED):
+        # Отмена приходит тому пациенту, который был записан
+        Notification.objects.create(
+            visit_id=visit.id,
+            patient_id=old.patient_id,
+            kind=NotificationKind.CANCELLED,
+            payload=_payload(old.visit_date, old.visit_time, str(old.doctor)),
+        )
+    if visit.status == Stat.SCHEDULED:
+        rebooked = not same_patient or old.status != Stat.SCHEDULED
+        kind = NotificationKind.BOOKED if rebooked else NotificationKind.CHANGED
+        Notification.objects.bulk_create(_for_visit(
+            visit.id, visit.patient_id, visit.visit_date, visit.visit_time, str(visit.doctor), kind,
+        ))
+
+
+def visit_deleted(visit):
+    """Снимает напоминание удаляемого визита и сообщает об отмене записи"""
+    _drop_reminders([visit.id])
+    if visit.status == Stat.SCHEDULED:
+        Notification.objects.create(
+            visit_id=visit.id,
+            patient_id=visit.patient_id,
+            kind=NotificationKind.CANCELLED,
+            payload=_payload(visit.visit_date, visit.visit_time, str(visit.doctor)),
+        )
+
+
+def cancel_visits(visits):
+    """Отменяет запланированные визиты из queryset visits с уведомлениями.
+
+    Визиты блокируются и отменяются в одной транзакции с записью
+    уведомлений; возвращает число отменённых.
+    """
+    with transaction.atomic():
+        rows = list(
+            visits.filter(status=Stat.SCHEDULED)
+            .select_for_update(of=('self',))
+            .values_list(
+                'id', 'patient_id', 'visit_date', 'visit_time',
+                'doctor__lname', 'doctor__fname',
+            )
+        )
+        if not rows:
+            return 0
+
+        ids = [row[0] for row in rows]
+        Visit.objects.filter(id__in=ids).update(status=Stat.CANCELLED, version=F('version') + 1)
+        _drop_reminders(ids)
+        # О прошедших визитах, оставшихся запланированными, не сообщаем
+        today = timezone.localdate()
+        Notification.objects.bulk_create([
+            Notification(
+                visit_id=visit_id,
+                patient_id=patient_id,
+                kind=NotificationKind.CANCELLED,
+                payload=_payload(visit_date, visit_time, f'{lname} {fname}'),
+            )
+            for visit_id, patient_id, visit_date, visit_time, lname, fname in rows
+            if visit_date >= today
+        ], batch_size=1000)
+    return len(rows)
+
+
+def _is_stale(notification, patients):
+    """Уведомление удалённому пациенту, о визите, которого больше нет, или
+    напоминание о неактуальном визите.
+
+    Сообщение об отмене отправляется и после удаления визита: visit_deleted
+    пишет его перед удалением.
+    """
+    if notification.patient_id not in patients:
+        return True
+    if notification.visit_id is None or notification.kind == NotificationKind.CANCELLED:
+        return False
+    if notification.visit is None:
+        return True
+    return notification.kind == NotificationKind.REMINDER and notification.visit.status != Stat.SCHEDULED
+
+
+@contextmanager
+def _keep_claimed(ids, token):
+    """Продлевает срок пачки, взятой с токеном token, пока выполняется блок with.
+
+    Как jobs.heartbeat: отдельный поток со своим подключением, сбой одного
+    продления не останавливает следующие.
+    """
+    stopped = threading.Event()
+
+    def renew():
+        try:
+            while not stopped.wait(CLAIM_RENEW_EVERY.total_seconds()):
+                try:
+                    Notification.objects.filter(
+                        id__in=ids, claim=token, status=NotificationStatus.PENDING,
+                    ).update(send_after=timezone.now() + CLAIM_LEASE)
+                except DatabaseError:
+                    logger.exception("Не удалось продлить пачку уведомлений %s", token)
+                    connections.close_all()
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=renew, name=f'notifications-{token}', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def claim_and_send(backend, batch_size):
+    """Отправляет одну пачку наступивших уведомлений; возвращает (отправлено, ошибок).
+
+    Пачка выбирается SELECT ... FOR UPDATE SKIP LOCKED, и в той же
+    короткой транзакции её строки помечаются токеном claim, а send_after
+    сдвигается на CLAIM_LEASE: после фиксации параллельные процессы
+    dispatch_notifications её не видят, а отправка идёт без открытой
+    транзакции и блокировок строк. Пока бэкенд работает, срок продлевается;
+    итог записывается только в строки, которые всё ещё ждут отправки и
+    помечены этим токеном, поэтому отправитель, потерявший пачку, не
+    затирает попытки и расписание нового владельца.
+    """
+    now = timezone.now()
+    token = uuid.uuid4()
+    with transaction.atomic():
+        while True:
+            batch = list(
+                Notification.objects.select_for_update(skip_locked=True, of=('self',))
+                .select_related('visit')
+                .filter(status=NotificationStatus.PENDING, send_after__lte=now)
+                .order_by('send_after')[:batch_size]
+            )
+            if not batch:
+                return 0, 0
+            # Пациенты — отдельным запросом: при JOIN уведомление удалённого
+            # пациента не попало бы в выборку и осталось бы в очереди навсегда
+            patients = Patient.objects.in_bulk({n.patient_id for n in batch})
+
+            # Визит или пациент могли быть удалены, а визит отменён в обход
+            # visit_deleted и cancel_visits (админка, каскад, прямой SQL):
+            # такие уведомления снимаются, а пачка добирается из очереди
+            stale = {n.id for n in batch if _is_stale(n, patients)}
+            if stale:
+                Notification.objects.filter(id__in=stale).update(
+                    status=NotificationStatus.CANCELLED,
+                    error='Визит или пациент удалён либо визит отменён до отправки',
+                )
+                batch = [n for n in batch if n.id not in stale]
+            if batch:
+                break
+        for notification in batch:
+            notification.patient = patients[notification.patient_id]
+        ids = [n.id for n in batch]
+        Notification.objects.filter(id__in=ids).update(claim=token, send_after=now + CLAIM_LEASE)
+
+    try:
+        with _keep_claimed(ids, token):
+            errors = backend.send_messages(batch)
+    except Exception as exc:
+        # Сбой бэкенда целиком — неудачная попытка для всей пачки
+        logger.exception("Бэкенд не отправил пачку уведомлений")
+        errors = dict.fromkeys(ids, f'{type(exc).__name__}: {exc}')
+
+    now = timezone.now()
+    # Пока пачка отправлялась, уведомление могли отменить или, после
+    # истечения срока, взять другим отправителем: такие строки не трогаем
+    claimed = Notification.objects.filter(claim=token, status=NotificationStatus.PENDING)
+    with transaction.atomic():
+        sent_ids = [n.id for n in batch if n.id not in errors]
+        claimed.filter(id__in=sent_ids).update(
+            status=NotificationStatus.SENT,
+            sent=now,
+            attempts=F('attempts') + 1,
+        )
+
+        # Пока строка помечена токеном, её попытки не менялись с момента
+        # взятия, поэтому статус и повтор считаются по прочитанному числу
+        failed = [n for n in batch if n.id in errors]
+        retries = {}
+        for notification in failed:
+            key = (notification.attempts + 1, errors[notification.id])
+            retries.setdefault(key, []).append(notification.id)
+        for (attempts, error), failed_ids in retries.items():
+            if attempts >= MAX_ATTEMPTS:
+                changes = {'status': NotificationStatus.FAILED}
+            else:
+                changes = {'send_after': now + RETRY_DELAY * 2 ** (attempts - 1)}
+            claimed.filter(id__in=failed_ids).update(
+                attempts=F('attempts') + 1, error=error, **changes,
+            )
+    return len(sent_ids), len(failed)
@@ -0,0 +1,281 @@
+import json
+import re
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from django.db import connection, transaction
+
+from .models import Patient, Sex
+
+
+# Ключ телефона — последние 10 цифр: +7 916 111-22-33, 89161112233 и
+# 9161112233 совпадают. Выражение то же, что в индексе patients_phone_key_idx.
+PHONE_KEY_SQL = r"right(regexp_replace(phone, '\D', '', 'g'), 10)"
+
+MATCH_BY_PHONE_SQL = f"""
+    SELECT id, lower(lname), lower(fname), birth_date, gender, phone
+    FROM patients
+    WHERE {PHONE_KEY_SQL} = ANY(%s)
+"""
+
+MATCH_BY_NAME_SQL = """
+    SELECT id, lower(lname), lower(fname), birth_date, gender, phone
+    FROM patients
+    WHERE (lower(lname), birth_date) IN (SELECT * FROM unnest(%s::text[], %s::date[]))
+"""
+
+# SQLite: regexp_replace нет, из телефона удаляются обычные разделители;
+# выражение совпадает с индексом patients_phone_key_idx из 0009_sqlite_schema.
+PHONE_KEY_SQLITE = """substr(replace(replace(replace(replace(replace(replace(
+            phone, '+', ''), '-', ''), ' ', ''), '(', ''), ')', ''), '.', ''), -10)"""
+
+MATCH_BY_PHONE_SQLITE_SQL = f"""
+    SELECT id, lname, fname, birth_date, gender, phone
+    FROM patients
+    WHERE {PHONE_KEY_SQLITE} IN (SELECT value FROM json_each(%s))
+"""
+
+# lower() в SQLite не понимает кириллицу: кандидаты выбираются по дате
+# рождения (индекс patients_birth_lname_idx), фамилия сравнивается в PatientIndex
+MATCH_BY_NAME_SQLITE_SQL = """
+    SELECT id, lname, fname, birth_date, gender, phone
+    FROM patients
+    WHERE birth_date IN (SELECT value FROM json_each(%s))
+"""
+
+GENDERS = {
+    'm': Sex.MALE, 'м': Sex.MALE, 'муж': Sex.MALE,
+    'f': Sex.FEMALE, 'ж': Sex.FEMALE, 'жен': Sex.FEMALE,
+}
+DATE_FORMATS = ('%Y-%m-%d', '%d.%m.%Y')
+
+
+class InvalidRow(ValueError):
+    """Строку файла нельзя превратить в пациента"""
+
+
+# В телефоне допустимы только цифры, ведущий + и обычные разделители;
+# буквы (добавочный номер, «доб.», «ext») делают номер нечитаемым
+PHONE_CHARS = re.compile(r'\+?[\d\s().-]+')
+
+
+def phone_key(phone):
+    """Последние 10 цифр телефона (ключ индекса patients_phone_key_idx) или None"""
+    digits = re.sub(r'\D', '', phone or '')
+    return digits[-10:] or None
+
+
+def normalize_phone(phone):
+    """Телефон в едином виде или None, если он не указан.
+
+    Российский номер (10 цифр или 11 с 7/8 в начале) приводится к
+    +7XXXXXXXXXX, международный с «+» — к «+» и цифрам (E.164, 8–15 цифр).
+    Номер, который так не читается (короткий, с добавочным, с буквами),
+    поднимает InvalidRow: менять или отбрасывать его молча нельзя.
+    """
+    raw = (phone or '').strip()
+    if not raw:
+        return None
+    digits = re.sub(r'\D', '', raw)
+    if PHONE_CHARS.fullmatch(raw):
+        if raw.startswith('+'):
+            if digits.startswith('7') and len(digits) == 11:
+                return f'+{digits}'
+            if not digits.startswith('7') and 8 <= len(digits) <= 15:
+                return f'+{digits}'
+        elif len(digits) == 11 and digits[0] in '78':
+            return f'+7{digits[1:]}'
+        elif len(digits) == 10:
+            return f'+7{digits}'
+    raise InvalidRow(f'неверный телефон: {raw!r}')
+
+
+def _stored_phone(phone):
+    # Телефон из базы: записанный в другом виде сравнивается после
+    # приведения, нечитаемый по телефону не сопоставляется
+    try:
+        return normalize_phone(phone)
+    except InvalidRow:
+        return None
+
+
+def parse_row(row):
+    """Пациент (без сохранения) из строки CSV с колонками
+    fname, lname, birth_date, gender, phone"""
+    fname = (row.get('fname') or '').strip()
+    lname = (row.get('lname') or '').strip()
+    if not fname or not lname:
+        raise InvalidRow('не указаны имя или фамилия')
+
+    raw_date = (row.get('birth_date') or '').strip()
+    for fmt in DATE_FORMATS:
+        try:
+            birth_date = datetime.strptime(raw_date, fmt).date()
+            break
+        except ValueError:
+            continue
+    else:
+        raise InvalidRow(f'неверная дата рождения: {raw_date!r}')
+
+    raw_gender = (row.get('gender') or '').strip().lower()
+    if raw_gender and raw_gender not in GENDERS:
+        raise InvalidRow(f'неизвестный пол: {raw_gender!r}')
+
+    return Patient(
+        fname=fname,
+        lname=lname,
+        birth_date=birth_date,
+        gender=GENDERS.get(raw_gender),
+        phone=normalize_phone(row.get('phone')),
+    )
+
+
+@dataclass
+class ImportStats:
+    read: int = 0
+    inserted: int = 0
+    merged: int = 0  # дубликаты, у которых дополнены пустые поля
+    duplicates: int = 0  # дубликаты существующих пациентов без изменений
+    in_file: int = 0  # повторы внутри самого файла
+    invalid: list = field(default_factory=list)  # (номер строки, причина)
+
+
+class _Candidate:
+    """Пациент, с которым сравниваются строки файла"""
+
+    def __init__(self, patient, lname=None, fname=None, stored=False):
+        self.patient = patient
+        self.stored = stored  # пациент из базы, а не строка файла
+        self.lname = (lname or patient.lname).lower()
+        self.fname = (fname or patient.fname).lower()
+        self.birth_date = patient.birth_date
+        self.phone = _stored_phone(patient.phone)
+
+    def same_person(self, patient):
+        # Один телефон бывает у всей семьи: совпадение по блоку телефона
+        # подтверждается датой рождения или полным именем
+        if self.lname != patient.lname.lower():
+            return False
+        return self.fname == patient.fname.lower() or self.birth_date == patient.birth_date
+
+
+class PatientIndex:
+    """Блокирующий индекс: кандидаты по телефону и по (фамилия, дата рождения).
+
+    Телефоны сравниваются целиком после normalize_phone: номера с общими
+    последними цифрами, но из разных стран, в один блок не попадают.
+    """
+
+    def __init__(self):
+        self.by_phone = {}
+        self.by_name = {}
+
+    def add(self, candidate):
+        self.add_phone(candidate)
+        self.by_name.setdefault((candidate.lname, candidate.birth_date), []).append(candidate)
+
+    def add_phone(self, candidate):
+        if candidate.phone:
+            self.by_phone.setdefault(candidate.phone, []).append(candidate)
+
+    def find(self, patient):
+        for candidate in self.by_phone.get(patient.phone, ()) if patient.phone else ():
+            if candidate.same_person(patient):
+                return candidate
+        for candidate in self.by_name.get((patient.lname.lower(), patient.birth_date), ()):
+            if candidate.fname == patient.fname.lower():
+                return candidate
+        return None
+
+
+def _fill_blanks(candidate, patient):
+    """Дополняет пустые телефон и пол кандидата данными patient; True, если изменён"""
+    target = candidate.patient
+    changed = False
+    if not target.phone and patient.phone:
+        target.phone = candidate.phone = patient.phone
+        changed = True
+    if not target.gender and patient.gender:
+        target.gender = patient.gender
+        changed = True
+    return changed
+
+
+def import_chunk(rows, stats, seen=None, dry_run=False):
+    """Сохраняет пачку пациентов одной транзакцией.
+
+    Кандидаты в дубликаты выбираются из patients двумя запросами по
+    индексам (ключ телефона; фамилия + дата рождения) и сравниваются
+    только внутри своего блока. Повторы внутри файла ищутся в seen —
+    PatientIndex, общем для всех пачек файла, куда попадает каждая
+    принятая строка. Новые пациенты вставляются bulk_create, у найденных
+    дополняются пустые телефон и пол. При dry_run транзакция откатывается.
+    """
+    if seen is None:
+        seen = PatientIndex()
+    with transaction.atomic():
+        existing = _find_existing(rows)
+
+        to_insert, to_update = [], {}
+        for patient in rows:
+            candidate = seen.find(patient)
+            if candidate is not None:
+                stats.in_file += 1
+            else:
+                candidate = existing.find(patient)
+                if candidate is None:
+                    candidate = _Candidate(patient)
+                    seen.add(candidate)
+                    to_insert.append(patient)
+                    continue
+
+            phone = candidate.phone
+            changed = _fill_blanks(candidate, patient)
+            if candidate.phone != phone:
+                (existing if candidate.stored else seen).add_phone(candidate)
+
+            target = candidate.patient
+            if candidate.stored:
+                if changed:
+                    to_update[target.pk] = target
+                    stats.merged += 1
+                else:
+                    stats.duplicates += 1
+            elif changed and target.pk is not None:
+                # Строка файла, сохранённая в одной из прошлых пачек
+                to_update[target.pk] = target
+
+        Patient.objects.bulk_create(to_insert)
+        Patient.objects.bulk_update(to_update.values(), ['phone', 'gender'])
+        stats.inserted += len(to_insert)
+        if dry_run:
+            transaction.set_rollback(True)
+
+
+def _find_existing(rows):
+    """PatientIndex пациентов базы, похожих на строки rows"""
+    existing = PatientIndex()
+    sqlite = connection.vendor == 'sqlite'
+    with connection.cursor() as cursor:
+        keys = sorted({key for key in (phone_key(p.phone) for p in rows) if key})
+        if not keys:
+            found = []
+        elif sqlite:
+            cursor.execute(MATCH_BY_PHONE_SQLITE_SQL, [json.dumps(keys)])
+            found = cursor.fetchall()
+        else:
+            cursor.execute(MATCH_BY_PHONE_SQL, [keys])
+            found = cursor.fetchall()
+
+        names = sorted({(p.lname.lower(), p.birth_date) for p in rows})
+        if sqlite:
+            dates = sorted({n[1].isoformat() for n in names})
+            cursor.execute(MATCH_BY_NAME_SQLITE_SQL, [json.dumps(dates)])
+        else:
+            cursor.execute(MATCH_BY_NAME_SQL, [[n[0] for n in names], [n[1] for n in names]])
+        found += cursor.fetchall()
+
+    for pk, (lname, fname, birth_date, gender, phone) in {row[0]: row[1:] for row in found}.items():
+        patient = Patient(pk=pk, birth_date=birth_date, gender=gender, phone=phone)
+        existing.add(_Candidate(patient, lname, fname, stored=True))
+    return existing
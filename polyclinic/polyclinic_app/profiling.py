@@ -0,0 +1,177 @@
+import cProfile
+import io
+import json
+import pstats
+import re
+import time
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+
+
+# Сколько последних профилей хранить в PROFILING_DIR
+PROFILES_KEEP = 200
+# Функций в текстовом отчёте cProfile
+TOP_FUNCTIONS = 40
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_PARAM = '_profile'
+
+
+class ProfilingMiddleware:
+    """Профилирование отдельных запросов по требованию оператора.
+
+    Включается настройкой PROFILING_ENABLED; профилируется только запрос
+    оператора с заголовком X-Profile или параметром ?_profile. Значение
+    «sample» выбирает семплирующий pyinstrument, если он установлен, иначе
+    используется cProfile. Профиль и хронология SQL сохраняются в
+    PROFILING_DIR, их список — на странице profile_list.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = request.META.get(PROFILE_HEADER) or request.GET.get(PROFILE_PARAM)
+        if mode is None or not request.session.get('is_operator', False):
+            return self.get_response(request)
+        return self.profile(request, mode)
+
+    def profile(self, request, mode):
+        sampler = _sampler() if mode == 'sample' else None
+        profiler = sampler or cProfile.Profile()
+        timeline = SQLTimeline()
+
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(timeline))
+            timeline.started = time.perf_counter()
+            profiler.start() if sampler else profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.stop() if sampler else profiler.disable()
+            total_ms = (time.perf_counter() - timeline.started) * 1000
+
+        match = request.resolver_match
+        name = save_profile(
+            profiler=profiler,
+            sampled=sampler is not None,
+            meta={
+                'path': request.get_full_path(),
+                'method': request.method,
+                'view': match.view_name if match else '',
+                'status': response.status_code,
+                'total_ms': round(total_ms, 1),
+                'sql_count': len(timeline.queries),
+                'sql_ms': round(sum(q['duration_ms'] for q in timeline.queries), 1),
+                'created': timezone.now().isoformat(),
+                'queries': timeline.queries,
+            },
+        )
+        response['X-Profile-Id'] = name
+        return response
+
+
+class SQLTimeline:
+    """Обёртка execute: время начала и длительность каждого запроса"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            finished = time.perf_counter()
+            self.queries.append({
+                'alias': context['connection'].alias,
+                'start_ms': round((started - self.started) * 1000, 2),
+                'duration_ms': round((finished - started) * 1000, 2),
+                'sql': sql,
+            })
+
+
+def _sampler():
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        return None
+    return Profiler(interval=0.001)
+
+
+def profiles_dir():
+    path = Path(settings.PROFILING_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def save_profile(profiler, sampled, meta):
+    """Сохраняет профиль и метаданные; возвращает имя профиля"""
+    directory = profiles_dir()
+    view = re.sub(r'[^\w-]+', '-', meta['view'] or 'unknown')
+    name = f"{timezone.now():%Y%m%d-%H%M%S-%f}-{view}"
+
+    if sampled:
+        meta['report'] = profiler.output_text(unicode=True, color=False)
+        (directory / f'{name}.html').write_text(profiler.output_html(), encoding='utf-8')
+    else:
+        profiler.dump_stats(directory / f'{name}.prof')
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+        meta['report'] = out.getvalue()
+    meta['kind'] = 'sample' if sampled else 'cprofile'
+
+    (directory / f'{name}.json').write_text(json.dumps(meta, ensure_ascii=False), encoding='utf-8')
+    _prune(directory)
+    return name
+
+
+def _prune(directory):
+    metas = sorted(directory.glob('*.json'), reverse=True)
+    for stale in metas[PROFILES_KEEP:]:
+        for path in directory.glob(f'{stale.stem}.*'):
+            path.unlink(missing_ok=True)
+
+
+def list_profiles():
+    """Сохранённые профили (без отчёта и запросов), самые долгие первыми"""
+    profiles = []
+    for path in profiles_dir().glob('*.json'):
+        meta = json.loads(path.read_text(encoding='utf-8'))
+        meta.pop('report', None)
+        meta.pop('queries', None)
+        meta['name'] = path.stem
+        profiles.append(meta)
+    return sorted(profiles, key=lambda meta: meta['total_ms'], reverse=True)
+
+
+def load_profile(name):
+    """Метаданные профиля name или None, если его нет"""
+    if not re.fullmatch(r'[\w-]+', name):
+        return None
+    path = profiles_dir() / f'{name}.json'
+    if not path.exists():
+        return None
+    meta = json.loads(path.read_text(encoding='utf-8'))
+    meta['name'] = name
+    return meta
+
+
+def profile_file(name):
+    """Путь к сырому профилю (.prof или .html) или None"""
+    if not re.fullmatch(r'[\w-]+', name):
+        return None
+    for suffix in ('.prof', '.html'):
+        path = profiles_dir() / f'{name}{suffix}'
+        if path.exists():
+            return path
+    return None
@@ -0,0 +1,120 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.shortcuts import render
+
+
+logger = logging.getLogger(__name__)
+
+# SQLSTATE query_canceled: запрос прерван по statement_timeout
+QUERY_CANCELED = '57014'
+
+
+class RowLimitExceeded(DatabaseError):
+    """Запрос вернул больше строк, чем разрешено QUERY_ROW_CAP"""
+
+
+class QueryGuardMiddleware:
+    """Следит за запросами к БД во время обработки запроса.
+
+    Результат больше settings.QUERY_ROW_CAP строк отклоняется, запросы
+    дольше settings.SLOW_QUERY_MS пишутся в журнал с именем
+    представления и планом EXPLAIN.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        guard = QueryGuard(request)
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(guard))
+            return self.get_response(request)
+
+    def process_exception(self, request, exception):
+        if isinstance(exception, RowLimitExceeded):
+            message = 'Слишком много данных для одной страницы. Уточните запрос.'
+        elif _is_query_canceled(exception):
+            message = 'Запрос выполнялся слишком долго и был прерван.'
+        else:
+            return None
+        return render(request, 'polyclinic_app/error.html', {'message': message}, status=503)
+
+
+class QueryGuard:
+
+    def __init__(self, request):
+        self.request = request
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            result = execute(sql, params, many, context)
+        except DatabaseError as exc:
+            if _is_query_canceled(exc):
+                self.log_slow(sql, params, many, context, (time.perf_counter() - started) * 1000)
+            raise
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        if elapsed_ms >= settings.SLOW_QUERY_MS:
+            self.log_slow(sql, params, many, context, elapsed_ms)
+
+        rowcount = context['cursor'].rowcount
+        if not many and rowcount > settings.QUERY_ROW_CAP and _is_select(sql):
+            raise RowLimitExceeded(
+                f'{self.view_name}: запрос вернул {rowcount} строк, '
+                f'разрешено {settings.QUERY_ROW_CAP}'
+            )
+        return result
+
+    @property
+    def view_name(self):
+        match = getattr(self.request, 'resolver_match', None)
+        return match.view_name if match else self.request.path
+
+    def log_slow(self, sql, params, many, context, elapsed_ms):
+        plan = None
+        if not many and _is_select(sql):
+            # Отдельный курсор драйвера: результат исходного запроса ещё не
+            # прочитан, а обёртки Django здесь не нужны
+            connection = context['connection']
+            try:
+                if connection.vendor == 'sqlite':
+                    plan = _sqlite_plan(connection, sql, params)
+                else:
+                    with connection.wrap_database_errors, connection.connection.cursor() as cursor:
+                        cursor.execute(f'EXPLAIN {sql}', params)
+                        plan = '\n'.join(row[0] for row in cursor.fetchall())
+            except DatabaseError:
+                pass
+
+        logger.warning(
+            'Медленный запрос в %s (%s, %.0f мс): %s\n%s',
+            self.view_name, context['connection'].alias, elapsed_ms, sql,
+            plan or 'план недоступен',
+        )
+
+
+def _sqlite_plan(connection, sql, params):
+    # Курсор бэкенда переводит %s в ?; описание шага — последний столбец
+    cursor = connection.create_cursor()
+    try:
+        with connection.wrap_database_errors:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return '\n'.join(row[-1] for row in cursor.fetchall())
+    finally:
+        cursor.close()
+
+
+def _is_query_canceled(exc):
+    # Код ошибки драйвера: sqlstate в psycopg 3, pgcode в psycopg2
+    cause = exc.__cause__
+    return (getattr(cause, 'sqlstate', None) or getattr(cause, 'pgcode', None)) == QUERY_CANCELED
+
+
+def _is_select(sql):
+    return sql.lstrip().upper().startswith(('SELECT', 'WITH'))
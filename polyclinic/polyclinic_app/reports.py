@@ -0,0 +1,65 @@
+from django.db import connection
+from django.utils.dateparse import parse_date
+
+
+DOCTOR_STATS_COLUMNS = [
+    'ID',
+    'Врач',
+    'Специальность',
+    'Всего визитов',
+    'Завершено',
+    'Запланировано',
+    'Отменено',
+    'Первый визит',
+    'Последний визит',
+]
+
+# Считается по visit_daily_rollup, а не по visits: строк в сводке на порядки
+# меньше, а обнулённые ключи (count = 0) в датах первого и последнего визита
+# не учитываются. Запрос одинаков для PostgreSQL и SQLite.
+DOCTOR_STATS_SQL = """
+    SELECT d.id,
+           d.lname || ' ' || d.fname,
+           COALESCE(s.name, '—'),
+           CAST(COALESCE(SUM(r.count), 0) AS integer) AS total_visits,
+           CAST(COALESCE(SUM(r.count) FILTER (WHERE r.status = 'completed'), 0) AS integer),
+           CAST(COALESCE(SUM(r.count) FILTER (WHERE r.status = 'scheduled'), 0) AS integer),
+           CAST(COALESCE(SUM(r.count) FILTER (WHERE r.status = 'cancelled'), 0) AS integer),
+           MIN(r.visit_date),
+           MAX(r.visit_date)
+    FROM doctors d
+    LEFT JOIN spec s ON s.id = d.spec_id
+    LEFT JOIN visit_daily_rollup r ON r.doctor_id = d.id AND r.count > 0
+    GROUP BY d.id, s.name
+    ORDER BY total_visits DESC
+"""
+
+
+def doctor_stats_rows():
+    """Строки отчёта «Статистика врачей» в порядке DOCTOR_STATS_COLUMNS.
+
+    Даты первого и последнего визита None, если визитов не было: шаблон
+    показывает вместо них прочерк.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(DOCTOR_STATS_SQL)
+        rows = cursor.fetchall()
+
+    if connection.vendor == 'sqlite':
+        # Агрегаты SQLite возвращают даты строками
+        rows = [(*row[:7], _as_date(row[7]), _as_date(row[8])) for row in rows]
+    return rows
+
+
+def _as_date(value):
+    return parse_date(value) if isinstance(value, str) else value
+
+
+def visits_on(day):
+    """Число визитов на дату по всем врачам и статусам"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT CAST(COALESCE(SUM(count), 0) AS integer) FROM visit_daily_rollup WHERE visit_date = %s",
+            [day],
+        )
+        return cursor.fetchone()[0]
@@ -0,0 +1,95 @@
+from django.db.models import TextField, Value
+from django.db.models.functions import Cast, Coalesce, Concat, NullIf, Substr
+
+from .models import DocSchedule, Doctor, Patient, Visit
+
+
+# Строки общих списков: только показываемые столбцы кортежами values_list,
+# без создания экземпляров моделей. Имена склеиваются, пустые значения
+# подменяются и время обрезается до ЧЧ:ММ в SQL, поэтому queryset можно
+# сразу отдавать в шаблон entity_list.html.
+
+def _text(value):
+    return Value(value, output_field=TextField())
+
+
+NO_VALUE = _text('—')
+
+
+def _full_name(prefix):
+    return Concat(f'{prefix}__lname', _text(' '), f'{prefix}__fname', output_field=TextField())
+
+
+def _or_dash(field):
+    return Coalesce(NullIf(field, _text('')), NO_VALUE)
+
+
+def _hh_mm(field):
+    # time::text — «ЧЧ:ММ:СС», первые пять символов одинаковы во всех СУБД
+    return Substr(Cast(field, TextField()), 1, 5, output_field=TextField())
+
+
+def doctor_rows():
+    """ID, имя, фамилия, специальность, телефон, доступен"""
+    return Doctor.objects.order_by('id').values_list(
+        'id', 'fname', 'lname', Coalesce('spec__name', NO_VALUE), _or_dash('phone'), 'is_available',
+    )
+
+
+def patient_rows():
+    """ID, имя, фамилия, дата рождения, пол, телефон, дата регистрации"""
+    return Patient.objects.order_by('id').values_list(
+        'id', 'fname', 'lname', 'birth_date', 'gender', _or_dash('phone'), 'registered',
+    )
+
+
+def visit_rows():
+    """ID, пациент, врач, дата, время, диагноз, статус — новые визиты первыми"""
+    return Visit.objects.order_by('-visit_date', '-visit_time').values_list(
+        'id',
+        _full_name('patient'),
+        _full_name('doctor'),
+        'visit_date',
+        _hh_mm('visit_time'),
+        Coalesce('diagnos__name', _text('Не указан')),
+        'status',
+    )
+
+
+def schedule_rows():
+    """Врач, специальность, день недели, начало и конец смены"""
+    return DocSchedule.objects.order_by('doctor__lname', 'doctor__fname').values_list(
+        _full_name('doctor'),
+        Coalesce('doctor__spec__name', NO_VALUE),
+        'day',
+        Coalesce(_hh_mm('start_time'), NO_VALUE),
+        Coalesce(_hh_mm('end_time'), NO_VALUE),
+    )
+
+
+# Пациентов в выпадающих списках форм; остальных находят поиском
+PATIENT_CHOICES_LIMIT = 50
+
+
+def patient_choices(query='', selected=None, limit=PATIENT_CHOICES_LIMIT):
+    """(id, «фамилия имя») не больше limit пациентов: по ID или началу фамилии.
+
+    Пациент selected (уже выбранный в форме) добавляется, даже если не
+    попал в выборку, чтобы список не терял текущее значение.
+    """
+    patients = Patient.objects.order_by('lname', 'fname', 'id')
+    query = query.strip()
+    if query.isdigit():
+        patients = patients.filter(id=int(query))
+    elif query:
+        patients = patients.filter(lname__istartswith=query)
+    choices = [
+        (patient_id, f'{lname} {fname}')
+        for patient_id, lname, fname in patients.values_list('id', 'lname', 'fname')[:limit]
+    ]
+    if selected and all(patient_id != selected for patient_id, _ in choices):
+        choices[:0] = [
+            (patient_id, f'{lname} {fname}')
+            for patient_id, lname, fname in Patient.objects.filter(id=selected).values_list('id', 'lname', 'fname')
+        ]
+    return choices
@@ -0,0 +1,180 @@
+import json
+from datetime import time
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.utils.dateparse import parse_time
+
+from . import analytics
+from .models import DocSchedule, Doctor, WeekDay
+
+
+# Шаг записи: визиты начинаются в :00 и :30, на тех же границах
+# должны начинаться и заканчиваться смены
+SLOT_MINUTES = 30
+
+# Предел конфликтов в ответе: оператору хватит первых, чтобы понять масштаб.
+# Запрос берёт на строку больше, чтобы знать, что показаны не все
+CONFLICTS_LIMIT = 200
+
+# Запланированные будущие визиты, которые не попадают в новые часы.
+# Новое расписание передаётся параллельными массивами (врач, день, начало,
+# конец) — по строке на каждый день каждого врача, выходной задаётся NULL.
+# Всё проверяется одним запросом на пачку через индекс (doctor_id, visit_day).
+CONFLICTS_SQL = """
+    SELECT v.id, v.doctor_id, d.lname || ' ' || d.fname, v.visit_date, v.visit_time
+    FROM unnest(%s::int[], %s::week_day[], %s::time[], %s::time[])
+         AS t(doctor_id, day, start_time, end_time)
+    JOIN visits v ON v.doctor_id = t.doctor_id AND v.visit_day = t.day
+    JOIN doctors d ON d.id = v.doctor_id
+    WHERE v.status = 'scheduled'
+      AND v.visit_date >= CURRENT_DATE
+      AND (t.start_time IS NULL OR v.visit_time < t.start_time OR v.visit_time >= t.end_time)
+    ORDER BY v.visit_date, v.visit_time, v.doctor_id
+    LIMIT %s
+"""
+
+# SQLite: массивов нет, строки шаблона передаются JSON-массивом
+# [[врач, день, начало, конец], ...]; время — строками «ЧЧ:ММ:СС», как
+# оно хранится в visits.visit_time.
+CONFLICTS_SQLITE_SQL = """
+    WITH t AS (
+        SELECT json_extract(value, '$[0]') AS doctor_id,
+               json_extract(value, '$[1]') AS day,
+               json_extract(value, '$[2]') AS start_time,
+               json_extract(value, '$[3]') AS end_time
+        FROM json_each(%s)
+    )
+    SELECT v.id, v.doctor_id, d.lname || ' ' || d.fname, v.visit_date, v.visit_time
+    FROM t
+    JOIN visits v ON v.doctor_id = t.doctor_id AND v.visit_day = t.day
+    JOIN doctors d ON d.id = v.doctor_id
+    WHERE v.status = 'scheduled'
+      AND v.visit_date >= date('now', 'localtime')
+      AND (t.start_time IS NULL OR v.visit_time < t.start_time OR v.visit_time >= t.end_time)
+    ORDER BY v.visit_date, v.visit_time, v.doctor_id
+    LIMIT %s
+"""
+
+
+class ScheduleConflict(Exception):
+    """Новое расписание оставляет запланированные визиты вне рабочих часов"""
+
+    def __init__(self, conflicts):
+        self.truncated = len(conflicts) > CONFLICTS_LIMIT
+        self.conflicts = conflicts[:CONFLICTS_LIMIT]
+        count = f'{CONFLICTS_LIMIT}+' if self.truncated else len(self.conflicts)
+        super().__init__(f'Визитов вне нового расписания: {count}')
+
+
+def _on_slot(value):
+    return value.minute % SLOT_MINUTES == 0 and value.second == 0 and value.microsecond == 0
+
+
+def clean_template(days):
+    """Проверяет недельный шаблон {день: {'start': ..., 'end': ...} или None}.
+
+    Время можно передать строкой «ЧЧ:ММ» или datetime.time. Возвращает
+    {день: (начало, конец)} только для рабочих дней; не упомянутые дни и
+    дни со значением None считаются выходными.
+    """
+    if not isinstance(days, dict):
+        raise ValidationError('Шаблон должен быть объектом «день недели → часы».')
+
+    errors = {}
+    template = {}
+    for day, hours in days.items():
+        day = str(day)
+        if day not in WeekDay.values:
+            errors[day] = 'Неизвестный день недели (ожидается 1–7).'
+            continue
+        if hours is None:
+            continue
+
+        try:
+            start, end = hours['start'], hours['end']
+            if isinstance(start, str):
+                start = parse_time(start)
+            if isinstance(end, str):
+                end = parse_time(end)
+        except (TypeError, KeyError, ValueError):
+            start = end = None
+        if not isinstance(start, time) or not isinstance(end, time):
+            errors[day] = 'Укажите начало и конец смены в формате ЧЧ:ММ.'
+        elif start >= end:
+            errors[day] = 'Начало смены должно быть раньше её конца.'
+        elif not (_on_slot(start) and _on_slot(end)):
+            errors[day] = f'Смена должна начинаться и заканчиваться на границе {SLOT_MINUTES} минут.'
+        else:
+            template[day] = (start, end)
+
+    if errors:
+        raise ValidationError(errors)
+    return template
+
+
+def find_conflicts(doctor_ids, template):
+    """Запланированные визиты врачей doctor_ids, выпадающие из шаблона.
+
+    Возвращает не больше CONFLICTS_LIMIT + 1 визитов.
+    """
+    rows = [
+        (doctor_id, day, *template.get(day, (None, None)))
+        for doctor_id in doctor_ids
+        for day in WeekDay.values
+    ]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            rows = [(*row[:2], *(t and t.isoformat() for t in row[2:])) for row in rows]
+            cursor.execute(CONFLICTS_SQLITE_SQL, [json.dumps(rows), CONFLICTS_LIMIT + 1])
+        else:
+            cursor.execute(CONFLICTS_SQL, [*map(list, zip(*rows)), CONFLICTS_LIMIT + 1])
+        return [
+            {
+                'visit_id': visit_id,
+                'doctor_id': doctor_id,
+                'doctor_name': doctor_name,
+                'visit_date': visit_date,
+                'visit_time': visit_time,
+            }
+            for visit_id, doctor_id, doctor_name, visit_date, visit_time in cursor.fetchall()
+        ]
+
+
+def set_weekly_schedule(doctor_ids, template):
+    """Заменяет недельное расписание врачей doctor_ids шаблоном template.
+
+    Строки врачей блокируются FOR UPDATE на время транзакции. Триггер
+    validate_visit читает строку врача FOR SHARE до проверки расписания
+    (миграция 0011), поэтому новый визит к этим врачам ждёт конца правки
+    и проверяется по новому расписанию: конфликт не может появиться между
+    проверкой и записью. В SQLite транзакция записи и так одна. Если визиты
+    выпадают из нового расписания, поднимается ScheduleConflict и ничего
+    не меняется. Поколение кэша отчётов о загрузке увеличивается в той же
+    транзакции: новые отчёты воркеры начнут считать с её фиксацией.
+    """
+    doctor_ids = sorted(set(doctor_ids))
+    if not doctor_ids:
+        raise ValidationError('Выберите хотя бы одного врача.')
+
+    with transaction.atomic():
+        locked = list(
+            Doctor.objects.select_for_update().filter(id__in=doctor_ids)
+            .order_by('id').values_list('id', flat=True)
+        )
+        missing = set(doctor_ids) - set(locked)
+        if missing:
+            raise ValidationError(f"Врачи не найдены: {', '.join(map(str, sorted(missing)))}")
+
+        conflicts = find_conflicts(doctor_ids, template)
+        if conflicts:
+            raise ScheduleConflict(conflicts)
+
+        DocSchedule.objects.filter(doctor_id__in=doctor_ids).delete()
+        created = DocSchedule.objects.bulk_create(
+            DocSchedule(doctor_id=doctor_id, day=day, start_time=start, end_time=end)
+            for doctor_id in doctor_ids
+            for day, (start, end) in sorted(template.items())
+        )
+        analytics.invalidate()
+    return len(created)
@@ -1,3 +1,702 @@
-from django.test import TestCase
+import uuid
+from collections import defaultdict
+from datetime import date, time, timedelta
+from io import StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, IntegrityError, connection
+from django.db.models import Count, Q
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import warmup
+from .analytics import clinic_load
+from .booking import SlotTaken, StaleVisit, book_visit, update_visit
+from .forms import ClinicLoadForm
+from .jobs import claim_next, enqueue, run_job
+from .management.commands.rebuild_rollup import DIFF_SQL
+from .models import (
+    Diagnosis,
+    DocSchedule,
+    Doctor,
+    Job,
+    JobStatus,
+    Notification,
+    NotificationKind,
+    NotificationStatus,
+    Patient,
+    Recipe,
+    Spec,
+    Stat,
+    Visit,
+    WeekDay,
+)
+from .notifications import cancel_visits, claim_and_send, visit_deleted
+from .profiling import PROFILE_PARAM, PROFILES_KEEP, _prune
+from .query_guard import QUERY_CANCELED, _is_query_canceled
+from .rows import doctor_rows, patient_rows, schedule_rows, visit_rows
+from .schedules import ScheduleConflict, set_weekly_schedule
+from .views import PATIENT_VISITS_PER_PAGE
+
+
+# Тесты идут на локальной схеме SQLite (миграция 0009_sqlite_schema):
+# POLYCLINIC_DB_BACKEND=sqlite python manage.py test polyclinic_app
+
+
+class ClinicTestCase(TestCase):
+    """Врач, работающий каждый день с 08:00 до 20:00, и пациент"""
+
+    @classmethod
+    def setUpTestData(cls):
+        spec = Spec.objects.create(name='Терапевт')
+        cls.doctor = Doctor.objects.create(fname='Иван', lname='Петров', spec=spec)
+        DocSchedule.objects.bulk_create(
+            DocSchedule(doctor=cls.doctor, day=day, start_time=time(8), end_time=time(20))
+            for day in WeekDay.values
+        )
+        cls.patient = Patient.objects.create(
+            fname='Анна', lname='Смирнова', birth_date=date(1990, 5, 1), gender='f',
+        )
+        cls.visit_date = timezone.localdate() + timedelta(days=3)
+
+    def book(self, visit_time=time(10)):
+        return book_visit(Visit(
+            patient=self.patient,
+            doctor=self.doctor,
+            visit_date=self.visit_date,
+            visit_time=visit_time,
+        ))
+
+
+class RecordingBackend:
+    """Бэкенд уведомлений, который запоминает отправленное"""
+
+    def __init__(self):
+        self.sent = []
+
+    def send_messages(self, notifications):
+        self.sent.extend(notifications)
+        return {}
+
+
+class OperatorSessionTests(TestCase):
+
+    @skipIf(settings.SESSION_ENGINE == settings.SIGNED_COOKIE_SESSIONS,
+            'подписанную cookie отозвать нельзя')
+    def test_logout_revokes_captured_cookie(self):
+        self.client.post(reverse('enter_operator'), {'password': '123'})
+        captured = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        self.client.get(reverse('exit_operator'))
+
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = captured
+        self.assertEqual(self.client.get(reverse('visit_create')).status_code, 403)
+
+
+class BookingTests(ClinicTestCase):
+
+    def setUp(self):
+        self.client.post(reverse('enter_operator'), {'password': '123'})
+
+    def visit_data(self, visit_time='10:00', **extra):
+        return {
+            'patient': self.patient.id,
+            'doctor': self.doctor.id,
+            'visit_date': self.visit_date.isoformat(),
+            'visit_time': visit_time,
+            'diagnos': '',
+            'status': Stat.SCHEDULED,
+            **extra,
+        }
+
+    def test_duplicate_booking_returns_conflict(self):
+        self.book()
+
+        response = self.client.post(reverse('visit_create'), self.visit_data())
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Visit.objects.count(), 1)
+
+    def test_stale_version_is_rejected(self):
+        visit = self.book()
+        update_visit(Visit.objects.get(pk=visit.pk), visit.version)
+
+        response = self.client.post(
+            reverse('visit_edit', args=[visit.pk]),
+            self.visit_data('11:00', version=visit.version),
+        )
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Visit.objects.get(pk=visit.pk).visit_time, time(10))
+        with self.assertRaises(StaleVisit):
+            update_visit(visit, visit.version)
+
+    def test_move_to_taken_slot_returns_conflict(self):
+        self.book(time(11))
+        visit = self.book()
+
+        response = self.client.post(
+            reverse('visit_edit', args=[visit.pk]),
+            self.visit_data('11:00', version=visit.version),
+        )
+
+        self.assertEqual(response.status_code, 409)
+        with self.assertRaises(SlotTaken):
+            visit.visit_time = time(11)
+            update_visit(visit, visit.version)
+
+    def test_other_integrity_errors_are_not_slot_conflicts(self):
+        visit = self.book()
+        visit.patient_id = self.patient.id + 1000
+
+        with self.assertRaises(IntegrityError):
+            update_visit(visit, visit.version)
+
+
+class VisitRollupTests(ClinicTestCase):
+
+    def assertRollupMatches(self):
+        # Сверка rebuild_rollup: сводка против GROUP BY по visits
+        with connection.cursor() as cursor:
+            cursor.execute(DIFF_SQL)
+            self.assertEqual(cursor.fetchall(), [])
+
+    def test_rollup_follows_visit_changes(self):
+        visits = [self.book(time(hour)) for hour in (9, 10, 11)]
+        self.assertRollupMatches()
+
+        moved = visits[0]
+        moved.visit_date += timedelta(days=7)
+        update_visit(moved, moved.version)
+        self.assertRollupMatches()
+
+        # Массовая отмена — один UPDATE на несколько строк
+        cancel_visits(Visit.objects.filter(pk__in=[v.pk for v in visits[1:]]))
+        self.assertRollupMatches()
+
+        Visit.objects.filter(pk=visits[1].pk).delete()
+        self.assertRollupMatches()
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT SUM(count) FROM visit_daily_rollup')
+            self.assertEqual(cursor.fetchone()[0], 2)
+
+
+class VisitDayTests(ClinicTestCase):
+
+    def history(self, visit):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT operation_type, visit_day FROM visits_history WHERE id = %s ORDER BY history_id',
+                [visit.pk],
+            )
+            return cursor.fetchall()
+
+    def test_queryset_update_derives_visit_day(self):
+        visit = self.book()
+        new_date = self.visit_date + timedelta(days=1)
+
+        Visit.objects.filter(pk=visit.pk).update(visit_date=new_date)
+
+        self.assertEqual(Visit.objects.get(pk=visit.pk).visit_day, str(new_date.isoweekday()))
+        # Одна строка истории на изменение, как в PostgreSQL
+        old_day = str(self.visit_date.isoweekday())
+        self.assertEqual(self.history(visit), [('I', old_day), ('U', old_day)])
+
+
+class FailingBackend:
+    """Бэкенд уведомлений, который не может отправить ни одного"""
+
+    def send_messages(self, notifications):
+        return dict.fromkeys((n.id for n in notifications), 'недоступен')
+
+
+class NotificationDispatchTests(ClinicTestCase):
+
+    def dispatch(self):
+        # Напоминания становятся наступившими сразу
+        Notification.objects.update(send_after=timezone.now())
+        backend = RecordingBackend()
+        claim_and_send(backend, batch_size=100)
+        return backend.sent
+
+    def test_deleted_visit_gets_no_notifications(self):
+        visit = self.book()
+        # Удаление в обход visit_deleted (админка, каскад, прямой SQL)
+        Visit.objects.filter(pk=visit.pk).delete()
+
+        self.assertEqual(self.dispatch(), [])
+        self.assertEqual(
+            set(Notification.objects.values_list('status', flat=True)),
+            {NotificationStatus.CANCELLED},
+        )
+
+    def test_deleted_patient_gets_no_notifications(self):
+        self.book()
+        # Пациента, которому адресованы уведомления, больше нет
+        Notification.objects.update(patient_id=self.patient.id + 1000)
+
+        self.assertEqual(self.dispatch(), [])
+        self.assertFalse(Notification.objects.filter(status=NotificationStatus.PENDING).exists())
+
+    def test_cancelled_visit_gets_no_reminder(self):
+        visit = self.book()
+        Visit.objects.filter(pk=visit.pk).update(status=Stat.CANCELLED)
+
+        self.assertEqual([n.kind for n in self.dispatch()], [NotificationKind.BOOKED])
+        reminder = Notification.objects.get(kind=NotificationKind.REMINDER)
+        self.assertEqual(reminder.status, NotificationStatus.CANCELLED)
+
+    def test_failed_send_is_retried_later(self):
+        self.book()
+        Notification.objects.exclude(kind=NotificationKind.BOOKED).delete()
+        Notification.objects.update(attempts=2)
+
+        self.assertEqual(claim_and_send(FailingBackend(), batch_size=100), (0, 1))
+
+        notification = Notification.objects.get()
+        self.assertEqual(notification.attempts, 3)
+        self.assertEqual(notification.status, NotificationStatus.PENDING)
+        self.assertGreater(notification.send_after, timezone.now())
+
+    def test_lost_claim_does_not_overwrite_new_owner(self):
+        self.book()
+        Notification.objects.exclude(kind=NotificationKind.BOOKED).delete()
+        new_owner = uuid.uuid4()
+
+        class SlowBackend(FailingBackend):
+            def send_messages(self, notifications):
+                # Срок истёк, и пачку взял другой отправитель
+                Notification.objects.update(claim=new_owner)
+                return super().send_messages(notifications)
+
+        claim_and_send(SlowBackend(), batch_size=100)
+
+        notification = Notification.objects.get()
+        self.assertEqual(notification.claim, new_owner)
+        self.assertEqual(notification.attempts, 0)
+        self.assertEqual(notification.error, '')
+
+    def test_non_scheduled_visit_is_not_announced(self):
+        book_visit(Visit(
+            patient=self.patient,
+            doctor=self.doctor,
+            visit_date=timezone.localdate() - timedelta(days=3),
+            visit_time=time(10),
+            status=Stat.COMPLETED,
+        ))
+
+        self.assertFalse(Notification.objects.exists())
+
+    def test_cancellation_notice_survives_visit_delete(self):
+        visit = self.book()
+        Notification.objects.update(status=NotificationStatus.SENT)
+        visit_deleted(visit)
+        visit.delete()
+
+        self.assertEqual([n.kind for n in self.dispatch()], [NotificationKind.CANCELLED])
+
+
+class JobLeaseTests(ClinicTestCase):
+
+    def test_lost_lease_does_not_overwrite_new_owner(self):
+        enqueue('cancel_patient_appointments', patient_id=self.patient.id)
+        job = claim_next()
+        # Срок истёк, и задачу забрал другой воркер
+        Job.objects.filter(pk=job.pk).update(attempts=job.attempts + 1)
+
+        run_job(job)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, JobStatus.RUNNING)
+        self.assertIsNone(job.finished)
+
+    def abandon(self, job):
+        # Воркер погиб, не продлив срок
+        Job.objects.filter(pk=job.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+
+    def test_abandoned_job_is_retried_while_attempts_remain(self):
+        job = enqueue('cancel_patient_appointments', patient_id=self.patient.id)
+        self.abandon(claim_next())
+
+        retried = claim_next()
+
+        self.assertEqual(retried.pk, job.pk)
+        self.assertEqual(retried.attempts, 2)
+
+    def test_abandoned_job_fails_after_last_attempt(self):
+        enqueue('cancel_patient_appointments', patient_id=self.patient.id)
+        job = claim_next()
+        Job.objects.filter(pk=job.pk).update(attempts=job.max_attempts)
+        self.abandon(job)
+
+        self.assertIsNone(claim_next())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, JobStatus.FAILED)
+        self.assertEqual(job.attempts, job.max_attempts)
+        self.assertIsNotNone(job.finished)
+
+    def test_finished_job_is_saved(self):
+        enqueue('cancel_patient_appointments', patient_id=self.patient.id)
+
+        run_job(claim_next())
+
+        job = Job.objects.get()
+        self.assertEqual(job.status, JobStatus.DONE)
+        self.assertEqual(job.result['cancelled'], 0)
+
+
+class DoctorStatsTests(ClinicTestCase):
+
+    def test_visitor_sees_current_counts(self):
+        self.book()
+
+        response = self.client.get(reverse('report_doctor_stats'))
+
+        self.assertEqual(response.status_code, 200)
+        row = response.context['entities'][0]
+        self.assertEqual(row[0], self.doctor.id)
+        self.assertEqual(row[3], 1)
+
+
+class PatientCardTests(ClinicTestCase):
+
+    def setUp(self):
+        visits = [
+            book_visit(Visit(
+                patient=self.patient,
+                doctor=self.doctor,
+                visit_date=self.visit_date + timedelta(days=i),
+                visit_time=time(10),
+            ))
+            for i in range(PATIENT_VISITS_PER_PAGE + 5)
+        ]
+        Recipe.objects.bulk_create(Recipe(visit=visit, drug='Парацетамол') for visit in visits)
+        diagnosis = Diagnosis.objects.create(name='ОРВИ')
+        Visit.objects.filter(pk=visits[-1].pk).update(diagnos=diagnosis)
+        cancel_visits(Visit.objects.filter(pk=visits[0].pk))
+
+    def card(self, page):
+        # Пациент со сводкой, страница визитов и рецепты к ней — при любом
+        # числе визитов
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                reverse('patient_detail', args=[self.patient.id]), {'page': page},
+            )
+            self.assertEqual(response.status_code, 200)
+        return response.context
+
+    def test_first_page_is_newest_visits(self):
+        context = self.card(1)
+
+        patient = context['patient']
+        self.assertEqual(patient.total_visits, PATIENT_VISITS_PER_PAGE + 5)
+        self.assertEqual(patient.cancelled_visits, 1)
+        self.assertEqual(patient.last_diagnosis, 'ОРВИ')
+        dates = [visit.visit_date for visit in context['page']]
+        self.assertEqual(len(dates), PATIENT_VISITS_PER_PAGE)
+        self.assertEqual(dates, sorted(dates, reverse=True))
+        self.assertEqual(dates[0], self.visit_date + timedelta(days=PATIENT_VISITS_PER_PAGE + 4))
+
+    def test_last_page(self):
+        context = self.card(2)
+
+        page = context['page']
+        self.assertEqual(page.paginator.num_pages, 2)
+        self.assertEqual(len(page), 5)
+        self.assertEqual(page[-1].visit_date, self.visit_date)
+        self.assertEqual(len(page[-1].recipe_set.all()), 1)
+
+
+class ClinicLoadTests(ClinicTestCase):
+
+    def setUp(self):
+        # Отчёт читает через 'client' — зеркало default в тестах, но со
+        # своим подключением вне транзакции теста: данных теста оно не видит
+        self.enterContext(mock.patch('polyclinic_app.analytics.connections', {'client': connection}))
+        cache.clear()
+        self.start = self.visit_date
+        self.end = self.visit_date + timedelta(days=13)
+        visits = [
+            book_visit(Visit(
+                patient=self.patient,
+                doctor=self.doctor,
+                visit_date=self.visit_date + timedelta(days=day),
+                visit_time=time(hour),
+            ))
+            for day, hour in [(0, 9), (0, 10), (1, 10), (8, 15), (13, 11), (14, 11)]
+        ]
+        cancel_visits(Visit.objects.filter(pk=visits[1].pk))
+
+    def grouped_visits(self, *fields):
+        # Та же загрузка, посчитанная GROUP BY по самим visits
+        return Visit.objects.filter(
+            visit_date__range=(self.start, self.end),
+        ).values(*fields).annotate(
+            booked=Count('id', filter=~Q(status=Stat.CANCELLED)),
+            cancelled=Count('id', filter=Q(status=Stat.CANCELLED)),
+        ).order_by(*fields)
+
+    def test_load_matches_visits(self):
+        load = clinic_load(self.start, self.end, self.doctor.id)
+
+        [doctor] = load['doctors']
+        [expected] = self.grouped_visits('doctor')
+        self.assertEqual(doctor['booked'], expected['booked'])
+        self.assertEqual(doctor['cancelled'], expected['cancelled'])
+        # 08:00–20:00 каждый день — 24 получасовых слота
+        self.assertEqual(doctor['available'], 24 * 14)
+        self.assertEqual(load['specs'][0]['booked'], doctor['booked'])
+
+        weeks = defaultdict(lambda: [0, 0])
+        for row in self.grouped_visits('visit_date'):
+            monday = row['visit_date'] - timedelta(days=row['visit_date'].weekday())
+            weeks[monday][0] += row['booked']
+            weeks[monday][1] += row['cancelled']
+        self.assertEqual({
+            row['week']: [row['booked'], row['cancelled']]
+            for row in load['doctor_weeks'] if row['booked'] or row['cancelled']
+        }, dict(weeks))
+        self.assertEqual(
+            sum(cell['count'] for row in load['heatmap']['rows'] for cell in row['cells']),
+            expected['booked'],
+        )
+
+    def test_bad_dates_are_rejected(self):
+        for start, end, error in [
+            ('2026-02-30', '', 'Укажите существующие даты'),
+            ('вчера', '', 'Укажите существующие даты'),
+            ('2026-03-02', '2026-03-01', 'Начало периода позже'),
+            ('2025-01-01', '2026-03-01', 'Период не может быть длиннее'),
+        ]:
+            with self.subTest(start=start, end=end):
+                response = self.client.get(reverse('report_clinic_load'), {'start': start, 'end': end})
+
+                self.assertEqual(response.status_code, 200)
+                self.assertIn(error, response.context['error'])
+                self.assertIsNone(response.context['load'])
+
+        self.assertFalse(ClinicLoadForm({'start': '2026-02-30'}).is_valid())
+
+
+class ProfilingTests(TestCase):
+
+    def setUp(self):
+        self.profiles = Path(self.enterContext(TemporaryDirectory()))
+        self.enterContext(self.settings(PROFILING_ENABLED=True, PROFILING_DIR=str(self.profiles)))
+
+    def profiled_get(self):
+        return self.client.get(reverse('patient_list'), {PROFILE_PARAM: '1'})
+
+    def test_operator_request_is_profiled(self):
+        self.client.post(reverse('enter_operator'), {'password': '123'})
+
+        response = self.profiled_get()
+
+        self.assertTrue((self.profiles / f"{response['X-Profile-Id']}.prof").exists())
+
+    def test_visitor_request_is_not_profiled(self):
+        response = self.profiled_get()
+
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(list(self.profiles.iterdir()), [])
+
+    def test_disabled_without_setting(self):
+        # Цепочка middleware собирается при первом запросе клиента
+        with self.settings(PROFILING_ENABLED=False):
+            self.client.post(reverse('enter_operator'), {'password': '123'})
+            response = self.profiled_get()
+
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(list(self.profiles.iterdir()), [])
+
+    def test_prune_keeps_newest_profiles(self):
+        names = [f'20260101-000000-{i:06d}-view' for i in range(PROFILES_KEEP + 5)]
+        for name in names:
+            (self.profiles / f'{name}.json').write_text('{}')
+            (self.profiles / f'{name}.prof').write_bytes(b'')
+
+        _prune(self.profiles)
+
+        kept = sorted(path.stem for path in self.profiles.glob('*.json'))
+        self.assertEqual(kept, names[5:])
+        self.assertEqual(sorted(path.stem for path in self.profiles.glob('*.prof')), names[5:])
+
+
+class ListRowsTests(ClinicTestCase):
+    # Шаблоны entity_list.html и index.html обращаются к столбцам по номеру
+
+    def test_doctor_row(self):
+        row = doctor_rows().get(pk=self.doctor.pk)
+
+        self.assertEqual(row[:5], (self.doctor.id, 'Иван', 'Петров', 'Терапевт', '—'))
+        self.assertIsInstance(row[5], bool)  # «Доступен», шестой столбец
+
+    def test_patient_row(self):
+        row = patient_rows().get(pk=self.patient.pk)
+
+        self.assertEqual(row[:6], (self.patient.id, 'Анна', 'Смирнова', date(1990, 5, 1), 'f', '—'))
+
+    def test_visit_row(self):
+        visit = self.book()
+
+        row = visit_rows().get(pk=visit.pk)
+
+        self.assertEqual(row, (
+            visit.id, 'Смирнова Анна', 'Петров Иван', self.visit_date, '10:00', 'Не указан', Stat.SCHEDULED,
+        ))
+
+    def test_schedule_row(self):
+        row = schedule_rows().filter(day=WeekDay.MONDAY).get()
+
+        self.assertEqual(row, ('Петров Иван', 'Терапевт', WeekDay.MONDAY, '08:00', '20:00'))
+
+    def test_lists_render_indexed_columns(self):
+        self.book()
+
+        self.assertContains(self.client.get(reverse('schedule_list')), 'Понедельник')
+        self.assertContains(self.client.get(reverse('patient_list')), 'Жен')
+        self.assertContains(self.client.get(reverse('visit_list')), 'Запланирован')
+        self.assertContains(self.client.get(reverse('home')), '<td>Смирнова Анна</td>', html=True)
+
+
+class ScheduleConflictTests(ClinicTestCase):
+
+    @mock.patch('polyclinic_app.schedules.CONFLICTS_LIMIT', 2)
+    def test_capped_conflicts_are_reported_as_capped(self):
+        for hour in (9, 10, 11):
+            self.book(time(hour))
+
+        with self.assertRaises(ScheduleConflict) as raised:
+            set_weekly_schedule([self.doctor.id], {})
+
+        self.assertEqual(len(raised.exception.conflicts), 2)
+        self.assertTrue(raised.exception.truncated)
+        self.assertEqual(str(raised.exception), 'Визитов вне нового расписания: 2+')
+        self.assertEqual(DocSchedule.objects.filter(doctor=self.doctor).count(), 7)
+
+    def test_exact_count_below_limit(self):
+        self.book()
+
+        with self.assertRaises(ScheduleConflict) as raised:
+            set_weekly_schedule([self.doctor.id], {})
+
+        self.assertFalse(raised.exception.truncated)
+        self.assertEqual(str(raised.exception), 'Визитов вне нового расписания: 1')
+
+
+class PatientImportTests(ClinicTestCase):
+
+    def run_import(self, lines, *args):
+        path = Path(self.enterContext(TemporaryDirectory())) / 'patients.csv'
+        path.write_text('fname,lname,birth_date,gender,phone\n' + '\n'.join(lines) + '\n')
+        out = StringIO()
+        call_command('import_patients', str(path), *args, stdout=out)
+        return out.getvalue()
+
+    def test_unreadable_phone_is_rejected(self):
+        out = self.run_import([
+            'Олег,Кузнецов,1985-02-03,м,12-34',
+            'Ирина,Кузнецова,1987-04-05,ж,+7 916 111-22-33 доб. 12',
+        ])
+
+        self.assertIn('с ошибками:             2', out)
+        self.assertIn("неверный телефон: '12-34'", out)
+        self.assertFalse(Patient.objects.filter(lname__startswith='Кузнецов').exists())
+
+    def test_foreign_phone_is_kept(self):
+        self.run_import(['John,Smith,1980-01-02,m,+44 20 7946 0958'])
+
+        self.assertEqual(Patient.objects.get(lname='Smith').phone, '+442079460958')
+
+    def test_repeat_within_file_is_merged(self):
+        out = self.run_import([
+            'Олег,Кузнецов,1985-02-03,м,',
+            'Олег,Кузнецов,03.02.1985,,8 916 111-22-33',
+        ], '--chunk-size', '1')
+
+        self.assertIn('повторы внутри файла:   1', out)
+        patient = Patient.objects.get(lname='Кузнецов')
+        self.assertEqual(patient.phone, '+79161112233')
+        self.assertEqual(patient.gender, 'm')
+
+    def test_match_by_normalized_phone(self):
+        Patient.objects.create(
+            fname='Олег', lname='Кузнецов', birth_date=date(1985, 2, 3), gender='m',
+            phone='8 (916) 111-22-33',
+        )
+
+        out = self.run_import(['Олег,Кузнецов,1985-02-04,,+7 916 111 22 33'])
+
+        self.assertIn('дубликаты, без измен.:  1', out)
+        self.assertEqual(Patient.objects.filter(lname='Кузнецов').count(), 1)
+
+    def test_match_by_name_and_birth_date(self):
+        out = self.run_import(['Анна,Смирнова,01.05.1990,ж,9161112233'])
+
+        self.assertIn('дубликаты, дополнены:   1', out)
+        self.patient.refresh_from_db()
+        self.assertEqual(self.patient.phone, '+79161112233')
+        self.assertEqual(Patient.objects.count(), 1)
+
+    def test_dry_run_writes_nothing(self):
+        out = self.run_import([
+            'Олег,Кузнецов,1985-02-03,м,',
+            'Анна,Смирнова,1990-05-01,ж,9161112233',
+        ], '--dry-run')
+
+        self.assertIn('добавлено:              1', out)
+        self.assertIn('дубликаты, дополнены:   1', out)
+        self.assertEqual(Patient.objects.count(), 1)
+        self.patient.refresh_from_db()
+        self.assertIsNone(self.patient.phone)
+
+    def test_failed_chunk_is_rolled_back(self):
+        with mock.patch.object(Patient.objects, 'bulk_update', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.run_import([
+                    'Олег,Кузнецов,1985-02-03,м,',
+                    'Анна,Смирнова,1990-05-01,ж,9161112233',
+                ])
+
+        self.assertEqual(Patient.objects.count(), 1)
+
+
+@override_settings(WARMUP_ENABLED=True)
+class WarmupTests(TestCase):
+    databases = {'default', 'client'}
+
+    def test_run_does_not_touch_database(self):
+        with self.assertNumQueries(0), self.assertLogs('polyclinic_app.warmup', 'INFO'):
+            warmup.run()
+
+    def test_warm_connections(self):
+        # Ошибки БД warm_worker только пишет в журнал, поэтому напрямую
+        warmup.warm_connections()
+
+
+class QueryCanceledTests(SimpleTestCase):
+
+    def canceled(self, **driver_attrs):
+        try:
+            try:
+                raise type('DriverError', (Exception,), driver_attrs)()
+            except Exception as driver_error:
+                raise DatabaseError('canceling statement') from driver_error
+        except DatabaseError as exc:
+            return _is_query_canceled(exc)
+
+    def test_psycopg3_sqlstate(self):
+        self.assertTrue(self.canceled(sqlstate=QUERY_CANCELED))
+
+    def test_psycopg2_pgcode(self):
+        self.assertTrue(self.canceled(pgcode=QUERY_CANCELED))
+
+    def test_other_error(self):
+        self.assertFalse(self.canceled(sqlstate='23505'))
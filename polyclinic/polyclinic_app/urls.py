@@ -16,6 +16,7 @@ urlpatterns = [
     # =====================
     path('doctors/', views.doctor_list, name='doctor_list'),
     path('patients/', views.patient_list, name='patient_list'),
+    path('patients/<int:patient_id>/', views.patient_detail, name='patient_detail'),
     path('visits/', views.visit_list, name='visit_list'),
     path('schedules/', views.schedule_list, name='schedule_list'),
 
@@ -24,11 +25,18 @@ urlpatterns = [
     # =====================
     path('reports/doctor-stats/', views.report_doctor_stats, name='report_doctor_stats'),
     path('reports/next-visits/', views.report_next_visits, name='report_next_visits'),
+    path('reports/clinic-load/', views.report_clinic_load, name='report_clinic_load'),
 
     # =====================
     # ОПЕРАТОРСКИЕ ДЕЙСТВИЯ
     # =====================
     path('cancel-appointments/', views.cancel_patient_appointments, name='cancel_appointments'),
+    path('jobs/<int:job_id>/', views.job_status, name='job_status'),
+    path('schedules/edit/', views.schedule_edit, name='schedule_edit'),
+    path('api/schedules/', views.schedule_api, name='schedule_api'),
+    path('profiles/', views.profile_list, name='profile_list'),
+    path('profiles/<str:name>/', views.profile_detail, name='profile_detail'),
+    path('profiles/<str:name>/download/', views.profile_download, name='profile_download'),
 
     path('visits/create/', views.visit_create, name='visit_create'),
     path('visits/edit/<int:visit_id>/', views.visit_edit, name='visit_edit'),
@@ -1,14 +1,42 @@
-﻿from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponseForbidden
-from django.db import connections
+﻿import json
+from datetime import timedelta
+
+from django.shortcuts import render, redirect, get_object_or_404
+from django.http import FileResponse, Http404, HttpResponseForbidden, JsonResponse
+from django.contrib import messages
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.utils import timezone
+from django.views.decorators.http import require_POST
 from .models import (
     Doctor,
     Patient,
     Visit,
-    Diagnosis,
-    Spec,
-    DocSchedule
+    DocSchedule,
+    Job,
 )
+from .booking import SlotTaken, StaleVisit, book_visit, update_visit
+from .analytics import clinic_load
+from .jobs import enqueue
+from .reports import DOCTOR_STATS_COLUMNS, doctor_stats_rows, visits_on
+from .forms import CancelDoctorVisitsForm, ClinicLoadForm, ScheduleTemplateForm, VisitEditForm, VisitForm
+from .schedules import ScheduleConflict, clean_template, set_weekly_schedule
+from .notifications import visit_deleted
+from .profiling import list_profiles, load_profile, profile_file
+from .rows import PATIENT_CHOICES_LIMIT, doctor_rows, patient_choices, patient_rows, schedule_rows, visit_rows
+
+# Визитов на странице карты пациента
+PATIENT_VISITS_PER_PAGE = 20
+
+# Период отчёта о загрузке по умолчанию и наибольший допустимый
+CLINIC_LOAD_DEFAULT_DAYS = 12 * 7
+CLINIC_LOAD_MAX_DAYS = 366
+
+# Строк в общих списках и в отчёте о ближайших визитах; остальное отсекается
+LIST_ROW_LIMIT = 500
+NEXT_VISITS_LIMIT = 100
 
 # =========================
 # ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ
@@ -18,6 +46,12 @@ def is_operator(request):
     return request.session.get('is_operator', False)
 
 
+def limited(rows, limit=LIST_ROW_LIMIT):
+    """Первые limit строк и признак, что строк было больше"""
+    rows = list(rows[:limit + 1])
+    return rows[:limit], len(rows) > limit
+
+
 def operator_required(view_func):
     def wrapper(request, *args, **kwargs):
         if not is_operator(request):
@@ -56,31 +90,14 @@ def home(request):
     doctor_count = Doctor.objects.count()
     patient_count = Patient.objects.count()
 
-    from django.utils import timezone
     today = timezone.now().date()
-    today_visits = Visit.objects.filter(visit_date=today).count()
-
-    recent_visits = Visit.objects.select_related(
-        'patient', 'doctor', 'diagnos'
-    ).order_by('-visit_date', '-visit_time')[:10]
-
-    visits_list = []
-    for visit in recent_visits:
-        visits_list.append([
-            visit.id,
-            f"{visit.patient.fname} {visit.patient.lname}",
-            f"{visit.doctor.fname} {visit.doctor.lname}",
-            visit.visit_date,
-            visit.visit_time,
-            visit.diagnos.name if visit.diagnos else "Не указан",
-            visit.status
-        ])
+    today_visits = visits_on(today)
 
     return render(request, 'polyclinic_app/index.html', {
         'doctor_count': doctor_count,
         'patient_count': patient_count,
         'today_visits': today_visits,
-        'recent_visits': visits_list,
+        'recent_visits': visit_rows()[:10],
         'is_operator': is_operator(request),
         'operator_error': request.session.pop('operator_error', None),
     })
@@ -92,44 +109,22 @@ def home(request):
 # =========================
 
 def doctor_list(request):
-    doctors = Doctor.objects.select_related('spec').all()
-
-    doctors_data = []
-    for doctor in doctors:
-        doctors_data.append([
-            doctor.id,
-            doctor.fname,
-            doctor.lname,
-            doctor.spec.name if doctor.spec else "—",
-            doctor.phone or "—",
-            doctor.is_available
-        ])
+    doctors, truncated = limited(doctor_rows())
 
     return render(request, 'polyclinic_app/entity_list.html', {
-        'entities': doctors_data,
+        'entities': doctors,
         'title': 'Врачи',
         'columns': ['ID', 'Имя', 'Фамилия', 'Специальность', 'Телефон', 'Доступен'],
         'entity_name': 'doctors',
+        'truncated': truncated,
     })
 
 
 def patient_list(request):
-    patients = Patient.objects.all()
-
-    patients_data = []
-    for patient in patients:
-        patients_data.append([
-            patient.id,
-            patient.fname,
-            patient.lname,
-            patient.birth_date,
-            patient.gender,
-            patient.phone or "—",
-            patient.registered
-        ])
+    patients, truncated = limited(patient_rows())
 
     return render(request, 'polyclinic_app/entity_list.html', {
-        'entities': patients_data,
+        'entities': patients,
         'title': 'Пациенты',
         'columns': [
             'ID',
@@ -141,28 +136,51 @@ def patient_list(request):
             'Зарегистрирован'
         ],
         'entity_name': 'patients',
+        'truncated': truncated,
+    })
+
+
+
+def patient_detail(request, patient_id):
+    # Пациент и сводка по его визитам — одним сгруппированным запросом
+    last_diagnosis = Visit.objects.filter(
+        patient=OuterRef('pk'),
+        diagnos__isnull=False,
+    ).order_by('-visit_date', '-visit_time').values('diagnos__name')[:1]
+
+    patient = get_object_or_404(
+        Patient.objects.annotate(
+            total_visits=Count('visit'),
+            scheduled_visits=Count('visit', filter=Q(visit__status='scheduled')),
+            completed_visits=Count('visit', filter=Q(visit__status='completed')),
+            cancelled_visits=Count('visit', filter=Q(visit__status='cancelled')),
+            last_diagnosis=Subquery(last_diagnosis),
+        ),
+        pk=patient_id,
+    )
+
+    # Страница визитов: врачи и диагнозы через JOIN, рецепты одним запросом
+    visits = Visit.objects.filter(patient=patient).select_related(
+        'doctor__spec', 'diagnos'
+    ).prefetch_related('recipe_set').order_by('-visit_date', '-visit_time')
+
+    paginator = Paginator(visits, PATIENT_VISITS_PER_PAGE)
+    paginator.count = patient.total_visits  # число визитов уже посчитано выше
+    page = paginator.get_page(request.GET.get('page'))
+
+    return render(request, 'polyclinic_app/patient_detail.html', {
+        'patient': patient,
+        'page': page,
+        'is_operator': is_operator(request),
     })
 
 
 
 def visit_list(request):
-    visits = Visit.objects.select_related('patient', 'doctor', 'diagnos') \
-        .order_by('-visit_date', '-visit_time')
-
-    visits_data = []
-    for visit in visits:
-        visits_data.append([
-            visit.id,
-            f"{visit.patient.lname} {visit.patient.fname}",
-            f"{visit.doctor.lname} {visit.doctor.fname}",
-            visit.visit_date,
-            visit.visit_time.strftime("%H:%M"),
-            visit.diagnos.name if visit.diagnos else "Не указан",
-            visit.status
-        ])
+    visits, truncated = limited(visit_rows())
 
     return render(request, 'polyclinic_app/entity_list.html', {
-        'entities': visits_data,
+        'entities': visits,
         'title': 'Визиты',
         'columns': [
             'ID',
@@ -174,42 +192,16 @@ def visit_list(request):
             'Статус'
         ],
         'entity_name': 'visits',
+        'truncated': truncated,
     })
 
 
 
 def schedule_list(request):
-    from django.db import connection
-
-    with connection.cursor() as cursor:
-        cursor.execute("""
-            SELECT 
-                ds.doctor_id,
-                ds.day,
-                ds.start_time,
-                ds.end_time,
-                d.fname,
-                d.lname,
-                s.name
-            FROM doc_schedule ds
-            JOIN doctors d ON ds.doctor_id = d.id
-            LEFT JOIN spec s ON d.spec_id = s.id
-            ORDER BY d.lname, d.fname
-        """)
-        rows = cursor.fetchall()
-
-    schedules_data = []
-    for row in rows:
-        schedules_data.append([
-            f"{row[5]} {row[4]}",
-            row[6] or "—",
-            row[1],
-            row[2].strftime("%H:%M") if row[2] else "—",
-            row[3].strftime("%H:%M") if row[3] else "—",
-        ])
+    schedules, truncated = limited(schedule_rows())
 
     return render(request, 'polyclinic_app/entity_list.html', {
-        'entities': schedules_data,
+        'entities': schedules,
         'title': 'Расписание врачей',
         'columns': [
             'Врач',
@@ -219,6 +211,7 @@ def schedule_list(request):
             'Конец'
         ],
         'entity_name': 'schedules',
+        'truncated': truncated,
     })
 
 
@@ -229,86 +222,100 @@ def schedule_list(request):
 
 @operator_required
 def visit_create(request):
+    status = 200
+    patient_query = request.GET.get('patient_q', '')
     if request.method == 'POST':
-        form = VisitForm(request.POST)
+        form = VisitForm(request.POST, patient_query=patient_query)
         if form.is_valid():
             visit = Visit(
                 patient=form.cleaned_data['patient'],
                 doctor=form.cleaned_data['doctor'],
                 visit_date=form.cleaned_data['visit_date'],
                 visit_time=form.cleaned_data['visit_time'],
-                visit_day=form.cleaned_data['visit_day'],
                 diagnos=form.cleaned_data['diagnos'],
                 status=form.cleaned_data['status'],
             )
 
             try:
-                visit.full_clean()  # Проверка всех условий модели
-                visit.save()
+                # Проверка всех условий модели; занятость слота проверяет
+                # book_visit и отвечает конфликтом 409
+                visit.full_clean(validate_unique=False)
+                book_visit(visit)  # Слот занимается атомарно
                 return redirect('visit_list')
+            except SlotTaken as e:
+                # Слот успели занять параллельно — отвечаем конфликтом
+                form.add_error(None, str(e))
+                status = 409
             except Exception as e:
                 form.add_error(None, e)
 
     else:
-        form = VisitForm()
+        form = VisitForm(patient_query=patient_query)
 
     return render(request, 'polyclinic_app/visit_create.html', {
         'form': form,
+        'patient_query': patient_query,
         'is_operator': is_operator(request),
-    })
-
-
-
-from django.shortcuts import render, redirect
-from django.db import connections
-
-
-from django.shortcuts import render, redirect, get_object_or_404
-from django.contrib import messages
-from .models import Visit, Doctor, Patient, Diagnosis
-from .forms import VisitForm
+    }, status=status)
 
 
 
 @operator_required
 def visit_edit(request, visit_id):
     visit = get_object_or_404(Visit, pk=visit_id)
+    patient_query = request.GET.get('patient_q', '')
 
     if request.method == 'POST':
-        form = VisitForm(request.POST)
+        form = VisitEditForm(request.POST, patient_query=patient_query)
         if form.is_valid():
             # Обновляем поля модели вручную
             visit.patient = form.cleaned_data['patient']
             visit.doctor = form.cleaned_data['doctor']
             visit.visit_date = form.cleaned_data['visit_date']
             visit.visit_time = form.cleaned_data['visit_time']
-            visit.visit_day = form.cleaned_data['visit_day']
             visit.diagnos = form.cleaned_data['diagnos']
             visit.status = form.cleaned_data['status']
 
+            # Версия, которую видел оператор
+            expected_version = form.cleaned_data['version']
+
             try:
-                visit.full_clean()  # Вызов встроенных проверок clean()
-                visit.save()
+                visit.full_clean(validate_unique=False)  # Слот проверит update_visit
+                update_visit(visit, expected_version)
+            except (SlotTaken, StaleVisit) as e:
+                # Визит правили параллельно или слот уже занят
+                form.add_error(None, str(e))
+                return render(request, 'polyclinic_app/visit_edit.html', {
+                    'form': form,
+                    'visit': visit,
+                    'patient_query': patient_query,
+                    'is_operator': is_operator(request),
+                }, status=409)
             except Exception as e:
                 form.add_error(None, e)
-                return render(request, 'polyclinic_app/visit_edit.html', {'form': form, 'visit': visit})
+                return render(request, 'polyclinic_app/visit_edit.html', {
+                    'form': form,
+                    'visit': visit,
+                    'patient_query': patient_query,
+                })
 
             return redirect('visit_list')
     else:
         # Инициализация формы текущими значениями визита
-        form = VisitForm(initial={
+        form = VisitEditForm(initial={
             'patient': visit.patient,
             'doctor': visit.doctor,
             'visit_date': visit.visit_date,
             'visit_time': visit.visit_time,
-            'visit_day': visit.visit_day,
             'diagnos': visit.diagnos,
             'status': visit.status,
-        })
+            'version': visit.version,
+        }, patient_query=patient_query)
 
     return render(request, 'polyclinic_app/visit_edit.html', {
         'form': form,
         'visit': visit,
+        'patient_query': patient_query,
         'is_operator': is_operator(request),
     })
 
@@ -319,60 +326,185 @@ def visit_edit(request, visit_id):
 def visit_delete(request, visit_id):
     visit = get_object_or_404(Visit, pk=visit_id)
     try:
-        visit.delete()
+        with transaction.atomic():
+            visit_deleted(visit)
+            visit.delete()
     except Exception as e:
-
-        from django.contrib import messages
         messages.error(request, f"Ошибка при удалении визита: {e}")
     return redirect('visit_list')
 
 
-
-from django.contrib import messages
-from django.shortcuts import get_object_or_404
-
-from django.utils import timezone
-from django.contrib import messages
-
 @operator_required
 def cancel_patient_appointments(request):
-    from .models import Patient, Visit
-
-    # Список всех пациентов для выпадающего списка
-    patients = Patient.objects.all().order_by('lname', 'fname')
-    patients_list = [(p.id, f"{p.lname} {p.fname}") for p in patients]
+    # Списки пациентов и врачей для выпадающих списков; пациентов —
+    # только найденных по ?patient_q, не больше PATIENT_CHOICES_LIMIT
+    patient_query = request.GET.get('patient_q', '')
+    patients_list = patient_choices(patient_query)
+    doctors = Doctor.objects.all().order_by('lname', 'fname')
+    doctors_list = [(d.id, f"{d.lname} {d.fname}") for d in doctors]
 
     if request.method == 'POST':
         patient_id = request.POST.get('patient_id')
+        doctor_id = request.POST.get('doctor_id')
         if patient_id:
             patient = get_object_or_404(Patient, pk=patient_id)
 
-            # Отбираем только будущие и запланированные визиты
-            visits_to_cancel = Visit.objects.filter(
-                patient=patient,
-                status='scheduled',
+            # Массовая отмена выполняется воркером, страница отвечает сразу
+            job = enqueue('cancel_patient_appointments', patient_id=patient.id)
+            messages.success(
+                request,
+                f"Отмена запланированных визитов пациента {patient} поставлена в очередь (задача №{job.id})."
             )
-
-            count = visits_to_cancel.count()
-
-            if count > 0:
-                visits_to_cancel.update(status='cancelled')
-                messages.success(request, f"Отменено {count} запланированных визитов пациента {patient}.")
-            else:
-                messages.info(request, f"У пациента {patient} нет запланированных визитов для отмены.")
-
             return redirect('cancel_appointments')
 
+        elif doctor_id:
+            form = CancelDoctorVisitsForm(request.POST)
+            if form.is_valid():
+                doctor = form.cleaned_data['doctor_id']
+                start_date = form.cleaned_data['start_date']
+                end_date = form.cleaned_data['end_date']
+                job = enqueue(
+                    'cancel_doctor_appointments',
+                    doctor_id=doctor.id,
+                    start_date=start_date,
+                    end_date=end_date,
+                )
+                messages.success(
+                    request,
+                    f"Отмена визитов врача {doctor} с {start_date} по {end_date} поставлена в очередь (задача №{job.id})."
+                )
+                return redirect('cancel_appointments')
+
+            messages.error(request, "Укажите корректный период отмены визитов врача.")
+
         else:
             messages.error(request, "Пожалуйста, выберите пациента для отмены визитов.")
 
     return render(request, 'polyclinic_app/cancel_appointments.html', {
         'patients': patients_list,
+        'patient_query': patient_query,
+        'patient_limit': PATIENT_CHOICES_LIMIT,
+        'doctors': doctors_list,
         'title': 'Отмена всех запланированных визитов',
         'is_operator': is_operator(request),
     })
 
 
+@operator_required
+def job_status(request, job_id):
+    """Состояние фоновой задачи для опроса со страницы"""
+    job = get_object_or_404(Job, pk=job_id)
+    return JsonResponse({
+        'id': job.id,
+        'name': job.name,
+        'status': job.status,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'result': job.result,
+        'error': job.error.strip().splitlines()[-1] if job.error else None,
+        'created': job.created,
+        'started': job.started,
+        'finished': job.finished,
+    })
+
+
+@operator_required
+def schedule_edit(request):
+    """Редактор недельного расписания: один шаблон сразу для нескольких врачей"""
+    status = 200
+    conflicts = []
+    if request.method == 'POST':
+        form = ScheduleTemplateForm(request.POST)
+        if form.is_valid():
+            doctor_ids = [doctor.id for doctor in form.cleaned_data['doctors']]
+            try:
+                rows = set_weekly_schedule(doctor_ids, form.cleaned_data['template'])
+            except ScheduleConflict as e:
+                form.add_error(None, f"{e}. Перенесите или отмените их и сохраните расписание снова.")
+                conflicts = e.conflicts
+                status = 409
+            except ValidationError as e:
+                form.add_error(None, e)
+            else:
+                messages.success(
+                    request,
+                    f"Расписание сохранено: врачей {len(doctor_ids)}, рабочих смен {rows}."
+                )
+                return redirect('schedule_list')
+    else:
+        # ?doctor=<id> — открыть редактор с текущим расписанием врача
+        initial = {}
+        doctor_id = request.GET.get('doctor', '')
+        if doctor_id.isdigit():
+            initial['doctors'] = [doctor_id]
+            for day, start, end in DocSchedule.objects.filter(doctor_id=doctor_id).values_list(
+                'day', 'start_time', 'end_time'
+            ):
+                initial[f'start_{day}'] = start
+                initial[f'end_{day}'] = end
+        form = ScheduleTemplateForm(initial=initial)
+
+    return render(request, 'polyclinic_app/schedule_edit.html', {
+        'form': form,
+        'conflicts': conflicts,
+    }, status=status)
+
+
+@require_POST
+@operator_required
+def schedule_api(request):
+    """Массовая установка недельного шаблона.
+
+    Тело запроса: {"doctor_ids": [1, 2], "days": {"1": {"start": "08:00",
+    "end": "14:00"}, "6": null}}; не указанные дни — выходные.
+    Ответ 409 со списком визитов, если они выпадают из новых часов
+    (truncated — в списке только первые CONFLICTS_LIMIT).
+    """
+    try:
+        data = json.loads(request.body)
+        doctor_ids = [int(doctor_id) for doctor_id in data['doctor_ids']]
+        template = clean_template(data.get('days') or {})
+        rows = set_weekly_schedule(doctor_ids, template)
+    except ScheduleConflict as e:
+        return JsonResponse({'error': str(e), 'conflicts': e.conflicts, 'truncated': e.truncated}, status=409)
+    except ValidationError as e:
+        errors = e.message_dict if hasattr(e, 'error_dict') else e.messages
+        return JsonResponse({'error': 'Расписание не прошло проверку', 'errors': errors}, status=400)
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Ожидается JSON с полями doctor_ids и days'}, status=400)
+
+    return JsonResponse({'doctors': len(set(doctor_ids)), 'shifts': rows})
+
+
+@operator_required
+def profile_list(request):
+    """Сохранённые профили запросов, самые долгие первыми"""
+    return render(request, 'polyclinic_app/profile_list.html', {
+        'profiles': list_profiles(),
+    })
+
+
+@operator_required
+def profile_detail(request, name):
+    """Отчёт профилировщика и хронология SQL одного запроса"""
+    profile = load_profile(name)
+    if profile is None:
+        raise Http404('Профиль не найден')
+    return render(request, 'polyclinic_app/profile_detail.html', {
+        'profile': profile,
+        'python_ms': round(profile['total_ms'] - profile['sql_ms'], 1),
+    })
+
+
+@operator_required
+def profile_download(request, name):
+    """Сырой профиль: .prof для pstats/snakeviz или HTML pyinstrument"""
+    path = profile_file(name)
+    if path is None:
+        raise Http404('Профиль не найден')
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=path.name)
+
+
 
 
 # =========================
@@ -380,54 +512,58 @@ def cancel_patient_appointments(request):
 # =========================
 
 def report_doctor_stats(request):
-    from django.db.models import Count, Q, Min, Max
-
-    doctors = Doctor.objects.select_related('spec').annotate(
-        total_visits=Count('visit'),
-        completed_visits=Count('visit', filter=Q(visit__status='completed')),
-        cancelled_visits=Count('visit', filter=Q(visit__status='cancelled')),
-        scheduled_visits=Count('visit', filter=Q(visit__status='scheduled')),
-        first_visit_date=Min('visit__visit_date'),
-        last_visit_date=Max('visit__visit_date'),
-    ).order_by('-total_visits')
-
-    rows = []
-    for d in doctors:
-        rows.append([
-            d.id,
-            f"{d.lname} {d.fname}",
-            d.spec.name if d.spec else "—",
-            d.total_visits,
-            d.completed_visits,
-            d.scheduled_visits,
-            d.cancelled_visits,
-            d.first_visit_date or "—",
-            d.last_visit_date or "—",
-        ])
-
+    # Отчёт читает сводку visit_daily_rollup, поэтому считается прямо в запросе
     return render(request, 'polyclinic_app/entity_list.html', {
         'title': 'Статистика врачей',
-        'columns': [
-            'ID',
-            'Врач',
-            'Специальность',
-            'Всего визитов',
-            'Завершено',
-            'Запланировано',
-            'Отменено',
-            'Первый визит',
-            'Последний визит',
-        ],
-        'entities': rows,
+        'columns': DOCTOR_STATS_COLUMNS,
+        'entities': doctor_stats_rows(),
         'entity_name': 'doctor_stats',
     })
 
 
 
-from django.db import connections
+def report_clinic_load(request):
+    today = timezone.localdate()
+    start = today - timedelta(days=CLINIC_LOAD_DEFAULT_DAYS)
+    end = today
+    try:
+        doctor_id = int(request.GET['doctor'])
+    except (KeyError, ValueError):
+        doctor_id = None
+
+    error = None
+    form = ClinicLoadForm(request.GET)
+    if form.is_valid():
+        start = form.cleaned_data['start'] or start
+        end = form.cleaned_data['end'] or end
+        if start > end:
+            error = 'Начало периода позже его конца.'
+        elif (end - start).days >= CLINIC_LOAD_MAX_DAYS:
+            error = f'Период не может быть длиннее {CLINIC_LOAD_MAX_DAYS} дней.'
+    else:
+        # Например, 2026-02-30: такой даты нет, а формат верный
+        error = 'Укажите существующие даты периода в формате ГГГГ-ММ-ДД.'
+
+    load = None
+    doctor_weeks = []
+    if error is None:
+        load = clinic_load(start, end, doctor_id)
+        doctor_weeks = load['doctor_weeks']
+
+    return render(request, 'polyclinic_app/report_clinic_load.html', {
+        'title': 'Загрузка клиники',
+        'start': start,
+        'end': end,
+        'error': error,
+        'load': load,
+        'doctor_weeks': doctor_weeks,
+    })
+
 
 def report_next_visits(request):
     visits = None
+    truncated = False
+    error = None
 
     # список врачей для выпадающего списка
     with connections['client'].cursor() as cursor:
@@ -435,25 +571,31 @@ def report_next_visits(request):
         doctors = cursor.fetchall()
 
     if request.method == 'POST':
-        doctor_id = request.POST.get('doctor_id')
-
-        with connections['client'].cursor() as cursor:
-            cursor.execute("""
-                SELECT v.visit_date, p.lname || ' ' || p.fname as full_name
-                FROM visits v
-                JOIN patients p ON p.id = v.patient_id
-                WHERE v.doctor_id = %s
-                  AND v.visit_date >= CURRENT_DATE
-                ORDER BY v.visit_date
-            """, [doctor_id])
-            visits = cursor.fetchall()
+        try:
+            doctor_id = int(request.POST.get('doctor_id', ''))
+        except ValueError:
+            error = 'Выберите врача из списка'
+        else:
+            with connections['client'].cursor() as cursor:
+                cursor.execute("""
+                    SELECT v.visit_date, p.lname || ' ' || p.fname as full_name
+                    FROM visits v
+                    JOIN patients p ON p.id = v.patient_id
+                    WHERE v.doctor_id = %s
+                      AND v.visit_date >= CURRENT_DATE
+                    ORDER BY v.visit_date, v.visit_time
+                    LIMIT %s
+                """, [doctor_id, NEXT_VISITS_LIMIT + 1])
+                visits, truncated = limited(cursor.fetchall(), NEXT_VISITS_LIMIT)
 
     return render(
         request,
         'polyclinic_app/report_next_visits_form.html',
         {
             'doctors': doctors,
-            'visits': visits
+            'visits': visits,
+            'truncated': truncated,
+            'error': error,
         }
     )
 
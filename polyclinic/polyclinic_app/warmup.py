@@ -0,0 +1,95 @@
+import logging
+import time
+from datetime import timedelta
+from importlib import import_module
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.http import HttpRequest
+from django.template.loader import get_template
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from . import analytics
+from .models import Diagnosis, Doctor, Spec
+from .views import CLINIC_LOAD_DEFAULT_DAYS
+
+
+logger = logging.getLogger(__name__)
+
+TEMPLATES_DIR = Path(__file__).resolve().parent / 'templates'
+
+# Страницы, которые отрисовываются при прогреве: первая отрисовка
+# подгружает форматы дат и чисел локали, фильтры и теги шаблонов
+WARMUP_PAGES = ['home', 'doctor_list']
+
+
+# Прогрев процесса перед первым запросом. Без него первый запрос после
+# запуска или перезапуска воркера импортирует представления, компилирует
+# шаблоны, открывает подключения к БД и считает отчёт о загрузке.
+#
+# run (только warm_code) выполняется при импорте wsgi.py и asgi.py и БД
+# не трогает: импорт приложения (manage.py, проверки, мастер gunicorn с
+# preload_app) не должен ходить в БД. warm_worker открывает подключения
+# и вызывается только в самом воркере — из post_fork в gunicorn.conf.py:
+# подключения нельзя делить между процессами.
+
+def warm_code():
+    """Импорт представлений, разбор URL и компиляция шаблонов приложения"""
+    # Построение обратного словаря URL обходит все include: импортирует
+    # модули URL и представлений, в том числе admin
+    reverse('home')
+
+    for path in sorted(TEMPLATES_DIR.rglob('*.html')):
+        get_template(path.relative_to(TEMPLATES_DIR).as_posix())
+
+
+def warm_connections():
+    """Открывает подключения всех БД и заполняет кэши справочников"""
+    for alias in connections:
+        connections[alias].ensure_connection()
+
+    # Справочники для выпадающих списков: первые чтения кладут их в
+    # буферы СУБД, а у драйвера заполняют кэш типов подключения
+    list(Spec.objects.values_list('id', 'name'))
+    list(Diagnosis.objects.values_list('id', 'name'))
+    list(Doctor.objects.using('client').values_list('id', 'lname', 'fname'))
+
+    # Отчёт о загрузке за период по умолчанию: его открывают чаще всего,
+    # а в кэше процесса (locmem) нового воркера его ещё нет
+    today = timezone.localdate()
+    analytics.clinic_load(today - timedelta(days=CLINIC_LOAD_DEFAULT_DAYS), today)
+
+    # Представление вызывается напрямую, без промежуточных слоёв и сессии в БД
+    session_store = import_module(settings.SESSION_ENGINE).SessionStore
+    for page in WARMUP_PAGES:
+        request = HttpRequest()
+        request.method = 'GET'
+        request.path = request.path_info = reverse(page)
+        request.session = session_store()
+        resolve(request.path).func(request)
+
+
+def run():
+    """Прогрев кода при загрузке приложения; к БД не обращается"""
+    if not settings.WARMUP_ENABLED:
+        return
+
+    started = time.perf_counter()
+    warm_code()
+    logger.info('Прогрев кода за %.0f мс', (time.perf_counter() - started) * 1000)
+
+
+def warm_worker():
+    """Прогрев подключений воркера; ошибки БД пишутся в журнал и не мешают запуску"""
+    if not settings.WARMUP_ENABLED:
+        return
+
+    started = time.perf_counter()
+    try:
+        warm_connections()
+    except DatabaseError:
+        logger.exception('Прогрев подключений к БД не удался')
+        return
+    logger.info('Прогрев подключений за %.0f мс', (time.perf_counter() - started) * 1000)